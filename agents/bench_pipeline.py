@@ -0,0 +1,438 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+# Replays the investigate -> strategize -> consult/execute flow (plus the
+# dashboard snapshot) through `root_agent` with a scripted model in place of
+# Gemini, against a throwaway backend started locally. No network access or
+# model spend; every run makes the same tool calls, so numbers are comparable
+# across changes to the agents, tools or backend.
+#
+#   python bench_pipeline.py                # full ADK pipeline, 3 runs
+#   python bench_pipeline.py --tools-only   # same tool calls without ADK: the floor
+#   python bench_pipeline.py --json out.json
+#
+# Per stage it reports wall latency, model calls, prompt size, tool round
+# trips, time in tools.py vs the backend, and bytes returned to the model.
+# Token figures are estimates at ~4 bytes per token.
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend_supply_api"
+BYTES_PER_TOKEN = 4
+TRANSFER = "transfer_to_agent"
+
+
+# --- Scenario ---
+
+class Call:
+    """A scripted tool call. Callable args are resolved against the run context."""
+
+    def __init__(self, tool: str, **args):
+        self.tool = tool
+        self.args = args
+
+    def resolve(self, ctx: dict) -> dict:
+        return {k: v(ctx) if callable(v) else v for k, v in self.args.items()}
+
+
+class Say:
+    """A scripted final answer."""
+
+    def __init__(self, text):
+        self.text = text
+
+    def resolve(self, ctx: dict) -> str:
+        return self.text(ctx) if callable(self.text) else self.text
+
+
+class Stage:
+    def __init__(self, name: str, message, entry: str, steps: Dict[str, list]):
+        self.name = name
+        self.message = message # User text; callable to use the context
+        self.entry = entry # Agent the root (or whoever is active) transfers to
+        self.steps = steps # Agent name -> its scripted calls, in order
+
+
+def _snapshot(ctx: dict) -> str:
+    # What snapshot_agent must produce: the SupplySnapshot schema (schema.py).
+    nodes = {n["id"]: n for n in ctx.get("nodes", [])}
+    def coords(loc):
+        return {"lat": loc.get("lat", 0), "lng": loc.get("lon", 0)}
+    return json.dumps({
+        "shipments": [{
+            "id": s["id"], "status": s["status"], "mode": s["transport_mode"], "origin_id": s["origin_id"],
+            "current_location": nodes.get(s["origin_id"], {}).get("name", s["origin_id"]),
+            "destination": nodes.get(s["destination_id"], {}).get("name", s["destination_id"]),
+            "coordinates": coords(s["current_location"]), "value": s["total_value_at_risk"],
+            "priority": s["priority"], "contents": [c["sku"] for c in s["contents"]],
+        } for s in ctx.get("shipments", [])],
+        "disruptions": [{
+            "id": d["id"], "type": d["type"], "location": d["description"], "severity": "High",
+            "description": d["description"], "radius_km": d["radius_km"], "coordinates": coords(d["location"]),
+        } for d in ctx.get("disruptions", [])],
+        "nodes": [{"id": n["id"], "name": n["name"], "type": n["type"], "coordinates": coords(n["location"])}
+                  for n in nodes.values()],
+        "timestamp": "2024-01-01T00:00:00Z",
+        "insights": f"{sum(s['status'] == 'Stuck' for s in ctx.get('shipments', []))} shipments are stuck.",
+    })
+
+
+SCENARIO = [
+    Stage("snapshot", "Get Initial Snapshot", "snapshot_agent", {
+        "snapshot_agent": [Call("get_all_shipments"), Call("get_disruption_context"), Call("get_network_nodes"),
+                           Call("get_products"), Say(_snapshot)],
+    }),
+    Stage("investigate", "Are there any stuck shipments?", "investigative_agent", {
+        "investigative_agent": [
+            Call("get_stuck_shipments"), Call("get_products"),
+            Call("get_value_at_risk", dimension="destination", status="Stuck"),
+            Say(lambda ctx: f"Found {len(ctx['stuck'])} stuck shipments; {ctx['shipment_id']} carries the most value.\n"
+                            f'[VIEW: {{"target_id": "{ctx["shipment_id"]}"}}]'),
+        ],
+    }),
+    Stage("strategize", lambda ctx: f"What should we do about {ctx['shipment_id']}?", "strategize_agent", {
+        "strategize_agent": [
+            Call("get_disruption_context"), Call("get_action_quotes", shipment_id=lambda ctx: ctx["shipment_id"]),
+            Say(lambda ctx: f"I recommend {ctx['route_id']}. Do you want to proceed?\n"
+                            f'[VIEW: {{"target_id": "{ctx["shipment_id"]}"}}]'),
+        ],
+    }),
+    Stage("consult_execute", "Yes, approve", "consult_and_execute_agent", {
+        "consult_agent": [Say("APPROVED")],
+        "execute_agent": [
+            Call("apply_reroute", shipment_id=lambda ctx: ctx["shipment_id"], new_route_id=lambda ctx: ctx["route_id"]),
+            Say(lambda ctx: f"Done: {ctx['reroute'].get('message', ctx['reroute'])}"),
+        ],
+    }),
+]
+
+# What each tool result contributes to later steps.
+CAPTURE: Dict[str, Callable[[dict, Any], None]] = {
+    "get_all_shipments": lambda ctx, r: ctx.update(shipments=r),
+    "get_disruption_context": lambda ctx, r: ctx.update(disruptions=r),
+    "get_network_nodes": lambda ctx, r: ctx.update(nodes=r),
+    "get_stuck_shipments": lambda ctx, r: ctx.update(
+        stuck=r, shipment_id=max(r, key=lambda s: s["total_value_at_risk"])["id"]),
+    "get_action_quotes": lambda ctx, r: ctx.update(route_id=r["recommended_option_id"] or r["options"][0]["id"]),
+    "apply_reroute": lambda ctx, r: ctx.update(reroute=r),
+}
+
+
+# --- Metrics ---
+
+class StageMetrics:
+    def __init__(self):
+        self.latency_s = 0.0
+        self.llm_calls: Dict[str, int] = defaultdict(int)
+        self.prompt_bytes = 0
+        self.tool_calls: Dict[str, int] = defaultdict(int)
+        self.tool_s = 0.0
+        self.backend_s = 0.0
+        self.http_calls = 0
+        self.payload_bytes = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "latency_ms": round(self.latency_s * 1000, 2),
+            "llm_calls": dict(self.llm_calls),
+            "prompt_tokens_est": self.prompt_bytes // BYTES_PER_TOKEN,
+            "tool_calls": dict(self.tool_calls),
+            "tool_ms": round(self.tool_s * 1000, 2),
+            "backend_ms": round(self.backend_s * 1000, 2),
+            "tools_py_ms": round((self.tool_s - self.backend_s) * 1000, 2),
+            "framework_ms": round((self.latency_s - self.tool_s) * 1000, 2),
+            "http_calls": self.http_calls,
+            "payload_bytes": self.payload_bytes,
+            "payload_tokens_est": self.payload_bytes // BYTES_PER_TOKEN,
+        }
+
+
+class Harness:
+    def __init__(self):
+        self.ctx: dict = {}
+        self.stage: Optional[Stage] = None
+        self.metrics: Dict[str, StageMetrics] = {}
+        self._queues: Dict[str, list] = {}
+
+    @property
+    def current(self) -> StageMetrics:
+        return self.metrics[self.stage.name]
+
+    def begin(self, stage: Stage):
+        self.stage = stage
+        self.metrics[stage.name] = StageMetrics()
+        self._queues = {agent: list(steps) for agent, steps in stage.steps.items()}
+
+    def next_step(self, agent: str):
+        """The scripted model's next move for `agent` in the current stage.
+
+        Agents the stage does not script hand over to the stage's entry agent,
+        whichever agent the runner picked to receive the message.
+        """
+        queue = self._queues.get(agent)
+        if queue is None:
+            return Call(TRANSFER, agent_name=self.stage.entry)
+        if not queue:
+            return Say("(script exhausted)")
+        return queue.pop(0)
+
+    # --- Instrumentation ---
+
+    def timed_tool(self, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = fn(*args, **kwargs)
+            m = self.current
+            m.tool_s += time.perf_counter() - started
+            m.tool_calls[fn.__name__] += 1
+            m.payload_bytes += len(json.dumps(result, default=str))
+            if fn.__name__ in CAPTURE and not (isinstance(result, dict) and "error" in result):
+                CAPTURE[fn.__name__](self.ctx, result)
+            return result
+        return wrapper
+
+    def timed_http(self, client):
+        """Wraps the transport's HTTP client; retries and hedges count as separate calls."""
+        harness = self
+        client = getattr(client, "unwrapped", client) # Not the previous run's wrapper
+
+        class TimedClient:
+            unwrapped = client
+
+            def __getattr__(self, name):
+                return getattr(client, name)
+
+            def request(self, *args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return client.request(*args, **kwargs)
+                finally:
+                    harness.current.backend_s += time.perf_counter() - started
+                    harness.current.http_calls += 1
+
+        return TimedClient()
+
+
+def _message(stage: Stage, ctx: dict) -> str:
+    return stage.message(ctx) if callable(stage.message) else stage.message
+
+
+# --- ADK mode ---
+
+def _request_bytes(llm_request) -> int:
+    """Size of everything the model would be sent: instruction, history, tool schemas."""
+    size = 0
+    config = getattr(llm_request, "config", None)
+    instruction = getattr(config, "system_instruction", None)
+    if instruction is not None:
+        size += len(instruction if isinstance(instruction, str) else str(instruction))
+    for tool in getattr(config, "tools", None) or []:
+        size += len(str(tool))
+    for content in llm_request.contents or []:
+        for part in content.parts or []:
+            if part.text:
+                size += len(part.text)
+            if part.function_call:
+                size += len(json.dumps(part.function_call.args or {}, default=str))
+            if part.function_response:
+                size += len(json.dumps(part.function_response.response or {}, default=str))
+    return size
+
+
+def _scripted_model(harness: Harness, agent_name: str):
+    from google.adk.models.base_llm import BaseLlm
+    from google.adk.models.llm_response import LlmResponse
+    from google.genai import types
+
+    class ScriptedLlm(BaseLlm):
+        """Deterministic stand-in for Gemini: plays back the harness script."""
+
+        async def generate_content_async(self, llm_request, stream: bool = False):
+            m = harness.current
+            m.llm_calls[agent_name] += 1
+            m.prompt_bytes += _request_bytes(llm_request)
+            step = harness.next_step(agent_name)
+            if isinstance(step, Call):
+                part = types.Part(function_call=types.FunctionCall(name=step.tool, args=step.resolve(harness.ctx)))
+            else:
+                part = types.Part(text=step.resolve(harness.ctx))
+            yield LlmResponse(content=types.Content(role="model", parts=[part]))
+
+    return ScriptedLlm(model=f"scripted:{agent_name}")
+
+
+_original_tools: Dict[str, list] = {}
+
+
+def _instrument(harness: Harness, agent):
+    """Swaps every LlmAgent's model for the script and times its tools, recursively."""
+    if hasattr(agent, "model"):
+        agent.model = _scripted_model(harness, agent.name)
+    if getattr(agent, "tools", None):
+        original = _original_tools.setdefault(agent.name, list(agent.tools))
+        agent.tools = [harness.timed_tool(t) if callable(t) else t for t in original]
+    for sub in getattr(agent, "sub_agents", None) or []:
+        _instrument(harness, sub)
+
+
+async def run_adk(harness: Harness, tools):
+    from google.adk.runners import InMemoryRunner
+    from google.genai import types
+    from supply_agent import fast_path
+    from supply_agent.agent import root_agent
+
+    tools.transport.client = harness.timed_http(tools.transport.client)
+    fast_path.install(root_agent, None) # Measure the model pipeline; the fast path would answer some stages
+    _instrument(harness, root_agent)
+    runner = InMemoryRunner(agent=root_agent, app_name="bench")
+    session = await runner.session_service.create_session(app_name="bench", user_id="bench")
+    for stage in SCENARIO:
+        harness.begin(stage)
+        message = types.Content(role="user", parts=[types.Part(text=_message(stage, harness.ctx))])
+        started = time.perf_counter()
+        async for _ in runner.run_async(user_id="bench", session_id=session.id, new_message=message):
+            pass
+        harness.current.latency_s = time.perf_counter() - started
+
+
+# --- Tools-only mode ---
+
+def run_tools_only(harness: Harness, tools):
+    """Makes the scenario's tool calls directly: the latency floor without ADK or a model."""
+    tools.transport.client = harness.timed_http(tools.transport.client)
+    for stage in SCENARIO:
+        harness.begin(stage)
+        _message(stage, harness.ctx) # Fails early if the context is missing something
+        started = time.perf_counter()
+        for steps in stage.steps.values():
+            for step in steps:
+                if isinstance(step, Call):
+                    harness.timed_tool(getattr(tools, step.tool))(**step.resolve(harness.ctx))
+                else:
+                    step.resolve(harness.ctx)
+        harness.current.latency_s = time.perf_counter() - started
+
+
+def load_tools():
+    """supply_agent.tools; the package builds its agents (and imports ADK) only on demand."""
+    from supply_agent import tools
+    return tools
+
+
+# --- Backend ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_backend():
+    """A fresh backend on a throwaway copy of the seed data."""
+    port = _free_port()
+    env = dict(os.environ, SQLITE_FILE=os.path.join(tempfile.mkdtemp(), "bench.db"))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if httpx.get(url + "/shipments", params={"status": "Stuck"}).status_code == 200:
+                return proc, url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("Backend did not start")
+
+
+# --- Report ---
+
+def summarize(runs: List[Dict[str, StageMetrics]]) -> dict:
+    """Median of every numeric field per stage, plus the totals."""
+    stages = {}
+    for name in runs[0]:
+        samples = [run[name].as_dict() for run in runs]
+        merged = {}
+        for key, value in samples[0].items():
+            if isinstance(value, dict):
+                merged[key] = value # Counts are identical across runs: the script is deterministic
+            else:
+                merged[key] = statistics.median(s[key] for s in samples)
+        stages[name] = merged
+    totals = {key: sum(s[key] for s in stages.values()) for key, v in next(iter(stages.values())).items()
+              if not isinstance(v, dict)}
+    totals["llm_calls"] = sum(sum(s["llm_calls"].values()) for s in stages.values())
+    totals["tool_calls"] = sum(sum(s["tool_calls"].values()) for s in stages.values())
+    return {"runs": len(runs), "stages": stages, "total": totals}
+
+
+def print_report(report: dict, mode: str):
+    print(f"\n--- {mode}: median of {report['runs']} run(s) ---")
+    header = f"{'stage':<16}{'latency':>10}{'llm':>5}{'prompt tok':>12}{'tools':>7}{'tools.py':>10}{'backend':>10}{'payload tok':>13}"
+    print(header)
+    rows = list(report["stages"].items()) + [("TOTAL", report["total"])]
+    for name, s in rows:
+        llm = s["llm_calls"] if isinstance(s["llm_calls"], (int, float)) else sum(s["llm_calls"].values())
+        tools = s["tool_calls"] if isinstance(s["tool_calls"], (int, float)) else sum(s["tool_calls"].values())
+        print(f"{name:<16}{s['latency_ms']:>8.1f}ms{llm:>5.0f}{s['prompt_tokens_est']:>12,.0f}{tools:>7.0f}"
+              f"{s['tools_py_ms']:>8.1f}ms{s['backend_ms']:>8.1f}ms{s['payload_tokens_est']:>13,.0f}")
+    for name, s in report["stages"].items():
+        calls = ", ".join(f"{t} x{n}" for t, n in s["tool_calls"].items())
+        print(f"  {name}: {calls or 'no tools'}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the agent pipeline.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--tools-only", action="store_true", help="Skip ADK; call the scripted tools directly")
+    parser.add_argument("--json", type=Path, help="Write the report here")
+    args = parser.parse_args(argv)
+
+    if not args.tools_only:
+        try:
+            import google.adk # noqa: F401
+        except ImportError:
+            print("Skipped: the ADK pipeline mode needs google-adk, which is not installed (uv sync). "
+                  "Use --tools-only to measure the tools and backend alone.")
+            return 0
+
+    tools = load_tools()
+    runs = []
+    for _ in range(args.runs):
+        proc, url = start_backend()
+        try:
+            tools.BACKEND_URL = url # Fresh backend per run: the reroute changes its data
+            harness = Harness()
+            if args.tools_only:
+                run_tools_only(harness, tools)
+            else:
+                asyncio.run(run_adk(harness, tools))
+            runs.append(harness.metrics)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    report = summarize(runs)
+    print_report(report, "tools only" if args.tools_only else "ADK pipeline, scripted model")
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
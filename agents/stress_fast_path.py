@@ -0,0 +1,97 @@
+import sys
+from types import SimpleNamespace
+
+# Drives the fast path through its ADK before_agent_callback, turn by turn,
+# with the reroute tools replaced by recorders: an approval executes a reroute
+# only right after the fast path itself showed the quotes, and only for the
+# option it proposed. No backend, model or network access needed.
+#
+#   python stress_fast_path.py
+
+try:
+    from google.genai import types
+except ImportError:
+    print("google-genai is not installed (uv sync); skipped. The callback builds its reply with it.")
+    sys.exit(0)
+
+from supply_agent import fast_path, tools
+
+QUOTE = {"shipment_id": "SH-1001", "recommended_option_id": "OPT-SEA-REROUTE", "options": [
+    {"id": "OPT-SEA-REROUTE", "type": "Sea", "cost_usd": 1200, "transit_time_hours": 240, "co2_kg": 900, "rank": 1},
+    {"id": "OPT-REPLACEMENT-AIR", "type": "Air", "cost_usd": 9000, "transit_time_hours": 30, "co2_kg": 4000, "rank": 2},
+]}
+NODES = [{"id": "PORT-LAX", "name": "Los Angeles Port"}]
+
+
+def check(condition, message):
+    if condition:
+        print(f"✅ {message}")
+    else:
+        print(f"❌ {message}")
+        sys.exit(1)
+
+
+class Session:
+    """One conversation: each say() is a new invocation, seen by every agent in the transfer."""
+
+    def __init__(self):
+        self.state = {}
+        self.turns = 0
+
+    def say(self, text: str, agents: int = 2):
+        """The fast path's reply (None: the LLM answers), and every agent's callback result."""
+        self.turns += 1
+        context = SimpleNamespace(state=self.state, invocation_id=f"inv-{self.turns}",
+                                  user_content=types.Content(role="user", parts=[types.Part(text=text)]))
+        replies = [fast_path.before_agent(context)]
+        if replies[0] is None: # The root transfers; the sub-agents' callbacks run too
+            replies += [fast_path.before_agent(context) for _ in range(agents - 1)]
+        return replies[0].parts[0].text if replies[0] is not None else None, replies
+
+
+def main():
+    reroutes = []
+    tools.get_action_quotes = lambda shipment_id: {**QUOTE, "shipment_id": shipment_id}
+    tools.get_network_nodes = lambda: NODES
+    tools.apply_reroute = lambda shipment_id, new_route_id: (
+        reroutes.append((shipment_id, new_route_id)) or {"status": "success", "message": "Rerouted"})
+
+    print("--- approvals without quotes go to the LLM ---")
+    for text in ("yes", "approve", "approve OPT-SEA-REROUTE for SH-1001", "reroute SH-1001 via OPT-REPLACEMENT-AIR"):
+        reply, replies = Session().say(text)
+        check(reply is None and all(r is None for r in replies) and not reroutes, f"{text!r}: declined, nothing applied")
+
+    session = Session()
+    session.say("yes")
+    check(session.state.get(fast_path._DECLINED) == "inv-1", "A declined turn is not routed again by the agents it transfers to")
+
+    print("\n--- approvals right after the quotes ---")
+    session = Session()
+    reply, replies = session.say("show quotes for SH-1001")
+    check(reply and "OPT-SEA-REROUTE" in reply and session.state[fast_path.PENDING] == {
+        "shipment_id": "SH-1001", "route_id": "OPT-SEA-REROUTE"}, "Quotes answered, recommended option pending")
+    reply, _ = session.say("yes")
+    check(reply and reroutes == [("SH-1001", "OPT-SEA-REROUTE")], "'yes' executes the option just proposed")
+    reply, _ = session.say("yes")
+    check(reply is None and len(reroutes) == 1, "A second 'yes' executes nothing")
+
+    session.say("show quotes for SH-1001")
+    reply, _ = session.say("approve OPT-SEA-REROUTE for SH-1001")
+    check(reply and len(reroutes) == 2, "Naming the proposed option and shipment executes it")
+
+    session.say("show quotes for SH-1001")
+    reply, _ = session.say("approve OPT-REPLACEMENT-AIR for SH-1001")
+    check(reply is None and len(reroutes) == 2, "Naming another option goes to the LLM")
+    reply, _ = session.say("yes")
+    check(reply is None and len(reroutes) == 2, "...and drops the proposal")
+
+    session.say("show quotes for SH-1001")
+    reply, _ = session.say("focus on PORT-LAX")
+    check(reply and "PORT-LAX" in reply, "Another structured turn is answered")
+    reply, _ = session.say("yes")
+    check(reply is None and len(reroutes) == 2, "...but an approval after it no longer applies the quotes")
+    print("\n🎉 FAST PATH CHECKS PASSED")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import json
+import sys
+
+import httpx
+
+# Checks the apply_reroute tool against a fresh local backend (started from
+# ../backend_supply_api, as bench_pipeline.py does): a repeated call does not
+# clone a second rescue shipment, and a later, legitimate reroute of the same
+# shipment on the same route is applied rather than replayed.
+#
+#   python stress_reroute_tool.py
+
+from bench_pipeline import start_backend
+from supply_agent import tools
+
+
+def check(condition, message):
+    if condition:
+        print(f"✅ {message}")
+    else:
+        print(f"❌ {message}")
+        sys.exit(1)
+
+
+def main():
+    proc, url = start_backend()
+    try:
+        tools.BACKEND_URL = url
+        print("--- repeated approval ---")
+        first = tools.apply_reroute("SH-1002", "OPT-REPLACEMENT-AIR")
+        check(first.get("new_shipment_id"), f"Reroute cloned {first.get('new_shipment_id')}")
+        again = tools.apply_reroute("SH-1002", "OPT-REPLACEMENT-AIR")
+        clones = [s for s in httpx.get(f"{url}/shipments").json() if s["id"].startswith("SH-1002-")]
+        check("error" in again and "409" in again["error"] and len(clones) == 1,
+              f"Calling it again clones nothing: {again.get('error', again)[:80]}")
+
+        print("\n--- same shipment, same route, later ---")
+        result = tools.apply_reroute("SH-1001", "OPT-SEA-REROUTE")
+        before = tools.get_shipment("SH-1001")
+        check(result.get("status") == "success" and before["status"] == "In-Transit", "Detour applied: In-Transit")
+        # It gets stuck again; the same detour is approved once more.
+        httpx.post(f"{url}/import/shipments", content=json.dumps({**before, "status": "Stuck"}),
+                   headers={"Content-Type": "application/x-ndjson"}).raise_for_status()
+        stuck = tools.get_shipment("SH-1001")
+        check(stuck["status"] == "Stuck", f"Stuck again at version {stuck['version']}")
+        result = tools.apply_reroute("SH-1001", "OPT-SEA-REROUTE")
+        after = tools.get_shipment("SH-1001")
+        check(result.get("status") == "success" and after["status"] == "In-Transit" and after["version"] > stuck["version"],
+              f"Second detour applied, not replayed (version {stuck['version']} -> {after['version']})")
+    finally:
+        proc.terminate()
+        proc.wait()
+    print("\n🎉 REROUTE TOOL CHECKS PASSED")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Checks the tool transport against a local stand-in backend that injects
+# faults on request: slow responses, 5xx, 429 with Retry-After and dropped
+# connections. No real backend, ADK or network access needed.
+#
+#   python stress_transport.py
+
+from supply_agent import tools, transport
+
+BODIES = {
+    "/shipments": [{"id": "SH-1001", "status": "Stuck"}],
+    "/shipments/SH-1001": {"id": "SH-1001", "status": "Stuck", "version": 3},
+    "/network/nodes": [{"id": "PORT-LAX", "name": "Los Angeles Port"}],
+    "/network/disruptions": [{"id": "DIS-001", "type": "Weather"}],
+    "/products": [{"sku": "ELEC-GAME-001"}],
+    "/actions/quotes/SH-1001": {"shipment_id": "SH-1001", "options": [{"id": "OPT-SEA-REROUTE"}]},
+    "/actions/reroute": {"status": "success", "message": "Rerouted", "new_shipment_id": "SH-1001-R"},
+}
+
+
+class FaultyBackend(ThreadingHTTPServer):
+    """Serves canned bodies; `faults[path]` is a queue of faults for the next requests."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.faults = defaultdict(list)
+        self.hits = defaultdict(list) # path -> request headers, in arrival order
+        self.lock = threading.Lock()
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+
+    def inject(self, path, *faults):
+        with self.lock:
+            self.faults[path].extend(faults)
+
+    def reset(self):
+        with self.lock:
+            self.faults.clear()
+            self.hits.clear()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _serve(self):
+        path = self.path.split("?")[0]
+        if length := int(self.headers.get("Content-Length") or 0):
+            self.rfile.read(length)
+        with self.server.lock:
+            self.server.hits[path].append(dict(self.headers))
+            fault = self.server.faults[path].pop(0) if self.server.faults[path] else None
+        if fault == "drop":
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        if isinstance(fault, float):
+            time.sleep(fault)
+            fault = None
+        status, headers = (fault[0], fault[1]) if isinstance(fault, tuple) else (fault or 200, {})
+        body = BODIES.get(path) if status == 200 else {"detail": "injected"}
+        if body is None:
+            status, body = 404, {"detail": "Not found"}
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            for name, value in {"Content-Type": "application/json", "Content-Length": len(payload), **headers}.items():
+                self.send_header(name, str(value))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError): # Client gave up (timeout or a hedge won)
+            pass
+
+    do_GET = _serve
+    do_POST = _serve
+
+
+def check(condition, message):
+    if condition:
+        print(f"✅ {message}")
+    else:
+        print(f"❌ {message}")
+        sys.exit(1)
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    backend = FaultyBackend()
+    threading.Thread(target=backend.serve_forever, daemon=True).start()
+    tools.BACKEND_URL = backend.url
+    transport.BACKOFF_BASE_S = 0.02
+    transport.BREAKER_OPEN_S = 1.0
+    policies = dict(transport.ENDPOINTS)
+    transport.ENDPOINTS.update(
+        nodes=transport.Policy(deadline_s=1.0, attempt_s=0.4),
+        quotes=transport.Policy(deadline_s=3.0, attempt_s=2.0, hedge_after_s=0.15),
+    )
+
+    def fresh():
+        backend.reset()
+        transport.reset()
+
+    print("--- deadlines ---")
+    fresh()
+    backend.inject("/network/nodes", 3.0, 3.0, 3.0)
+    result, elapsed = timed(tools.get_network_nodes)
+    check("error" in result and result["retryable"], f"Slow endpoint returns a retryable error: {result['error']}")
+    check(elapsed < 1.2, f"...within its deadline ({elapsed:.2f}s of 1.0s)")
+
+    print("\n--- retries ---")
+    fresh()
+    backend.inject("/shipments", 503, "drop")
+    result, _ = timed(tools.get_all_shipments)
+    check(result == BODIES["/shipments"], "503 then a dropped connection, then success")
+    check(transport.stats()["shipments"]["retries"] == 2, "...after 2 retries")
+
+    fresh()
+    backend.inject("/products", (429, {"Retry-After": "0.3"}))
+    result, elapsed = timed(tools.get_products)
+    check(result == BODIES["/products"] and elapsed >= 0.3, f"429 waits for Retry-After ({elapsed:.2f}s)")
+
+    fresh()
+    result = tools.get_action_quotes("SH-404")
+    check("404" in result["error"] and len(backend.hits["/actions/quotes/SH-404"]) == 1, "404 is not retried")
+
+    fresh()
+    backend.inject("/actions/reroute", 503)
+    result = tools.apply_reroute("SH-1001", "OPT-SEA-REROUTE")
+    keys = {h.get("Idempotency-Key") for h in backend.hits["/actions/reroute"]}
+    check(result == BODIES["/actions/reroute"] and len(backend.hits["/actions/reroute"]) == 2 and len(keys) == 1,
+          "Reroute POST retried once with the same Idempotency-Key")
+
+    fresh()
+    backend.inject("/actions/reroute", 503)
+    try:
+        transport.post("reroute", backend.url + "/actions/reroute", json={})
+        check(False, "POST without a key is not retried")
+    except transport.TransportError as e:
+        check(len(backend.hits["/actions/reroute"]) == 1 and not e.retryable, "POST without a key is not retried")
+
+    print("\n--- hedging ---")
+    fresh()
+    backend.inject("/actions/quotes/SH-1001", 1.5)
+    result, elapsed = timed(tools.get_action_quotes, "SH-1001")
+    stats = transport.stats()["quotes"]
+    check(result == BODIES["/actions/quotes/SH-1001"] and elapsed < 0.6,
+          f"Slow quote answered by the hedge in {elapsed:.2f}s instead of 1.5s")
+    check(stats.get("hedges") == 1 and stats.get("hedge_wins") == 1, f"...one hedge sent, and it won: {stats}")
+
+    fresh()
+    timed(tools.get_action_quotes, "SH-1001")
+    check(len(backend.hits["/actions/quotes/SH-1001"]) == 1, "Fast quote sends no hedge")
+
+    fresh()
+    backend.inject("/actions/quotes/SH-1001", 0.25, 0.25)
+    tools.get_action_quotes("SH-1001") # Hedged, but both copies are slow
+    backend.reset()
+    backend.inject("/actions/quotes/SH-1001", 0.25)
+    result, elapsed = timed(tools.get_action_quotes, "SH-1001")
+    check(result == BODIES["/actions/quotes/SH-1001"] and len(backend.hits["/actions/quotes/SH-1001"]) == 1,
+          f"No hedge while the recent p95 is above the hedge delay ({elapsed:.2f}s, {transport.stats()['quotes']})")
+
+    fresh()
+    backend.inject("/actions/quotes/SH-1001", 503, 0.5)
+    result, elapsed = timed(tools.get_action_quotes, "SH-1001")
+    check(result == BODIES["/actions/quotes/SH-1001"] and len(backend.hits["/actions/quotes/SH-1001"]) == 2
+          and elapsed >= 0.5, f"No hedge after a 503: the retry waits for its own answer ({elapsed:.2f}s)")
+
+    fresh()
+    transport.ENDPOINTS["quotes"] = transport.Policy(deadline_s=0.5, attempt_s=0.1, retries=0, hedge_after_s=0.15)
+    backend.inject("/actions/quotes/SH-1001", 0.3)
+    result, elapsed = timed(tools.get_action_quotes, "SH-1001")
+    check("error" in result and len(backend.hits["/actions/quotes/SH-1001"]) == 1 and elapsed < 0.2,
+          f"No hedge once the attempt's time is used up: times out alone ({elapsed:.2f}s)")
+    transport.ENDPOINTS["quotes"] = transport.Policy(deadline_s=3.0, attempt_s=2.0, hedge_after_s=0.15)
+
+    print("\n--- circuit breaker ---")
+    fresh()
+    backend.inject("/network/disruptions", *[500] * 9)
+    for _ in range(transport.BREAKER_FAILURES):
+        tools.get_disruption_context()
+    hits = len(backend.hits["/network/disruptions"])
+    result, elapsed = timed(tools.get_disruption_context)
+    check(result.get("circuit_open") and result.get("retry_after_s") is not None,
+          f"Open after {transport.BREAKER_FAILURES} failed calls: {result['error']}")
+    check(len(backend.hits["/network/disruptions"]) == hits and elapsed < 0.01, f"...fails fast without a request ({elapsed * 1000:.1f}ms)")
+    check("circuit_open" not in tools.get_network_nodes(), "...other endpoints unaffected")
+
+    backend.reset()
+    time.sleep(transport.BREAKER_OPEN_S)
+    check(transport.stats()["disruptions"]["circuit"] == "half_open", "Half-open after the cool-down")
+    result = tools.get_disruption_context()
+    check(result == BODIES["/network/disruptions"] and transport.stats()["disruptions"]["circuit"] == "closed",
+          "Successful probe closes the circuit")
+
+    backend.inject("/network/disruptions", *[500] * 12)
+    for _ in range(transport.BREAKER_FAILURES):
+        tools.get_disruption_context()
+    time.sleep(transport.BREAKER_OPEN_S)
+    tools.get_disruption_context()
+    check(transport.stats()["disruptions"]["circuit"] == "open", "Failed probe reopens it")
+
+    print("\n--- backend down ---")
+    fresh()
+    backend.shutdown()
+    backend.server_close()
+    result, elapsed = timed(tools.get_stuck_shipments)
+    check("error" in result and result["retryable"], f"Connection refused is a retryable error ({elapsed:.2f}s)")
+
+    transport.ENDPOINTS.clear()
+    transport.ENDPOINTS.update(policies)
+    print("\n🎉 TRANSPORT CHECKS PASSED")
+
+
+if __name__ == "__main__":
+    main()
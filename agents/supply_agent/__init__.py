@@ -1,2 +1,12 @@
+import importlib
 
-from . import agent
+# The agents, and with them google-adk, are built on first access (the ADK
+# server reads `supply_agent.agent.root_agent`), not on import. The tools, the
+# transport and the fast path therefore import without ADK.
+
+
+def __getattr__(name):
+    if name in ("agent", "root_agent"):
+        agent = importlib.import_module(".agent", __name__)
+        return agent if name == "agent" else agent.root_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,6 +1,7 @@
 
 import logging
 from google.adk.agents import Agent
+from . import fast_path
 from .sub_agents import (
     investigative_agent,
     strategize_agent,
@@ -35,6 +36,10 @@ root_agent = Agent(
     - To focus on a general location (e.g., "California"), output coordinates: `[VIEW: {"lat": 36.77, "lng": -119.41, "zoom": 6}]` (use your knowledge to approximate lat/lng/zoom).
     - Example: "Here is the shipment details. [VIEW: {"target_id": "SHIP-101"}]"
 
+    **SPECIAL CASE: BACKEND ERRORS**
+    - A tool result with `"circuit_open": true` means the backend is down. Do NOT call tools again this turn; tell the user and suggest trying again in `retry_after_s` seconds.
+    - A result with `"retryable": false` must not be retried (e.g. a reroute that may have been applied).
+
     **NORMAL CONVERSATION:**
     1. **Investigate**: You have NO internal knowledge of shipments. You MUST call the `investigative_agent` to find stuck shipments.
        - NEVER make up shipment IDs (like XYZ-123).
@@ -56,3 +61,6 @@ root_agent = Agent(
         snapshot_agent
     ]
 )
+
+# Structured requests (snapshot, quotes, approve, map focus) skip the models.
+fast_path.install(root_agent)
@@ -0,0 +1,219 @@
+import json
+import logging
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, Optional, Tuple
+from . import tools
+from .schema import Coordinate, Disruption, Node, Shipment, SupplySnapshot
+
+# --- Deterministic Fast Path ---
+# Fully structured requests ("Get Initial Snapshot", "show quotes for SH-1001",
+# "approve", "focus on PORT-LAX") are answered by calling the tools directly,
+# in milliseconds and without a model call. Anything else returns None and
+# goes to the LLM pipeline unchanged. Replies use the same conventions as the
+# agents: Markdown text, `[VIEW: {...}]` on its own last line, and the
+# SupplySnapshot JSON for the dashboard.
+
+logger = logging.getLogger(__name__)
+
+# Session state: the option the fast path proposed in the previous turn. Only
+# an approval in the very next turn, bare or naming that same shipment and
+# route, executes it; every other turn clears it. Approvals of anything else go
+# to the LLM pipeline, so the fast path never applies a plan the user did not
+# just see.
+PENDING = "fast_path:pending"
+# Invocation already routed to the LLM; agents further down the transfer skip the check.
+_DECLINED = "temp:fast_path_declined"
+
+stats: Counter = Counter() # Intent -> turns answered; "llm" counts fallbacks
+
+_ID = r"[A-Za-z]{2,}(?:-[A-Za-z0-9]+)+"
+_END = r"\s*[?.!]*\s*$"
+
+_SNAPSHOT = re.compile(r"^\s*get (?:initial snapshot|dashboard data)" + _END, re.I)
+_STUCK = re.compile(r"^\s*(?:show|list|get|find|are there(?: any)?)\s+(?:me\s+)?(?:all\s+|the\s+|any\s+)?stuck shipments" + _END, re.I)
+_QUOTES = re.compile(r"^\s*(?:show|get|list)?\s*(?:me\s+)?(?:the\s+)?(?:quotes?|options|reroute options)\s+(?:for|on)\s+(?P<id>" + _ID + ")" + _END, re.I)
+_FOCUS = re.compile(r"^\s*(?:show|focus(?: on)?|zoom(?: in)?(?: to| on)?|center(?: on)?|locate|where is)\s+(?P<id>" + _ID + r")(?:\s+on the map)?" + _END, re.I)
+_APPROVE = re.compile(r"^\s*(?:yes|yep|approve[d]?|go ahead|proceed|confirm(?:ed)?|do it)(?:,?\s*please)?" + _END, re.I)
+_EXECUTE = [
+    re.compile(r"^\s*(?:approve|execute|apply)\s+(?P<route>OPT-[A-Za-z0-9-]+)\s+(?:for|on)\s+(?P<id>" + _ID + ")" + _END, re.I),
+    re.compile(r"^\s*reroute\s+(?P<id>" + _ID + r")\s+(?:via|with|using)\s+(?P<route>OPT-[A-Za-z0-9-]+)" + _END, re.I),
+]
+
+
+class _Fallback(Exception):
+    """A tool failed or the target is unknown: let the LLM handle the turn."""
+
+
+def _ok(result):
+    if isinstance(result, dict) and "error" in result:
+        raise _Fallback(result["error"])
+    return result
+
+
+def _view(**target) -> str:
+    return f"[VIEW: {json.dumps(target)}]"
+
+
+# --- Intents ---
+
+def snapshot(state: dict) -> str:
+    shipments = _ok(tools.get_all_shipments())
+    disruptions = _ok(tools.get_disruption_context())
+    nodes = _ok(tools.get_network_nodes())
+    names = {n["id"]: n["name"] for n in nodes}
+
+    def coords(loc: dict) -> Coordinate:
+        return Coordinate(lat=loc.get("lat", 0), lng=loc.get("lon", 0))
+
+    stuck = [s for s in shipments if s["status"] == "Stuck"]
+    return SupplySnapshot(
+        shipments=[Shipment(
+            id=s["id"], status=s["status"], mode=s["transport_mode"], origin_id=s["origin_id"],
+            current_location=f"{s['current_location'].get('lat', 0):.2f}, {s['current_location'].get('lon', 0):.2f}",
+            destination=names.get(s["destination_id"], s["destination_id"]), coordinates=coords(s["current_location"]),
+            value=s["total_value_at_risk"], priority=s["priority"], contents=[c["sku"] for c in s["contents"]],
+        ) for s in shipments],
+        disruptions=[Disruption(
+            id=d["id"], type=d["type"], location=d["description"], severity=_severity(d["radius_km"]),
+            description=d["description"], radius_km=d["radius_km"], coordinates=coords(d["location"]),
+        ) for d in disruptions],
+        nodes=[Node(id=n["id"], name=n["name"], type=n["type"], coordinates=coords(n["location"])) for n in nodes],
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        insights=(f"{len(stuck)} stuck shipments with ${sum(s['total_value_at_risk'] for s in stuck):,.0f} at risk; "
+                  f"{len(disruptions)} active disruptions."),
+    ).model_dump_json()
+
+
+def _severity(radius_km: float) -> str:
+    # The backend has no severity; a wider zone affects more lanes.
+    for limit, label in ((500, "Critical"), (200, "High"), (50, "Medium")):
+        if radius_km >= limit:
+            return label
+    return "Low"
+
+
+def stuck_shipments(state: dict) -> str:
+    stuck = _ok(tools.get_stuck_shipments())
+    if not stuck:
+        return "No stuck shipments found."
+    stuck = sorted(stuck, key=lambda s: -s["total_value_at_risk"])
+    lines = [f"Found {len(stuck)} stuck shipments:"]
+    lines += [f"- **{s['id']}** ({s['transport_mode']}, {s['priority']}): {s['origin_id']} → {s['destination_id']}, "
+              f"${s['total_value_at_risk']:,.0f} at risk" for s in stuck]
+    lines.append("Select a shipment ID to see reroute options.")
+    lines.append(_view(target_id=stuck[0]["id"]))
+    return "\n".join(lines)
+
+
+def quotes(state: dict, shipment_id: str) -> str:
+    quote = _ok(tools.get_action_quotes(shipment_id))
+    options = quote.get("options") or []
+    if not options:
+        raise _Fallback(f"No options for {shipment_id}")
+    best = quote.get("recommended_option_id") or options[0]["id"]
+    lines = [f"Reroute options for **{shipment_id}**, best first:"]
+    for o in sorted(options, key=lambda o: o.get("rank") or 0):
+        note = " (recommended)" if o["id"] == best else "" if o.get("pareto_optimal", True) else f" (beaten by {o['dominated_by']})"
+        lines.append(f"{o.get('rank') or '-'}. **{o['id']}**: {o['type']}, ${o['cost_usd']:,.0f}, "
+                     f"{o['transit_time_hours']}h, {o['co2_kg']:,.0f} kg CO2{note}")
+    lines.append(f"Do you want to proceed with {best}?")
+    lines.append(_view(target_id=shipment_id))
+    state[PENDING] = {"shipment_id": shipment_id, "route_id": best}
+    return "\n".join(lines)
+
+
+def execute(state: dict, shipment_id: str, route_id: str, pending: Optional[dict] = None) -> str:
+    if pending != {"shipment_id": shipment_id, "route_id": route_id}:
+        raise _Fallback("Not the option just proposed")
+    result = _ok(tools.apply_reroute(shipment_id, route_id))
+    target = result.get("new_shipment_id") or shipment_id
+    return f"{result.get('message', 'Reroute executed.')}\n{_view(target_id=target)}"
+
+
+def approve(state: dict, pending: Optional[dict] = None) -> str:
+    if not pending:
+        raise _Fallback("Nothing pending") # The consult agent checks the conversation instead
+    return execute(state, pending["shipment_id"], pending["route_id"], pending)
+
+
+def focus(state: dict, target_id: str) -> str:
+    if target_id.startswith("SH-"):
+        shipment = _ok(tools.get_shipment(target_id))
+        return f"Showing {shipment['id']} ({shipment['status']}, {shipment['transport_mode']}).\n{_view(target_id=target_id)}"
+    for fetch in (tools.get_network_nodes, tools.get_disruption_context):
+        for item in _ok(fetch()):
+            if item["id"] == target_id:
+                return f"Showing {item.get('name') or item.get('description') or target_id}.\n{_view(target_id=target_id)}"
+    raise _Fallback(f"Unknown id {target_id}")
+
+
+# --- Router ---
+
+def _match(text: str) -> Optional[Tuple[str, Callable, dict]]:
+    if _SNAPSHOT.match(text):
+        return "snapshot", snapshot, {}
+    if _STUCK.match(text):
+        return "stuck_shipments", stuck_shipments, {}
+    if m := _QUOTES.match(text):
+        return "quotes", quotes, {"shipment_id": m["id"].upper()}
+    for pattern in _EXECUTE:
+        if m := pattern.match(text):
+            return "execute", execute, {"shipment_id": m["id"].upper(), "route_id": m["route"].upper()}
+    if _APPROVE.match(text):
+        return "approve", approve, {}
+    if m := _FOCUS.match(text):
+        return "focus", focus, {"target_id": m["id"].upper()}
+    return None
+
+
+def route(text: str, state: dict) -> Optional[str]:
+    """The reply for a structured request, or None to use the LLM pipeline."""
+    match = _match(text or "")
+    pending = state.get(PENDING)
+    if pending:
+        state[PENDING] = None # Whatever this turn is, the proposal is only good for it
+    if match is not None:
+        intent, handler, args = match
+        if handler in (approve, execute):
+            args["pending"] = pending
+        try:
+            reply = handler(state, **args)
+            stats[intent] += 1
+            logger.info("Fast path answered %r as %s", text, intent)
+            return reply
+        except _Fallback as e:
+            logger.info("Fast path declined %r (%s): %s", text, intent, e)
+    stats["llm"] += 1
+    return None
+
+
+def _user_text(content) -> str:
+    return " ".join(part.text for part in (getattr(content, "parts", None) or []) if getattr(part, "text", None)).strip()
+
+
+def before_agent(callback_context):
+    """ADK before_agent_callback: answers structured turns without running the agent.
+
+    Installed on every agent, since ADK hands a follow-up message straight to
+    the sub-agent that answered last. Once a turn went to the LLM, the agents
+    it transfers to do not route it again.
+    """
+    from google.genai import types
+
+    state = callback_context.state
+    if state.get(_DECLINED) == callback_context.invocation_id:
+        return None
+    reply = route(_user_text(callback_context.user_content), state)
+    if reply is None:
+        state[_DECLINED] = callback_context.invocation_id
+        return None
+    return types.Content(role="model", parts=[types.Part(text=reply)])
+
+
+def install(agent, callback: Optional[Callable] = before_agent) -> None:
+    """Puts the fast path in front of `agent` and every agent below it."""
+    agent.before_agent_callback = callback
+    for sub in getattr(agent, "sub_agents", None) or []:
+        install(sub, callback)
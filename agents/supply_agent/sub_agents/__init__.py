@@ -1,14 +1,17 @@
+import importlib
 
-from .investigative import investigative_agent
-from .strategize import strategize_agent
-from .consult_execute import consult_and_execute_agent
-from .snapshot import snapshot_agent
+# Each sub-agent is built when first imported from here.
+_MODULES = {
+    "investigative_agent": "investigative",
+    "strategize_agent": "strategize",
+    "consult_and_execute_agent": "consult_execute",
+    "snapshot_agent": "snapshot",
+}
 
-__all__ = [
-    "investigative_agent",
-    "strategize_agent",
-    "consult_and_execute_agent",
-    "snapshot_agent"
-]
+__all__ = list(_MODULES)
 
 
+def __getattr__(name):
+    if name in _MODULES:
+        return getattr(importlib.import_module(f".{_MODULES[name]}", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -12,12 +12,14 @@ investigative_agent = LlmAgent(
     1. Use `get_stuck_shipments()` to find Stuck shipments.
     2. Use `get_all_shipments()` if the user asks for a specific shipment that isn't stuck.
     3. Use `get_products()` to identify high-value or critical items.
-    4. Output the list of shipments clearly.
-    5. **MAP CONTROL**: 
+    4. For totals ("how much value is stuck per destination / disruption / mode / seasonal SKU"),
+       call `get_value_at_risk(dimension, status)` instead of summing shipments yourself.
+    5. Output the list of shipments clearly.
+    6. **MAP CONTROL**: 
        - If you found specific shipments, CHOOSE ONE (the most relevant or first one) to focus on.
        - Output `[VIEW: {"target_id": "SHIPMENT_ID"}]` on a new line at the end.
        - Example: "Found shipment SH-1002 in Singapore. [VIEW: {"target_id": "SH-1002"}]"
-    6. If the user hasn't selected one, ask them to select a shipment ID.
+    7. If the user hasn't selected one, ask them to select a shipment ID.
     """,
-    tools=[tools.get_stuck_shipments, tools.get_all_shipments, tools.get_products],
+    tools=[tools.get_stuck_shipments, tools.get_all_shipments, tools.get_products, tools.get_value_at_risk],
 )
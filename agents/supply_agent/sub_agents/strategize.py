@@ -13,7 +13,10 @@ strategize_agent = LlmAgent(
     2. Use `get_disruption_context()` to understand the blockers.
     3. Use `get_action_quotes(shipment_id)` to get options.
     4. Compare options (Time vs Cost) based on the shipment's priority/value.
-    5. Provide a clear recommendation.
+       - Options arrive pre-ranked: `rank` 1 is the backend's `recommended_option_id`.
+       - `score` is the weighted USD cost (price + time value + CO2) for this shipment.
+       - Never recommend an option with `pareto_optimal: false`; it is beaten on cost, time AND CO2 by `dominated_by`.
+    5. Provide a clear recommendation (normally the `recommended_option_id`; explain if you deviate).
     6. **MAP CONTROL**: 
        - If explaining a disruption, zoom to it: `[VIEW: {"target_id": "DISRUPTION_ID"}]`.
        - If discussing the shipment, zoom to it: `[VIEW: {"target_id": "SHIPMENT_ID"}]`.
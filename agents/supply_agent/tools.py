@@ -1,54 +1,88 @@
 
 import httpx
 import os
+from . import transport
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 
+def _failure(message: str, e: Exception) -> dict:
+    """A tool's error result; transport failures also say whether and when to retry."""
+    result = {"error": f"{message}: {str(e)}"}
+    if isinstance(e, transport.TransportError):
+        result.update(e.details())
+    return result
+
 def get_stuck_shipments():
     """Fetches all shipments with status 'Stuck'."""
     url = f"{BACKEND_URL}/shipments"
     print(f"[TOOL] Requesting: {url} param=Stuck")
     try:
-        response = httpx.get(url, params={"status": "Stuck"})
+        response = transport.get("shipments", url, params={"status": "Stuck"})
         response.raise_for_status()
         data = response.json()
         print(f"[TOOL] Success. Found {len(data)} stuck shipments.")
         return data
     except Exception as e:
-        error_msg = f"Error fetching stuck shipments: {str(e)}"
-        print(f"[TOOL] {error_msg}")
-        return {"error": error_msg}
+        result = _failure("Error fetching stuck shipments", e)
+        print(f"[TOOL] {result['error']}")
+        return result
 
 def get_all_shipments():
     """Fetches all active shipments regardless of status."""
     url = f"{BACKEND_URL}/shipments"
     print(f"[TOOL] Requesting: {url} (All)")
     try:
-        response = httpx.get(url)
+        response = transport.get("shipments", url)
         response.raise_for_status()
         data = response.json()
         print(f"[TOOL] Success. Found {len(data)} total shipments.")
         return data
     except Exception as e:
-        return {"error": f"Failed to fetch shipments: {str(e)}"}
+        return _failure("Failed to fetch shipments", e)
+
+def get_shipment(shipment_id: str):
+    """Fetches one shipment by ID."""
+    url = f"{BACKEND_URL}/shipments/{shipment_id}"
+    print(f"[TOOL] Requesting: {url}")
+    try:
+        response = transport.get("shipment", url)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            return {"error": f"Shipment {shipment_id} not found (404)."}
+        return {"error": f"API HTTP Error {e.response.status_code}: {e}"}
+    except Exception as e:
+        return _failure("Failed to fetch shipment", e)
+
+def get_value_at_risk(dimension: str = "destination", status: str = "Stuck"):
+    """Total value at risk grouped by 'destination', 'disruption', 'mode' or 'seasonal_sku' for one status."""
+    url = f"{BACKEND_URL}/rollups/{dimension}"
+    print(f"[TOOL] Requesting: {url} status={status}")
+    try:
+        response = transport.get("rollups", url, params={"status": status})
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        return _failure("Failed to fetch value at risk", e)
 
 def get_disruption_context():
     """Fetches current disruptions to understand why shipments are stuck."""
     url = f"{BACKEND_URL}/network/disruptions"
     print(f"[TOOL] Requesting: {url}")
     try:
-        response = httpx.get(url)
+        response = transport.get("disruptions", url)
         response.raise_for_status()
         return response.json()
     except Exception as e:
-        return {"error": f"Failed to fetch disruptions: {str(e)}"}
+        return _failure("Failed to fetch disruptions", e)
 
 def get_action_quotes(shipment_id: str):
     """Gets available rerouting quotes for a specific shipment."""
     url = f"{BACKEND_URL}/actions/quotes/{shipment_id}"
     print(f"[TOOL] Requesting Quotes from: {url}")
     try:
-        response = httpx.get(url)
+        response = transport.get("quotes", url)
         response.raise_for_status()
         data = response.json()
         print(f"[TOOL] Valid Quotes Received: {data}")
@@ -60,41 +94,50 @@ def get_action_quotes(shipment_id: str):
         return {"error": f"API HTTP Error {e.response.status_code}: {e}"}
     except Exception as e:
         print(f"[TOOL] Connection Error: {e}")
-        return {"error": f"Failed to connect to backend: {str(e)}"}
+        return _failure("Failed to connect to backend", e)
 
 def apply_reroute(shipment_id: str, new_route_id: str):
     """Executes a reroute action for a shipment."""
     url = f"{BACKEND_URL}/actions/reroute"
+    shipment = get_shipment(shipment_id)
+    if "error" in shipment:
+        return shipment
     print(f"[TOOL] POSTing reroute to: {url} payload={{shipment_id: {shipment_id}, route: {new_route_id}}}")
     try:
         payload = {
             "shipment_id": shipment_id,
-            "new_route_id": new_route_id
+            "new_route_id": new_route_id,
+            "expected_version": shipment["version"]
         }
-        response = httpx.post(url, json=payload)
+        # The key names the version the reroute acts on: retries of this call
+        # replay its first result instead of cloning a second rescue shipment,
+        # and a repeat after it applied gets a 409, since the shipment changed.
+        # A later reroute of the same shipment (say it got Stuck again) is new.
+        headers = {"Idempotency-Key": f"agent:{shipment_id}:{new_route_id}:v{shipment['version']}"}
+        response = transport.post("reroute", url, json=payload, headers=headers)
         response.raise_for_status()
         return response.json()
     except Exception as e:
         print(f"[TOOL] Reroute Failed: {e}")
-        return {"error": f"Reroute failed: {str(e)}"}
+        return _failure("Reroute failed", e)
 
 def get_products():
     """Fetches product catalog for context (value, seasonality)."""
     url = f"{BACKEND_URL}/products"
     try:
-        response = httpx.get(url)
+        response = transport.get("products", url)
         response.raise_for_status()
         return response.json()
     except Exception as e:
-        return {"error": str(e)}
+        return _failure("Failed to fetch products", e)
 
 def get_network_nodes():
     """Fetches all network nodes (ports, warehouses, etc.) with coordinates."""
     url = f"{BACKEND_URL}/network/nodes"
     print(f"[TOOL] Requesting: {url}")
     try:
-        response = httpx.get(url)
+        response = transport.get("nodes", url)
         response.raise_for_status()
         return response.json()
     except Exception as e:
-        return {"error": f"Failed to fetch nodes: {str(e)}"}
+        return _failure("Failed to fetch nodes", e)
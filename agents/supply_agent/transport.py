@@ -0,0 +1,282 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+import httpx
+
+# --- Tool Transport ---
+# Every backend call from tools.py goes through `request`. Each call has a
+# deadline for the whole call, including retries. Safe requests are retried
+# with jittered backoff: GETs, and POSTs that carry an Idempotency-Key. Reads
+# that hit tail latency (quotes) are hedged with a second request, but only
+# while the endpoint is healthy: a duplicate sent to an overloaded backend only
+# adds to its load. A circuit breaker per endpoint fails fast while the backend
+# is down, so LLM retries do not hammer it.
+
+
+@dataclass(frozen=True)
+class Policy:
+    deadline_s: float # Whole call, retries and backoff included
+    attempt_s: float # One attempt
+    retries: int = 2
+    hedge_after_s: Optional[float] = None # Send a duplicate if the first attempt is this slow (see _may_hedge)
+
+
+ENDPOINTS: Dict[str, Policy] = {
+    "shipments": Policy(deadline_s=10.0, attempt_s=4.0),
+    "shipment": Policy(deadline_s=5.0, attempt_s=2.0),
+    "rollups": Policy(deadline_s=5.0, attempt_s=2.0),
+    "disruptions": Policy(deadline_s=5.0, attempt_s=2.0),
+    "nodes": Policy(deadline_s=5.0, attempt_s=2.0),
+    "products": Policy(deadline_s=5.0, attempt_s=2.0),
+    "quotes": Policy(deadline_s=8.0, attempt_s=3.0, hedge_after_s=0.3),
+    "reroute": Policy(deadline_s=15.0, attempt_s=10.0, retries=1),
+}
+
+BACKOFF_BASE_S = 0.1
+BACKOFF_CAP_S = 1.0
+BREAKER_FAILURES = 3 # Consecutive failed calls that open the circuit
+BREAKER_OPEN_S = 15.0 # Then one probe call is let through
+RETRY_STATUSES = {429, 502, 503, 504}
+OVERLOAD_STATUSES = {429, 503}
+HEDGE_WINDOW = 100 # Recent attempt latencies per endpoint behind the p95
+HEDGE_MIN_S = 0.05 # A hedge needs at least this much of the attempt's time left
+
+
+class TransportError(Exception):
+    """A call that failed after retries, or was refused by an open circuit."""
+
+    def __init__(self, endpoint: str, message: str, retryable: bool = True,
+                 retry_after_s: Optional[float] = None, circuit_open: bool = False):
+        super().__init__(message)
+        self.endpoint = endpoint
+        self.retryable = retryable
+        self.retry_after_s = retry_after_s
+        self.circuit_open = circuit_open
+
+    def details(self) -> dict:
+        """Fields added to the tool's error result so an agent can decide what to do next."""
+        details = {"endpoint": self.endpoint, "retryable": self.retryable}
+        if self.circuit_open:
+            details["circuit_open"] = True
+        if self.retry_after_s is not None:
+            details["retry_after_s"] = round(self.retry_after_s, 1)
+        return details
+
+
+class _Breaker:
+    def __init__(self):
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= BREAKER_OPEN_S else "open"
+
+    def admit(self) -> Optional[float]:
+        """None if the call may go ahead, else the seconds until the next probe."""
+        with self.lock:
+            if self.opened_at is None:
+                return None
+            remaining = BREAKER_OPEN_S - (time.monotonic() - self.opened_at)
+            if remaining > 0 or self.probing:
+                return max(remaining, 0.0)
+            self.probing = True
+            return None
+
+    def release(self):
+        """The probe ended without a verdict (e.g. a bad request); let the next call probe."""
+        with self.lock:
+            self.probing = False
+
+    def record(self, ok: bool):
+        with self.lock:
+            self.probing = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= BREAKER_FAILURES:
+                self.opened_at = time.monotonic()
+
+
+class _Retry(Exception):
+    def __init__(self, message: str, retry_after_s: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+client = httpx.Client()
+_hedges = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+_breakers: Dict[str, _Breaker] = {}
+_counters: Dict[str, Dict[str, int]] = {}
+_latencies: Dict[str, Deque[float]] = {}
+_overloaded_until: Dict[str, float] = {} # Endpoint -> no hedging before this (monotonic)
+_lock = threading.Lock()
+
+
+def _count(endpoint: str, name: str, n: int = 1):
+    with _lock:
+        counters = _counters.setdefault(endpoint, {})
+        counters[name] = counters.get(name, 0) + n
+
+
+def _breaker(endpoint: str) -> _Breaker:
+    with _lock:
+        return _breakers.setdefault(endpoint, _Breaker())
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _observe(endpoint: str, latency_s: float):
+    with _lock:
+        _latencies.setdefault(endpoint, deque(maxlen=HEDGE_WINDOW)).append(latency_s)
+
+
+def _attempt(endpoint: str, method: str, url: str, timeout: float, kwargs: dict) -> httpx.Response:
+    _count(endpoint, "attempts")
+    started = time.monotonic()
+    try:
+        response = client.request(method, url, timeout=timeout, **kwargs)
+    except httpx.TimeoutException as e: # At least this slow
+        _observe(endpoint, time.monotonic() - started)
+        raise _Retry(f"{type(e).__name__}: {e}" if str(e) else type(e).__name__)
+    except httpx.TransportError as e: # Connect errors
+        raise _Retry(f"{type(e).__name__}: {e}" if str(e) else type(e).__name__)
+    retry_after_s = _retry_after(response)
+    if response.status_code in OVERLOAD_STATUSES or retry_after_s is not None:
+        # The backend is shedding load: no duplicates until it says it is ready.
+        with _lock:
+            _overloaded_until[endpoint] = time.monotonic() + (retry_after_s or BREAKER_OPEN_S)
+    if response.status_code in RETRY_STATUSES or response.status_code >= 500:
+        raise _Retry(f"HTTP {response.status_code}", retry_after_s)
+    _observe(endpoint, time.monotonic() - started)
+    return response
+
+
+def _may_hedge(endpoint: str, hedge_after_s: float) -> bool:
+    """Hedge only a healthy endpoint: circuit closed with no recent failures, no
+    recent 429/503 or Retry-After, and a recent p95 below the hedge delay, so
+    that hedges stay a tail of at most ~5% extra requests."""
+    breaker = _breaker(endpoint)
+    if breaker.opened_at is not None or breaker.failures:
+        return False
+    with _lock:
+        if time.monotonic() < _overloaded_until.get(endpoint, 0.0):
+            return False
+        recent = sorted(_latencies.get(endpoint, ()))
+    return not recent or recent[min(len(recent) - 1, int(len(recent) * 0.95))] < hedge_after_s
+
+
+def _hedged(endpoint: str, method: str, url: str, timeout: float, hedge_after_s: float, kwargs: dict) -> httpx.Response:
+    # The slower request cannot be cancelled; it finishes in the background
+    # within its own timeout and its result is dropped.
+    started = time.monotonic()
+    first = _hedges.submit(_attempt, endpoint, method, url, timeout, kwargs)
+    done, _ = wait([first], timeout=min(hedge_after_s, timeout))
+    if done:
+        return first.result()
+    remaining = timeout - (time.monotonic() - started)
+    if remaining < HEDGE_MIN_S or not _may_hedge(endpoint, hedge_after_s):
+        _count(endpoint, "hedges_skipped")
+        return first.result() # Returns or raises within the attempt's own timeout
+    _count(endpoint, "hedges")
+    second = _hedges.submit(_attempt, endpoint, method, url, remaining, kwargs)
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                response = future.result()
+            except _Retry as e:
+                error = e
+                continue
+            if future is second:
+                _count(endpoint, "hedge_wins")
+            return response
+    raise error
+
+
+def request(endpoint: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """Sends a request under the endpoint's policy.
+
+    Returns the response for anything the backend answered deliberately,
+    including 4xx, which the caller handles. Raises TransportError for
+    timeouts, connection failures, 5xx after retries, and open circuits.
+    """
+    policy = ENDPOINTS[endpoint]
+    breaker = _breaker(endpoint)
+    _count(endpoint, "calls")
+    wait_s = breaker.admit()
+    if wait_s is not None:
+        _count(endpoint, "short_circuits")
+        raise TransportError(endpoint, f"Backend {endpoint} endpoint is failing; not called for the next {wait_s:.0f}s",
+                             retry_after_s=wait_s, circuit_open=True)
+
+    idempotent = method == "GET" or "Idempotency-Key" in (kwargs.get("headers") or {})
+    retries = policy.retries if idempotent else 0
+    deadline = time.monotonic() + policy.deadline_s
+    attempt = 0
+    while True:
+        timeout = min(policy.attempt_s, deadline - time.monotonic())
+        try:
+            if policy.hedge_after_s is not None and idempotent:
+                response = _hedged(endpoint, method, url, timeout, policy.hedge_after_s, kwargs)
+            else:
+                response = _attempt(endpoint, method, url, timeout, kwargs)
+            breaker.record(True)
+            return response
+        except _Retry as e:
+            # Full jitter, but never sooner than the backend asked for.
+            delay = random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * 2 ** attempt))
+            delay = max(delay, e.retry_after_s or 0)
+            if attempt >= retries or time.monotonic() + delay >= deadline - 0.05:
+                breaker.record(False)
+                _count(endpoint, "failures")
+                raise TransportError(endpoint, f"{e} after {attempt + 1} attempt(s)", retryable=idempotent,
+                                     retry_after_s=e.retry_after_s)
+            attempt += 1
+            _count(endpoint, "retries")
+            time.sleep(delay)
+        except Exception:
+            breaker.release()
+            raise
+
+
+def get(endpoint: str, url: str, **kwargs) -> httpx.Response:
+    return request(endpoint, "GET", url, **kwargs)
+
+
+def post(endpoint: str, url: str, **kwargs) -> httpx.Response:
+    return request(endpoint, "POST", url, **kwargs)
+
+
+def stats() -> Dict[str, dict]:
+    """Per endpoint: circuit state and counts of calls, attempts, retries, hedges and failures."""
+    with _lock:
+        endpoints = set(_counters) | set(_breakers)
+        return {name: {"circuit": _breakers[name].state if name in _breakers else "closed", **_counters.get(name, {})}
+                for name in sorted(endpoints)}
+
+
+def reset():
+    """Closes every circuit and clears the counters."""
+    with _lock:
+        _breakers.clear()
+        _counters.clear()
+        _latencies.clear()
+        _overloaded_until.clear()
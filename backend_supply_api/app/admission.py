@@ -0,0 +1,349 @@
+import asyncio
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from . import changes, columnar, shards, versions
+from .database import engine
+
+# Admission control: every API request belongs to a route class with bounded
+# concurrency. Requests beyond it wait in one priority queue shared by all
+# classes, so a reroute or quote for a Critical or high-value shipment is let
+# in before anything else, and reads are shed with 503 + Retry-After instead of
+# queueing behind actions. Classes that compute also share MAX_IN_FLIGHT, part
+# of which is reserved for critical actions, so a flood of ordinary work can
+# never take all of it.
+
+ADMISSION = os.getenv("ADMISSION", "on").lower() # "off" lets every request straight through
+HIGH_VALUE_USD = float(os.getenv("ADMISSION_HIGH_VALUE_USD", "1000000"))
+RESERVED_CRITICAL = 2 # Of MAX_IN_FLIGHT, only critical actions may use these
+CORES = os.cpu_count() or 1
+# Handlers share the GIL (and mostly the event loop), so running more than a
+# couple per core at once only makes each of them slower, critical ones included.
+MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", RESERVED_CRITICAL + 2 * CORES))
+RETRY_AFTER_MAX_S = 30
+
+# Priorities, lowest first to be admitted.
+CRITICAL, ACTION, READ, BULK = 0, 1, 2, 3
+PRIORITY_NAMES = {CRITICAL: "critical", ACTION: "action", READ: "read", BULK: "bulk"}
+
+
+class RouteClass:
+    def __init__(self, name: str, limit: int, queue: int, max_wait_s: float, prefixes: tuple, computes: bool = True):
+        self.name = name
+        self.limit = limit # Requests of this class running at once
+        self.queue = queue # Requests of this class waiting at most; more are shed
+        self.max_wait_s = max_wait_s # Waiting longer than this is shed too
+        self.prefixes = prefixes
+        self.computes = computes # False: handlers mostly wait (on the writer queue), outside MAX_IN_FLIGHT
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.service_s = 0.05 # Moving average of time in the handler
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "queued": self.queued, "admitted": self.admitted,
+                "shed": self.shed, "timed_out": self.timed_out, "avg_service_ms": round(self.service_s * 1000, 1)}
+
+
+CLASSES: Dict[str, RouteClass] = {
+    # Reroutes wait on the group commit; the more of them queued there, the
+    # bigger each batch, so they are not held to MAX_IN_FLIGHT.
+    "writes": RouteClass("writes", limit=64, queue=1024, max_wait_s=10.0, prefixes=("/actions/reroute",), computes=False),
+    "actions": RouteClass("actions", limit=6, queue=256, max_wait_s=10.0, prefixes=("/actions/",)),
+    # Every read handler is async and computes on the event loop, so more than
+    # one per core running at once would only stall whatever else the loop is
+    # serving. A burst of reads on its own queues; reads are shed under pressure.
+    "reads": RouteClass("reads", limit=CORES, queue=64 * CORES, max_wait_s=2.0,
+                        prefixes=("/shipments", "/network", "/products", "/rollups", "/actions/rules")),
+    "bulk": RouteClass("bulk", limit=1, queue=4, max_wait_s=30.0, prefixes=("/export", "/import")),
+}
+
+
+def classify(path: str) -> Optional[RouteClass]:
+    """The route class of a path; None for paths that bypass admission (/, /ready, docs)."""
+    if path.startswith("/actions/rules"):
+        return CLASSES["reads"]
+    for route_class in CLASSES.values():
+        if path.startswith(route_class.prefixes):
+            return route_class
+    return None
+
+
+# --- Priority ---
+
+# Shipment id -> (Critical or high value, None), or (False, shipments version)
+# for ids that did not exist at that version. Priority and value rarely change,
+# so known ids are only dropped when this process writes the shipment or when
+# the least recently used entries make room; unknown ids are looked up again
+# once any worker has written a shipment, as that may have created them.
+_important: "OrderedDict[str, tuple]" = OrderedDict()
+_important_lock = threading.Lock() # _forget runs in the committing thread
+IMPORTANT_CACHE_MAX = 50_000
+
+
+def _forget(shipment_ids, version):
+    with _important_lock:
+        for sid in shipment_ids:
+            _important.pop(sid, None)
+
+
+changes.subscribe(_forget)
+
+
+def _cached(shipment_id: str) -> Optional[bool]:
+    with _important_lock:
+        entry = _important.get(shipment_id)
+        if entry is None:
+            return None
+        hit, missing_at = entry
+        if missing_at is not None and missing_at != versions.shipments_version():
+            del _important[shipment_id]
+            return None
+        _important.move_to_end(shipment_id)
+        return hit
+
+
+def _lookup(shipment_ids: List[str]) -> bool:
+    """Reads the shipments (a scatter over the shards when sharded), so it runs
+    in the threadpool; True as soon as one of them is important."""
+    for shipment_id in shipment_ids:
+        seen_at = versions.shipments_version()
+        if columnar.store is not None:
+            row = columnar.store.shipment(shipment_id)
+        else:
+            with Session(engine) as session:
+                shipment = shards.find_shipment(session, shipment_id)
+            row = shipment.model_dump() if shipment is not None else None
+        if row is None:
+            entry = (False, seen_at)
+        else:
+            entry = (row["priority"] == "Critical" or row["total_value_at_risk"] >= HIGH_VALUE_USD, None)
+        with _important_lock:
+            _important[shipment_id] = entry
+            _important.move_to_end(shipment_id)
+            while len(_important) > IMPORTANT_CACHE_MAX:
+                _important.popitem(last=False)
+        if entry[0]:
+            return True
+    return False
+
+
+async def important(shipment_ids: List[str]) -> bool:
+    """Whether any of the shipments is Critical or high value."""
+    missing = []
+    for shipment_id in shipment_ids:
+        hit = _cached(shipment_id)
+        if hit:
+            return True
+        if hit is None:
+            missing.append(shipment_id)
+    return bool(missing) and await run_in_threadpool(_lookup, missing)
+
+
+def _shipment_ids(path: str, body: bytes) -> List[str]:
+    if path.startswith("/actions/quotes/") and path != "/actions/quotes/batch":
+        return [path.rsplit("/", 1)[-1]]
+    if not path.startswith("/actions/reroute") or not body:
+        return []
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return [] # The route answers 422
+    if not isinstance(payload, dict):
+        return []
+    items = payload.get("items") if path.endswith("/batch") else [payload]
+    return [i["shipment_id"] for i in items or [] if isinstance(i, dict) and isinstance(i.get("shipment_id"), str)]
+
+
+async def priority(route_class: RouteClass, path: str, body: bytes) -> int:
+    if route_class.name == "bulk":
+        return BULK
+    if route_class.name == "reads":
+        return READ
+    return CRITICAL if await important(_shipment_ids(path, body)) else ACTION
+
+
+# --- Controller ---
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "route_class", "future")
+
+    def __init__(self, priority: int, seq: int, route_class: RouteClass, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.route_class = route_class
+        self.future = future
+
+
+class Controller:
+    """Slot accounting and the priority queue. Runs on the event loop only, so
+    it needs no locks."""
+
+    def __init__(self):
+        self.in_flight = 0 # Of the classes that compute
+        self.waiting: List[_Waiter] = [] # Sorted by (priority, arrival)
+        self._seq = itertools.count()
+        self.admitted_by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+
+    def _has_room(self, route_class: RouteClass, priority: int) -> bool:
+        reserved = 0 if priority == CRITICAL else RESERVED_CRITICAL
+        if route_class.in_flight >= route_class.limit + RESERVED_CRITICAL - reserved:
+            return False
+        return not route_class.computes or self.in_flight < MAX_IN_FLIGHT - reserved
+
+    def _start(self, route_class: RouteClass, priority: int):
+        route_class.in_flight += 1
+        route_class.admitted += 1
+        if route_class.computes:
+            self.in_flight += 1
+        self.admitted_by_priority[PRIORITY_NAMES[priority]] += 1
+
+    def should_shed(self, route_class: RouteClass, priority: int) -> bool:
+        if route_class.queued >= route_class.queue:
+            return True
+        if priority < READ:
+            return False
+        # Under pressure reads give way at once rather than queue: when actions
+        # are waiting, or other classes hold every shared slot reads could use.
+        if any(w.priority < READ for w in self.waiting):
+            return True
+        return self.in_flight - route_class.in_flight >= MAX_IN_FLIGHT - RESERVED_CRITICAL
+
+    def retry_after(self, route_class: RouteClass) -> int:
+        backlog = route_class.queued + route_class.in_flight
+        return max(1, min(RETRY_AFTER_MAX_S, math.ceil(backlog * route_class.service_s / route_class.limit)))
+
+    async def acquire(self, route_class: RouteClass, priority: int) -> bool:
+        """Waits for a slot; False if the request was shed instead.
+
+        Waiters only stay queued while they have no room (release() hands out
+        freed slots at once), so a new request with room cannot overtake one.
+        """
+        if self._has_room(route_class, priority):
+            self._start(route_class, priority)
+            return True
+        if self.should_shed(route_class, priority):
+            route_class.shed += 1
+            return False
+        waiter = _Waiter(priority, next(self._seq), route_class, asyncio.get_running_loop().create_future())
+        self._enqueue(waiter)
+        try:
+            admitted = await asyncio.wait_for(asyncio.shield(waiter.future), route_class.max_wait_s)
+        except asyncio.TimeoutError:
+            admitted = waiter.future.done() and waiter.future.result() # Admitted just as time ran out
+            if not admitted:
+                route_class.timed_out += 1
+        except asyncio.CancelledError: # The client went away
+            if waiter.future.done() and waiter.future.result():
+                self.release(route_class)
+            raise
+        finally:
+            if waiter in self.waiting:
+                self.waiting.remove(waiter)
+                route_class.queued -= 1
+            if not waiter.future.done():
+                waiter.future.cancel()
+        if not admitted:
+            route_class.shed += 1
+        return admitted
+
+    def _enqueue(self, waiter: _Waiter):
+        key = (waiter.priority, waiter.seq)
+        index = next((i for i, w in enumerate(self.waiting) if (w.priority, w.seq) > key), len(self.waiting))
+        self.waiting.insert(index, waiter)
+        waiter.route_class.queued += 1
+        # Reads queued before the pressure started give way as well.
+        if waiter.priority < READ:
+            for w in [w for w in self.waiting if w.priority >= READ]:
+                self.waiting.remove(w)
+                w.route_class.queued -= 1
+                w.future.set_result(False)
+
+    def release(self, route_class: RouteClass, elapsed_s: Optional[float] = None):
+        route_class.in_flight -= 1
+        if route_class.computes:
+            self.in_flight -= 1
+        if elapsed_s is not None:
+            route_class.service_s += 0.1 * (elapsed_s - route_class.service_s)
+        self._dispatch()
+
+    def _dispatch(self):
+        for waiter in list(self.waiting):
+            if waiter.future.done() or not self._has_room(waiter.route_class, waiter.priority):
+                continue
+            self.waiting.remove(waiter)
+            waiter.route_class.queued -= 1
+            self._start(waiter.route_class, waiter.priority)
+            waiter.future.set_result(True)
+
+    def stats(self) -> dict:
+        queued = {name: 0 for name in PRIORITY_NAMES.values()}
+        for w in self.waiting:
+            queued[PRIORITY_NAMES[w.priority]] += 1
+        return {"enabled": ADMISSION != "off", "in_flight": self.in_flight, "max_in_flight": MAX_IN_FLIGHT,
+                "queued_by_priority": queued, "admitted_by_priority": dict(self.admitted_by_priority),
+                "classes": {name: c.stats() for name, c in CLASSES.items()}}
+
+
+controller = Controller()
+
+
+# --- Middleware ---
+
+async def _buffer(receive) -> tuple:
+    """Reads the whole request body; returns (body, receive that replays it)."""
+    messages = []
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request" or not message.get("more_body", False):
+            break
+    body = b"".join(m.get("body", b"") for m in messages)
+
+    async def replay():
+        return messages.pop(0) if messages else await receive()
+    return body, replay
+
+
+class AdmissionControl:
+    """ASGI middleware putting every classified request through `controller`."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        route_class = classify(scope["path"]) if scope["type"] == "http" and ADMISSION != "off" else None
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+        body = b""
+        if route_class.name in ("writes", "actions") and scope["method"] == "POST": # Not bulk: imports stream
+            body, receive = await _buffer(receive)
+        rank = await priority(route_class, scope["path"], body)
+        if not await controller.acquire(route_class, rank):
+            response = JSONResponse(
+                {"detail": "Server busy; retry later", "route_class": route_class.name,
+                 "priority": PRIORITY_NAMES[rank]},
+                status_code=503, headers={"Retry-After": str(controller.retry_after(route_class))})
+            await response(scope, receive, send)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(route_class, time.perf_counter() - started)
+
+
+def stats() -> dict:
+    return controller.stats()
+
@@ -0,0 +1,193 @@
+import math
+import time
+from typing import Dict, List, Optional, Set
+from .models import RankingWeights
+from .ranking import time_value_per_hour
+from .routing import RoutePlanner, value_rate
+from . import rules
+
+# Rescue dispatches a node can originate per planning window, by capacity_tier
+# (1 = Mega-Hub ... 3 = Small Store).
+CAPACITY_BY_TIER = {1: 40, 2: 15, 3: 5}
+
+UNASSIGNED = "__unassigned__"
+_SLACK = "__slack__"
+
+
+class RescueAllocator:
+    """Capacity-constrained assignment of stuck shipments to rescue warehouses.
+
+    A greedy regret pass builds a feasible plan, then negative cycles are
+    cancelled on the compressed "move a shipment from warehouse a to b" graph
+    until none is left (optimal) or the deadline passes. Every cancelled cycle
+    yields a strictly cheaper feasible plan, so stopping early still returns the
+    best plan found so far.
+
+    Leaving a shipment unassigned costs its `total_value_at_risk` (the goods are
+    lost), so a rescue is only planned when it is worth more than it costs.
+    """
+
+    def __init__(self, shipments, warehouses, planner: RoutePlanner, seasonal: Set[str],
+                 weights: RankingWeights, capacity_overrides: Optional[Dict[str, int]] = None):
+        overrides = capacity_overrides or {}
+        self.shipments = {s.id: s for s in shipments}
+        self.capacity = {w.id: overrides.get(w.id, CAPACITY_BY_TIER.get(w.capacity_tier, 0)) for w in warehouses}
+        self.capacity[UNASSIGNED] = math.inf
+        self.routes: Dict[str, Dict[str, dict]] = {}
+        self.costs: Dict[str, Dict[str, float]] = {}
+        self.route_ids: Dict[str, str] = {}
+        ruleset = rules.current()
+        for s in shipments:
+            tree = planner.tree_to(s.destination_id, ("Truck",))
+            tv = time_value_per_hour(s, seasonal, weights)
+            # Priced like the warehouse rescue a quote would offer (without a
+            # disruption, which plans do not look at).
+            spec = ruleset.option(rules.Facts(s.transport_mode, s.priority, s.total_value_at_risk, None), "warehouses")
+            price_row = spec.row if spec else ruleset.default_row
+            self.route_ids[s.id] = spec.id if spec else "OPT-REPLACEMENT-TRUCK-{origin_id}"
+            row = {UNASSIGNED: s.total_value_at_risk}
+            routes = {}
+            for w in warehouses:
+                route = tree.get(w.id)
+                if w.id == s.destination_id or route is None:
+                    continue
+                price, hours, co2 = price_row(route["cost_usd"], value_rate(route), route["hours"], route["co2_kg"],
+                                              route["km"], s.total_value_at_risk, s.priority == "Critical")
+                row[w.id] = weights.cost_weight * price + hours * tv + co2 * weights.co2_price_per_kg
+                routes[w.id] = {**route, "price": price, "hours": hours, "name": w.name}
+            self.costs[s.id] = row
+            self.routes[s.id] = routes
+        self.assignment: Dict[str, str] = {}
+        self.load: Dict[str, int] = {w: 0 for w in self.capacity}
+        self.iterations = 0
+        self.optimal = False
+
+    # --- Construction ---
+
+    def independent_choices(self) -> Dict[str, str]:
+        """What per-shipment quoting does: everyone takes their own cheapest source."""
+        return {sid: min(row, key=row.get) for sid, row in self.costs.items()}
+
+    def greedy(self):
+        # Shipments that lose the most by missing their best source choose first.
+        def regret(sid):
+            ranked = sorted(self.costs[sid].values())
+            return ranked[1] - ranked[0] if len(ranked) > 1 else 0.0
+
+        for sid in sorted(self.costs, key=lambda s: (-regret(s), s)):
+            row = self.costs[sid]
+            choice = min((w for w in row if self.load[w] < self.capacity[w]), key=lambda w: (row[w], w))
+            self.assignment[sid] = choice
+            self.load[choice] += 1
+
+    # --- Improvement ---
+
+    def improve(self, deadline: Optional[float]):
+        while deadline is None or time.perf_counter() < deadline:
+            cycle = self._negative_cycle()
+            if cycle is None:
+                self.optimal = True
+                return
+            for sid, dest in cycle:
+                self.load[self.assignment[sid]] -= 1
+                self.load[dest] += 1
+                self.assignment[sid] = dest
+            self.iterations += 1
+
+    def _negative_cycle(self):
+        # Edge a -> b: move the shipment at `a` that gains most by switching to `b`.
+        members: Dict[str, List[str]] = {w: [] for w in self.capacity}
+        for sid, w in self.assignment.items():
+            members[w].append(sid)
+        nodes = list(self.capacity) + [_SLACK]
+        edges = []
+        for a, sids in members.items():
+            best: Dict[str, tuple] = {}
+            for sid in sids:
+                row = self.costs[sid]
+                here = row[a]
+                for b, c in row.items():
+                    if b != a and (b not in best or c - here < best[b][0]):
+                        best[b] = (c - here, sid)
+            for b, (delta, sid) in best.items():
+                edges.append((a, b, delta, sid))
+        for w in self.capacity:
+            if self.load[w] < self.capacity[w]:
+                edges.append((w, _SLACK, 0.0, None))
+            edges.append((_SLACK, w, 0.0, None))
+
+        # Bellman-Ford from a virtual root connected to every node.
+        dist = {n: 0.0 for n in nodes}
+        pred = {n: None for n in nodes}
+        last = None
+        for _ in range(len(nodes)):
+            last = None
+            for a, b, w, sid in edges:
+                if dist[a] + w < dist[b] - 1e-9:
+                    dist[b] = dist[a] + w
+                    pred[b] = (a, sid)
+                    last = b
+            if last is None:
+                return None
+        for _ in range(len(nodes)):
+            last = pred[last][0]
+        cycle, v = [], last
+        while True:
+            a, sid = pred[v]
+            if sid is not None:
+                cycle.append((sid, v))
+            v = a
+            if v == last:
+                break
+        return cycle
+
+    # --- Results ---
+
+    def total(self, assignment: Dict[str, str]) -> float:
+        return sum(self.costs[sid][w] for sid, w in assignment.items())
+
+    def overbooked(self, assignment: Dict[str, str]) -> List[str]:
+        load: Dict[str, int] = {}
+        for w in assignment.values():
+            load[w] = load.get(w, 0) + 1
+        return sorted(w for w, n in load.items() if n > self.capacity[w])
+
+    def assignments(self) -> List[dict]:
+        out = []
+        for sid in sorted(self.assignment):
+            w = self.assignment[sid]
+            if w == UNASSIGNED:
+                continue
+            route = self.routes[sid][w]
+            out.append({
+                "shipment_id": sid,
+                "source_id": w,
+                "route_id": self.route_ids[sid].format(origin_id=w, origin_name=route["name"], km=int(route["km"]),
+                                                       shipment_id=sid),
+                "cost_usd": int(route["price"]),
+                "transit_time_hours": int(math.ceil(route["hours"])),
+                "score": round(self.costs[sid][w], 2),
+            })
+        return out
+
+
+def plan_rescues(shipments, warehouses, planner: RoutePlanner, seasonal: Set[str], weights: RankingWeights,
+                 time_budget_ms: int, anytime: bool = True,
+                 capacity_overrides: Optional[Dict[str, int]] = None) -> dict:
+    started = time.perf_counter()
+    allocator = RescueAllocator(shipments, warehouses, planner, seasonal, weights, capacity_overrides)
+    allocator.greedy()
+    deadline = started + time_budget_ms / 1000 if anytime else None
+    allocator.improve(deadline)
+
+    baseline = allocator.independent_choices()
+    return {
+        "assignments": allocator.assignments(),
+        "unassigned": sorted(sid for sid, w in allocator.assignment.items() if w == UNASSIGNED),
+        "total_score": round(allocator.total(allocator.assignment), 2),
+        "baseline_score": round(allocator.total(baseline), 2),
+        "baseline_overbooked": allocator.overbooked(baseline),
+        "optimal": allocator.optimal,
+        "iterations": allocator.iterations,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
@@ -0,0 +1,238 @@
+import asyncio
+import heapq
+import json
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from pydantic import BaseModel, ValidationError, create_model
+from sqlalchemy import inspect
+from sqlmodel import Session, SQLModel, select
+from starlette.concurrency import run_in_threadpool
+from .concurrency import writer
+from .database import engine
+from .models import Disruption, Node, Product, Shipment
+from . import rollups, shards, versions
+
+TABLES: Dict[str, type] = {"shipments": Shipment, "nodes": Node, "products": Product, "disruptions": Disruption}
+REFERENCE_TABLES = ("nodes", "products", "disruptions")
+
+EXPORT_BATCH_ROWS = 1000 # Rows fetched from the cursor and written to the socket at a time
+IMPORT_CHUNK_ROWS = 1000 # Rows per import transaction
+MAX_REPORTED_ERRORS = 1000 # Later errors are only counted
+
+
+def _pk(model):
+    return inspect(model).primary_key[0]
+
+
+def _row_schema(model) -> type:
+    # Validating through a plain pydantic copy of the fields is several times
+    # faster than model_validate on the instrumented table class.
+    fields = {name: (f.annotation, ... if f.is_required() else f.default) for name, f in model.model_fields.items()}
+    return create_model(f"{model.__name__}Row", **fields)
+
+
+_SCHEMAS: Dict[str, type] = {table: _row_schema(model) for table, model in TABLES.items()}
+
+
+def validate_row(table: str, data: dict) -> SQLModel:
+    """The table row for `data`. Only the fields present in `data` count as set
+    (`model_fields_set`), so an import updating an existing row leaves the rest alone."""
+    row: BaseModel = _SCHEMAS[table].model_validate(data)
+    return TABLES[table](**{name: getattr(row, name) for name in row.model_fields_set})
+
+
+# --- Export ---
+
+def _cursor(db_engine, model) -> Iterator[dict]:
+    """Rows of `model` in primary-key order, fetched in batches from one read transaction."""
+    table = model.__table__
+    with db_engine.connect() as conn:
+        result = conn.execution_options(yield_per=EXPORT_BATCH_ROWS).execute(select(table).order_by(_pk(model)))
+        for row in result:
+            yield dict(row._mapping)
+
+
+def _sharded_shipments() -> Iterator[dict]:
+    # Every shard cursor is already in id order, so a lazy merge keeps memory
+    # flat. A shipment caught mid-move appears twice; keep its own region's copy.
+    streams = [((row["id"], name, row) for row in _cursor(shard.engine, Shipment))
+               for name, shard in shards.shard_set.shards.items()]
+    pending = None
+    for sid, name, row in heapq.merge(*streams, key=lambda t: (t[0], t[1])):
+        if pending is not None and pending["id"] == sid:
+            if name == shards.region_of(row["current_location"]):
+                pending = row
+            continue
+        if pending is not None:
+            yield pending
+        pending = row
+    if pending is not None:
+        yield pending
+
+
+def export_ndjson(table: str) -> Iterator[bytes]:
+    """One JSON object per line, streamed in batches; memory does not grow with the table."""
+    model = TABLES[table]
+    if table == "shipments" and shards.shard_set is not None:
+        rows = _sharded_shipments()
+    else:
+        rows = _cursor(engine, model)
+    batch: List[str] = []
+    for row in rows:
+        batch.append(json.dumps(row, separators=(",", ":")))
+        if len(batch) >= EXPORT_BATCH_ROWS:
+            yield ("\n".join(batch) + "\n").encode()
+            batch = []
+    if batch:
+        yield ("\n".join(batch) + "\n").encode()
+
+
+# --- Import ---
+
+async def _lines(body: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """(line number, line) pairs from a streamed body, without buffering it whole."""
+    buffer = b""
+    number = 0
+    async for chunk in body:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            yield number, line
+    if buffer:
+        yield number + 1, buffer
+
+
+def _describe(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, e['loc'])) or 'row'}: {e['msg']}" for e in error.errors())
+    return str(getattr(error, "orig", None) or error)
+
+
+def _upsert_job(model, rows: List[Tuple[int, SQLModel]]):
+    """Writer job inserting or updating `rows`; returns (created, updated, [(line, error)]).
+
+    The chunk is tried as one savepoint. If it fails, each row is retried in
+    its own savepoint so only the offending lines are rejected. Updates go
+    through the ORM, so shipment versions, rollups and change notifications
+    behave exactly as for any other write. An update only copies the fields the
+    line set; a new row gets the defaults for the rest.
+    """
+    pk = _pk(model).name
+
+    def apply(session: Session, chunk) -> Tuple[int, int]:
+        keys = [getattr(obj, pk) for _, obj in chunk]
+        existing = {getattr(o, pk): o for o in session.exec(select(model).where(_pk(model).in_(keys))).all()}
+        created = updated = 0
+        for _, obj in chunk:
+            current = existing.get(getattr(obj, pk))
+            if current is None:
+                session.add(obj)
+                existing[getattr(obj, pk)] = obj
+                created += 1
+                continue
+            for name, value in obj.model_dump(include=obj.model_fields_set - {"version"}).items():
+                setattr(current, name, value)
+            session.add(current)
+            updated += 1
+        session.flush()
+        return created, updated
+
+    def job(session: Session):
+        try:
+            with session.begin_nested():
+                return (*apply(session, rows), [])
+        except Exception:
+            pass
+        created = updated = 0
+        errors = []
+        for line, obj in rows:
+            try:
+                with session.begin_nested():
+                    c, u = apply(session, [(line, model(**obj.model_dump(include=obj.model_fields_set)))])
+                created += c
+                updated += u
+            except Exception as e:
+                errors.append((line, _describe(e)))
+        return created, updated, errors
+
+    return job
+
+
+async def _write_chunk(table: str, rows: List[Tuple[int, SQLModel]]) -> Tuple[int, int, List[Tuple[int, str]]]:
+    model = TABLES[table]
+    if shards.shard_set is None:
+        return await writer.run(_upsert_job(model, rows))
+
+    if table in REFERENCE_TABLES:
+        # Replicated: the main database and every shard get the same rows.
+        queues = [writer] + [shard.writer for shard in shards.shard_set.shards.values()]
+        results = await asyncio.gather(*[q.run(_upsert_job(model, rows)) for q in queues])
+        return results[0]
+
+    # Existing shipments are written where they live, new ones in their region;
+    # rows whose location moved are then rebalanced like a reroute clone.
+    owners = await run_in_threadpool(shards.shard_set.owners, [obj.id for _, obj in rows])
+    groups: Dict[str, List[Tuple[int, SQLModel]]] = {}
+    for line, obj in rows:
+        shard = owners.get(obj.id) or shards.shard_set.shards[shards.region_of(obj.current_location)]
+        groups.setdefault(shard.name, []).append((line, obj))
+    shard_list = [shards.shard_set.shards[name] for name in groups]
+    results = await asyncio.gather(*[s.writer.run(_upsert_job(model, groups[s.name])) for s in shard_list])
+    for shard in shard_list:
+        await run_in_threadpool(shards.shard_set.rebalance, shard, [obj.id for _, obj in groups[shard.name]])
+    return (sum(r[0] for r in results), sum(r[1] for r in results), sorted(e for r in results for e in r[2]))
+
+
+async def import_ndjson(table: str, body: AsyncIterator[bytes], chunk_rows: int = IMPORT_CHUNK_ROWS) -> dict:
+    """Validates and upserts NDJSON rows in chunked transactions.
+
+    Bad lines (invalid JSON, failed validation, rejected by the database) are
+    reported and skipped; every other line is imported. Only one chunk is held
+    in memory at a time.
+    """
+    model = TABLES[table]
+    report = {"table": table, "received": 0, "created": 0, "updated": 0, "failed": 0, "errors": []}
+
+    def fail(line: int, message: str, key: Optional[str] = None):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line, "id": key, "error": message})
+
+    async def flush(rows):
+        created, updated, errors = await _write_chunk(table, rows)
+        report["created"] += created
+        report["updated"] += updated
+        keys = {line: getattr(obj, _pk(model).name) for line, obj in rows}
+        for line, message in errors:
+            fail(line, message, keys.get(line))
+
+    rows: List[Tuple[int, SQLModel]] = []
+    async for line, raw in _lines(body):
+        if not raw.strip():
+            continue
+        report["received"] += 1
+        try:
+            data = json.loads(raw)
+            if not isinstance(data, dict):
+                raise ValueError("Expected a JSON object")
+        except ValueError as e:
+            fail(line, f"Invalid JSON: {e}")
+            continue
+        try:
+            rows.append((line, validate_row(table, data)))
+        except ValidationError as e:
+            fail(line, _describe(e), data.get(_pk(model).name))
+            continue
+        if len(rows) >= chunk_rows:
+            await flush(rows)
+            rows = []
+    if rows:
+        await flush(rows)
+
+    if table in REFERENCE_TABLES and report["created"] + report["updated"]:
+        # Quotes, the planner and rollup groups are derived from reference data.
+        versions.bump_data_version()
+        queues = [writer] + ([s.writer for s in shards.shard_set.shards.values()] if shards.shard_set else [])
+        await asyncio.gather(*[q.run(rollups.rebuild) for q in queues])
+    report["errors"].sort(key=lambda e: e["line"])
+    return report
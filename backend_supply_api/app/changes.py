@@ -0,0 +1,61 @@
+from typing import Callable, List, Set
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session as OrmSession
+from .models import Shipment
+from . import versions
+
+# Tells subscribers which shipments a transaction touched, once it has committed,
+# and bumps the shared shipments version so other worker processes notice too.
+# ORM writes are picked up automatically; Core UPDATEs (compare_and_swap) call touch().
+
+_KEY = "touched_shipments"
+_subscribers: List[Callable[[Set[str], int], None]] = []
+
+
+def subscribe(fn: Callable[[Set[str], int], None]):
+    """`fn(shipment_ids, shipments_version)` runs in the committing thread."""
+    if fn not in _subscribers:
+        _subscribers.append(fn)
+
+
+def touch(session, *shipment_ids: str):
+    session.info.setdefault(_KEY, set()).update(shipment_ids)
+
+
+@event.listens_for(OrmSession, "before_flush")
+def _bump_versions(session, flush_context, instances):
+    # Plain ORM edits count as writes too, so other processes (and compare_and_swap)
+    # can see that the row changed.
+    for obj in session.dirty:
+        if isinstance(obj, Shipment) and session.is_modified(obj) and not inspect(obj).attrs.version.history.has_changes():
+            obj.version = (obj.version or 0) + 1
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _track(session, flush_context):
+    ids = [obj.id for obj in (*session.new, *session.dirty, *session.deleted) if isinstance(obj, Shipment)]
+    if ids:
+        touch(session, *ids)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _publish(session):
+    if session.in_nested_transaction():
+        return  # Released a SAVEPOINT; nothing is visible to other connections yet
+    ids = session.info.pop(_KEY, None)
+    if not ids:
+        return
+    version = versions.bump_shipments_version()
+    for fn in _subscribers:
+        try:
+            fn(ids, version)
+        except Exception as e:
+            # The write is already durable; a failing subscriber must not undo it.
+            print(f"Change subscriber failed: {e}")
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard(session):
+    # A rolled-back SAVEPOINT keeps the ids: re-reading an unchanged row is harmless.
+    if not session.in_nested_transaction():
+        session.info.pop(_KEY, None)
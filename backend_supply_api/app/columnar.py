@@ -0,0 +1,268 @@
+import math
+import os
+import sys
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy import func, select
+from .models import Disruption, Node, Shipment, ShipmentEvent
+from .routing import EARTH_RADIUS_KM, haversine_km
+from . import changes, events, versions  # events: logs every commit that refresh() reads back
+
+# "sqlite" serves reads from the database; "memory" from a ColumnarStore kept
+# in sync with every commit (SQLite stays the durable copy).
+STORAGE_MODE = os.getenv("STORAGE_MODE", "sqlite").lower()
+
+_log = ShipmentEvent.__table__
+
+
+class Interner:
+    """Maps repeated values (statuses, node ids, content lists) to small integer codes."""
+
+    def __init__(self, limit: Optional[int] = None):
+        self.codes: Dict = {}
+        self.values: List = []
+        self.limit = limit
+
+    def code(self, value) -> int:
+        c = self.codes.get(value)
+        if c is None:
+            c = len(self.values)
+            if self.limit is not None and c >= self.limit:
+                raise ValueError(f"More than {self.limit} distinct values")
+            self.codes[value] = c
+            self.values.append(sys.intern(value) if isinstance(value, str) else value)
+        return c
+
+
+def _positions(column: bytearray, code: int) -> List[int]:
+    # bytearray.find scans in C, so sparse matches (e.g. Stuck) skip most rows.
+    out = []
+    i = column.find(code)
+    while i != -1:
+        out.append(i)
+        i = column.find(code, i + 1)
+    return out
+
+
+def _within(lat: array, lon: array, rows: Iterable[int], center: dict, radius_km: float) -> List[int]:
+    """Rows within `radius_km` of `center`: a bounding-box pass, then exact distance."""
+    clat, clon = center.get("lat", 0), center.get("lon", 0)
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(clat))
+    dlon = 360.0 if cos_lat < 1e-6 else min(360.0, dlat / cos_lat)
+    lat_lo, lat_hi = clat - dlat, clat + dlat
+    box = [i for i in rows if lat_lo <= lat[i] <= lat_hi and abs((lon[i] - clon + 180) % 360 - 180) <= dlon]
+    return [i for i in box if haversine_km(lat[i], lon[i], clat, clon) <= radius_km]
+
+
+class ColumnarStore:
+    """Shipments as parallel typed arrays, plus the (small) node and disruption tables.
+
+    Status, mode and priority are one byte each, node references and content
+    lists are codes into shared pools, and coordinates and values are packed
+    doubles. A shipment costs about a tenth of a hydrated ORM object, and
+    filters are scans over these columns.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.RLock()
+        self.categories = Interner(limit=256)
+        self.node_ids = Interner()
+        self.contents = Interner()
+        # --- Shipments ---
+        self.row: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.alive = bytearray()
+        self.status = bytearray()
+        self.mode = bytearray()
+        self.priority = bytearray()
+        self.lat = array("d")
+        self.lon = array("d")
+        self.origin = array("I")
+        self.destination = array("I")
+        self.content = array("I")
+        self.value = array("d")
+        self.version = array("q")
+        self.synced = -1 # Shared shipments version the columns reflect
+        self.seq = 0 # Last ShipmentEvent the columns reflect
+        # --- Network (small, reloaded whenever the data version moves) ---
+        self.nodes: List[dict] = []
+        self.disruptions: List[dict] = []
+        self.data_version = -1
+
+    @classmethod
+    def load(cls, engine) -> "ColumnarStore":
+        store = cls(engine)
+        store.synced = versions.shipments_version()
+        with engine.connect() as conn:
+            # The log position first: rows read after it are at least that new.
+            store.seq = conn.execute(select(func.max(_log.c.seq))).scalar() or 0
+            for r in conn.execute(select(Shipment.__table__)):
+                store._put(r._mapping)
+        store._load_network()
+        changes.subscribe(store.refresh)
+        return store
+
+    # --- Writes ---
+
+    def _put(self, r):
+        loc = r["current_location"] or {}
+        cols = (
+            self.categories.code(r["status"]), self.categories.code(r["transport_mode"]),
+            self.categories.code(r["priority"]), float(loc.get("lat", 0)), float(loc.get("lon", 0)),
+            self.node_ids.code(r["origin_id"]), self.node_ids.code(r["destination_id"]),
+            self.contents.code(tuple(tuple(sorted(item.items())) for item in r["contents"] or [])),
+            float(r["total_value_at_risk"]), r["version"],
+        )
+        i = self.row.get(r["id"])
+        if i is not None and self.alive[i] and self.version[i] > r["version"]:
+            return # A concurrent refresh already applied a newer copy
+        if i is None:
+            self.row[r["id"]] = len(self.ids)
+            self.ids.append(sys.intern(r["id"]))
+            self.alive.append(1)
+            for column, value in zip(self._columns(), cols):
+                column.append(value)
+        else:
+            self.alive[i] = 1
+            for column, value in zip(self._columns(), cols):
+                column[i] = value
+
+    def _columns(self):
+        return (self.status, self.mode, self.priority, self.lat, self.lon,
+                self.origin, self.destination, self.content, self.value, self.version)
+
+    def refresh(self, shipment_ids: Set[str] = frozenset(), version: Optional[int] = None):
+        """Re-reads committed rows for `shipment_ids`, and for every shipment in
+        the event log since the last refresh (called after every commit in this
+        process, and by `_sync`).
+
+        The log is read before the rows, so the rows are at least as new as the
+        last event read. `version` is the shared shipments version bumped before
+        this call; every commit that bumped it earlier is in the log by then.
+        """
+        table = Shipment.__table__
+        with self.engine.connect() as conn:
+            logged = conn.execute(select(_log.c.seq, _log.c.shipment_id).where(_log.c.seq > self.seq)
+                                  .order_by(_log.c.seq)).all()
+            if logged and logged[0].seq > self.seq + 1:
+                return self._rescan(version) # Events were pruned since; fall back to comparing versions
+            ids = set(shipment_ids) | {r.shipment_id for r in logged}
+            rows = list(conn.execute(select(table).where(table.c.id.in_(list(ids))))) if ids else []
+        with self._lock:
+            found = set()
+            for r in rows:
+                self._put(r._mapping)
+                found.add(r.id)
+            for sid in ids - found:
+                if sid in self.row:
+                    self.alive[self.row[sid]] = 0
+            if logged:
+                self.seq = max(self.seq, logged[-1].seq)
+            if version is not None:
+                self.synced = max(self.synced, version)
+
+    def _rescan(self, version: Optional[int]):
+        """Finds changed rows by comparing every (id, version) with the columns."""
+        table = Shipment.__table__
+        with self.engine.connect() as conn:
+            seq = conn.execute(select(func.max(_log.c.seq))).scalar() or 0
+            committed = dict(conn.execute(select(table.c.id, table.c.version)).all())
+        with self._lock:
+            stale = {sid for sid, v in committed.items()
+                     if (i := self.row.get(sid)) is None or self.version[i] != v or not self.alive[i]}
+            stale |= {sid for sid, i in self.row.items() if self.alive[i] and sid not in committed}
+            self.seq = max(self.seq, seq)
+        self.refresh(stale, version)
+
+    def _sync(self):
+        """Catches up with commits this store has not refreshed yet, mostly those
+        of other worker processes.
+
+        Their bumps of the shared shipments version show up as a gap; the event
+        log since the last refresh then names exactly the rows that changed.
+        """
+        current = versions.shipments_version()
+        if current != self.synced:
+            self.refresh(version=current)
+
+    def _load_network(self):
+        with self.engine.connect() as conn:
+            self.nodes = [dict(r._mapping) for r in conn.execute(select(Node.__table__))]
+            self.disruptions = [dict(r._mapping) for r in conn.execute(select(Disruption.__table__))]
+        for n in self.nodes:
+            self.node_ids.code(n["id"])
+        self.data_version = versions.data_version()
+
+    def _network(self):
+        if self.data_version != versions.data_version():
+            with self._lock:
+                if self.data_version != versions.data_version():
+                    self._load_network()
+
+    # --- Reads ---
+
+    def shipment(self, shipment_id: str) -> Optional[dict]:
+        self._sync()
+        with self._lock:
+            i = self.row.get(shipment_id)
+            return self._row(i) if i is not None and self.alive[i] else None
+
+    def shipments(self, status: Optional[str] = None, disruption: Optional[dict] = None) -> List[dict]:
+        self._sync()
+        with self._lock:
+            # Most selective column first; tombstones are rare, so they are checked last.
+            rows: Optional[List[int]] = None
+            if status:
+                code = self.categories.codes.get(status)
+                rows = [] if code is None else _positions(self.status, code)
+            if disruption is not None:
+                codes = {self.categories.codes[m] for m in disruption["affected_modes"] or [] if m in self.categories.codes}
+                mode = self.mode
+                candidates = range(len(self.ids)) if rows is None else rows
+                rows = _within(self.lat, self.lon, [i for i in candidates if mode[i] in codes],
+                               disruption["location"], disruption["radius_km"])
+            if rows is None:
+                rows = range(len(self.ids))
+            alive = self.alive
+            return [self._row(i) for i in rows if alive[i]]
+
+    def network_nodes(self) -> List[dict]:
+        self._network()
+        return self.nodes
+
+    def network_disruptions(self) -> List[dict]:
+        self._network()
+        return self.disruptions
+
+    def disruption(self, disruption_id: str) -> Optional[dict]:
+        return next((d for d in self.network_disruptions() if d["id"] == disruption_id), None)
+
+    def _row(self, i: int) -> dict:
+        cat, nodes = self.categories.values, self.node_ids.values
+        return {
+            "id": self.ids[i],
+            "status": cat[self.status[i]],
+            "transport_mode": cat[self.mode[i]],
+            "priority": cat[self.priority[i]],
+            "current_location": {"lat": self.lat[i], "lon": self.lon[i]},
+            "origin_id": nodes[self.origin[i]],
+            "destination_id": nodes[self.destination[i]],
+            "contents": [dict(item) for item in self.contents.values[self.content[i]]],
+            "total_value_at_risk": self.value[i],
+            "version": self.version[i],
+        }
+
+
+store: Optional[ColumnarStore] = None
+
+
+def enable(engine) -> Optional[ColumnarStore]:
+    """Loads the store when STORAGE_MODE=memory; routers fall back to SQLite while it is None."""
+    global store
+    if STORAGE_MODE == "memory" and store is None:
+        store = ColumnarStore.load(engine)
+        print(f"Columnar store loaded: {len(store.ids)} shipments in memory.")
+    return store
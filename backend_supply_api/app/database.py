@@ -1,16 +1,56 @@
 
 from sqlmodel import SQLModel, Session, create_engine, select
+from sqlalchemy import event, text
 from pathlib import Path
+from contextlib import contextmanager
 import json
+import os
+try:
+    import fcntl
+except ImportError:  # Windows: single process only
+    fcntl = None
 from .models import Node, Product, Shipment, Disruption
+from .versions import bump_data_version
 
-sqlite_file_name = "database.db"
-sqlite_url = f"sqlite:///{sqlite_file_name}"
+sqlite_file_name = os.getenv("SQLITE_FILE", "database.db")
 
 from sqlalchemy.pool import NullPool
 
 connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, echo=False, connect_args=connect_args, poolclass=NullPool)
+
+# Several worker processes share the file (see Dockerfile). WAL lets readers run
+# alongside the one writer, and busy_timeout makes a writer wait for another
+# process's lock instead of failing with "database is locked".
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+def _configure_connection(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL") # Safe under WAL; fsync per checkpoint, not per commit
+    cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+# The writer engine serves the single writer (app/concurrency.py). pysqlite's own
+# transaction handling breaks SAVEPOINT, so it issues BEGIN itself; each queued
+# job then runs in a savepoint inside one group commit.
+def _writer_connect(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+    _configure_connection(dbapi_connection, connection_record)
+
+def _writer_begin(conn):
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+def create_engines(path: str):
+    """(engine, writer_engine) for one SQLite file; region shards use the same setup."""
+    url = f"sqlite:///{path}"
+    reader = create_engine(url, echo=False, connect_args=connect_args, poolclass=NullPool)
+    event.listen(reader, "connect", _configure_connection)
+    writer = create_engine(url, echo=False, connect_args=connect_args, poolclass=NullPool)
+    event.listen(writer, "connect", _writer_connect)
+    event.listen(writer, "begin", _writer_begin)
+    return reader, writer
+
+engine, writer_engine = create_engines(sqlite_file_name)
 
 def get_session():
     with Session(engine) as session:
@@ -18,8 +58,32 @@ def get_session():
 
 DATA_DIR = Path(__file__).parent.parent / "data"
 
-def init_db():
+def migrate(engine):
+    # create_all() does not alter existing tables; add columns introduced later.
     SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        columns = {row[1] for row in conn.execute(text("PRAGMA table_info(shipment)"))}
+        if columns and "version" not in columns:
+            conn.execute(text("ALTER TABLE shipment ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+@contextmanager
+def init_lock():
+    # Worker processes start together; only one may create, migrate and seed at a time.
+    with open(f"{sqlite_file_name}.init.lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def init_db():
+    with init_lock():
+        _init_db()
+
+def _init_db():
+    migrate(engine)
     
     # Check if data exists
     with Session(engine) as session:
@@ -47,8 +111,16 @@ def init_db():
                         session.add(Disruption(**item))
                         
                 session.commit()
+                bump_data_version()
                 print("Data loaded successfully.")
             except Exception as e:
                 print(f"Error loading data: {e}")
         else:
             print("Database already initialized.")
+    
+    # Value-at-risk rollups are derived data: recompute them from the rows on
+    # every start so they can never disagree with the shipments table.
+    from .rollups import rebuild
+    with Session(engine) as session:
+        rebuild(session)
+        session.commit()
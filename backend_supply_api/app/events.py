@@ -0,0 +1,417 @@
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import delete, event, func, insert, inspect, select, tuple_
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+from .models import Shipment, ShipmentEvent
+
+try:
+    import fcntl
+except ImportError:  # Windows: single process only
+    fcntl = None
+
+# Every shipment change is appended to the ShipmentEvent table in the same
+# transaction as the change: full rows for inserts, only the changed fields for
+# updates. Snapshots of the whole table are written to `<db>.snapshots/` once
+# the log since the last one is as long as the table, so their cost per event
+# stays bounded. State is recovered from the newest snapshot plus the events
+# after it. ORM writes are logged automatically; Core UPDATEs
+# (compare_and_swap) call record() themselves.
+
+SNAPSHOT_MIN_EVENTS = int(os.getenv("EVENT_SNAPSHOT_MIN_EVENTS", "1000"))
+SNAPSHOT_TAIL_RATIO = float(os.getenv("EVENT_SNAPSHOT_TAIL_RATIO", "1.0")) # Tail events per live shipment
+RETENTION_S = float(os.getenv("EVENT_RETENTION_DAYS", "30")) * 86400 # Older events are pruned once snapshotted
+KEEP_SNAPSHOTS = 2 # The previous one is a fallback if the newest is unreadable
+COMPACT_INTERVAL_S = 5.0
+PRUNE_BATCH = 5000
+HISTORY_LIMIT = 100
+
+_table = ShipmentEvent.__table__
+_MOVING = "shipment_event_moving"
+_FIELDS = tuple(c.name for c in Shipment.__table__.columns if c.name not in ("id", "version"))
+
+
+class RecoveryError(Exception):
+    pass
+
+
+# --- Recording ---
+
+def _entry(shipment_id: str, kind: str, version: int, changes: Optional[dict], at: float) -> dict:
+    return {"shipment_id": shipment_id, "version": version, "kind": kind, "changes": changes or {}, "at": at}
+
+
+def record(session, shipment_id: str, kind: str, version: int, changes: Optional[dict] = None):
+    """Appends one event inside the session's current transaction."""
+    session.connection().execute(insert(_table), [_entry(shipment_id, kind, version, changes, time.time())])
+
+
+@contextmanager
+def moving(session):
+    """Logs the inserts and deletes flushed inside as a shard move, not a create or delete."""
+    session.info[_MOVING] = True
+    try:
+        yield
+        session.flush()
+    finally:
+        session.info.pop(_MOVING, None)
+
+
+def _changed(shipment: Shipment) -> dict:
+    state = inspect(shipment)
+    return {name: getattr(shipment, name) for name in _FIELDS if state.attrs[name].history.has_changes()}
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _log_orm_writes(session, flush_context):
+    # Attribute history still holds the flushed changes here, and the version
+    # bump from changes.py has already been applied.
+    moving = session.info.get(_MOVING, False)
+    now = time.time()
+    entries = []
+    for obj in session.new:
+        if isinstance(obj, Shipment):
+            row = {name: getattr(obj, name) for name in _FIELDS}
+            entries.append(_entry(obj.id, "moved_in" if moving else "created", obj.version, row, now))
+    for obj in session.dirty:
+        if isinstance(obj, Shipment) and session.is_modified(obj):
+            changed = _changed(obj)
+            if changed:
+                entries.append(_entry(obj.id, "updated", obj.version, changed, now))
+    for obj in session.deleted:
+        if isinstance(obj, Shipment):
+            entries.append(_entry(obj.id, "moved_out" if moving else "deleted", obj.version, None, now))
+    if entries:
+        session.connection().execute(insert(_table), entries)
+
+
+# --- History ---
+
+def _history(session, shipment_id: str, after_version: int, limit: int, *where) -> List[dict]:
+    query = (select(_table).where(_table.c.shipment_id == shipment_id, _table.c.version > after_version, *where)
+             .order_by(_table.c.seq).limit(limit))
+    return [dict(r._mapping) for r in session.connection().execute(query)]
+
+
+def history(session, shipment_id: str, after_version: int = 0, limit: int = HISTORY_LIMIT,
+            after_seq: int = 0, shard: Optional[str] = None) -> List[dict]:
+    """Events of one shipment, oldest first. Reads the shipment_id index, not the log.
+
+    Page on the `seq` of the last event returned (and, with region shards, its
+    `shard`): several events can share a version, so `after_version` cannot.
+    Raises KeyError for a position that is not in the log (any longer).
+    """
+    from . import shards
+    if shards.shard_set is None:
+        return _history(session, shipment_id, after_version, limit, _table.c.seq > after_seq)
+    # A shipment that moved between regions has events in both shards, and the
+    # main database keeps those (shard None) from before sharding was switched
+    # on. The version orders them; within one version the copy comes before the
+    # delete. Each source logs them in that same order, so a page resumes in the
+    # source it ended in after the seq, and in the others after the position.
+    last = None
+    if after_seq:
+        if shard is not None and shard not in shards.shard_set.shards:
+            raise KeyError(shard)
+        query = select(_table.c.version, _table.c.at).where(_table.c.seq == after_seq)
+        if shard is None:
+            last = session.connection().execute(query).first()
+        else:
+            with Session(shards.shard_set.shards[shard].engine) as source:
+                last = source.connection().execute(query).first()
+        if last is None:
+            raise KeyError(after_seq)
+
+    def part(source, name: Optional[str]) -> List[dict]:
+        where = []
+        if last is not None and name == shard:
+            where.append(_table.c.seq > after_seq)
+        elif last is not None:
+            # Ties on (version, at) are broken by shard name, then seq.
+            position = tuple_(_table.c.version, _table.c.at)
+            where.append(position >= tuple(last) if (name or "") > (shard or "") else position > tuple(last))
+        return [{**e, "shard": name} for e in _history(source, shipment_id, after_version, limit, *where)]
+
+    names = {shard.engine: name for name, shard in shards.shard_set.shards.items()}
+    parts = list(shards.shard_set.scatter(lambda source: part(source, names[source.get_bind()])).values())
+    parts.append(part(session, None))
+    merged = sorted((e for p in parts for e in p), key=lambda e: (e["version"], e["at"], e["shard"] or "", e["seq"]))
+    return merged[:limit]
+
+
+# --- Snapshots ---
+
+def snapshot_dir(db_engine) -> str:
+    return f"{db_engine.url.database}.snapshots"
+
+
+def snapshots(db_engine) -> List[Tuple[int, str]]:
+    """(seq, path) of every snapshot of one database, oldest first."""
+    directory = snapshot_dir(db_engine)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    found = []
+    for name in names:
+        seq = name.split(".", 1)[0]
+        if name.endswith(".ndjson.gz") and seq.isdigit():
+            found.append((int(seq), os.path.join(directory, name)))
+    return sorted(found)
+
+
+def write_snapshot(db_engine) -> Tuple[int, str]:
+    """Writes every shipment row to a compressed snapshot file; returns (seq, path).
+
+    The log position is read before the rows, without a shared transaction, so
+    the rows may already include a few later events. Replaying those again is
+    harmless: an event sets fields to values, it never adds to them.
+    """
+    directory = snapshot_dir(db_engine)
+    os.makedirs(directory, exist_ok=True)
+    table = Shipment.__table__
+    with db_engine.connect() as conn:
+        seq = conn.execute(select(func.max(_table.c.seq))).scalar() or 0
+        path = os.path.join(directory, f"{seq:012d}.ndjson.gz")
+        tmp = f"{path}.tmp"
+        rows = conn.execution_options(yield_per=1000).execute(select(table).order_by(table.c.id))
+        with open(tmp, "wb") as raw:
+            with gzip.open(raw, "wt", compresslevel=1) as f:
+                f.write(json.dumps({"seq": seq, "at": time.time()}) + "\n")
+                for row in rows:
+                    f.write(json.dumps(dict(row._mapping), separators=(",", ":")) + "\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    for _, old in snapshots(db_engine)[:-KEEP_SNAPSHOTS]:
+        os.remove(old)
+    return seq, path
+
+
+def _load_snapshot(path: str) -> Tuple[Dict[str, dict], int]:
+    with gzip.open(path, "rt") as f:
+        header = json.loads(next(f))
+        state = {}
+        for line in f:
+            row = json.loads(line)
+            state[row["id"]] = row
+    return state, header["seq"]
+
+
+def apply(state: Dict[str, dict], kind: str, shipment_id: str, version: int, changes: dict):
+    """Applies one event to `state` (shipment id -> row)."""
+    if kind in ("created", "moved_in"):
+        state[shipment_id] = {**changes, "id": shipment_id, "version": version}
+    elif kind == "updated":
+        row = state.get(shipment_id)
+        if row is not None: # Otherwise deleted by a later event already in the snapshot
+            row.update(changes)
+            row["version"] = version
+    else:
+        state.pop(shipment_id, None)
+
+
+def recover(db_engine) -> Tuple[Dict[str, dict], dict]:
+    """Shipment rows rebuilt from the newest readable snapshot plus the events after it.
+
+    Returns (rows by id, stats).
+    """
+    started = time.perf_counter()
+    state: Dict[str, dict] = {}
+    seq = 0
+    for _, path in reversed(snapshots(db_engine)):
+        try:
+            state, seq = _load_snapshot(path)
+            break
+        except (OSError, EOFError, ValueError, KeyError, StopIteration) as e:
+            print(f"Skipping unreadable snapshot {path}: {e}")
+    loaded = time.perf_counter()
+    replayed = 0
+    with db_engine.connect() as conn:
+        first = conn.execute(select(func.min(_table.c.seq)).where(_table.c.seq > seq)).scalar()
+        if first is not None and first > seq + 1:
+            raise RecoveryError(f"Events {seq + 1}..{first - 1} were pruned and no snapshot covers them")
+        query = select(_table).where(_table.c.seq > seq).order_by(_table.c.seq)
+        for e in conn.execution_options(yield_per=5000).execute(query):
+            apply(state, e.kind, e.shipment_id, e.version, e.changes)
+            seq = e.seq
+            replayed += 1
+    return state, {"snapshot_s": round(loaded - started, 4), "replayed": replayed,
+                   "replay_s": round(time.perf_counter() - loaded, 4), "seq": seq, "shipments": len(state)}
+
+
+def prune(db_engine, queue) -> int:
+    """Deletes events older than the retention period that the oldest kept snapshot covers."""
+    kept = snapshots(db_engine)
+    if not kept:
+        return 0
+    floor, cutoff = kept[0][0], time.time() - RETENTION_S
+    ids = (select(_table.c.seq).where(_table.c.seq <= floor, _table.c.at < cutoff)
+           .order_by(_table.c.seq).limit(PRUNE_BATCH).scalar_subquery())
+
+    def job(session):
+        return session.connection().execute(delete(_table).where(_table.c.seq.in_(ids))).rowcount
+
+    pruned = 0
+    while True:
+        n = queue.submit(job).result()
+        pruned += n
+        if n < PRUNE_BATCH:
+            return pruned
+
+
+# --- Compaction ---
+
+@contextmanager
+def _compaction_lock(db_engine):
+    # Worker processes share the files; whoever gets the lock compacts.
+    os.makedirs(snapshot_dir(db_engine), exist_ok=True)
+    with open(os.path.join(snapshot_dir(db_engine), ".lock"), "w") as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def targets() -> List[tuple]:
+    """(engine, write queue) of every database holding shipments."""
+    from . import shards
+    from .concurrency import writer
+    from .database import engine
+    found = [(engine, writer)]
+    if shards.shard_set is not None:
+        found += [(shard.engine, shard.writer) for shard in shards.shard_set.shards.values()]
+    return found
+
+
+class Compactor:
+    """Background thread snapshotting and pruning each database's event log.
+
+    A snapshot is due when there is none yet (e.g. a database older than the
+    log) or when the events since the last one outnumber the live shipments
+    `SNAPSHOT_TAIL_RATIO` to one. Each event therefore costs at most
+    1 / SNAPSHOT_TAIL_RATIO snapshot rows, and recovery replays at most that
+    many events per shipment.
+    """
+
+    def __init__(self, interval_s: float = COMPACT_INTERVAL_S):
+        self.interval_s = interval_s
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.snapshots = 0
+        self.pruned = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="event-compactor", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Event log compaction failed: {e}")
+            time.sleep(self.interval_s)
+
+    def due(self, db_engine) -> bool:
+        kept = snapshots(db_engine)
+        with db_engine.connect() as conn:
+            last = conn.execute(select(func.max(_table.c.seq))).scalar() or 0
+            if not kept:
+                return True
+            tail = last - kept[-1][0]
+            live = conn.execute(select(func.count()).select_from(Shipment.__table__)).scalar()
+        return tail >= max(SNAPSHOT_MIN_EVENTS, SNAPSHOT_TAIL_RATIO * live)
+
+    def run_once(self) -> int:
+        """Snapshots and prunes every database that is due. Returns how many snapshots were written."""
+        written = 0
+        for db_engine, queue in targets():
+            if not self.due(db_engine):
+                continue
+            with _compaction_lock(db_engine) as acquired:
+                if not acquired or not self.due(db_engine):
+                    continue
+                write_snapshot(db_engine)
+                self.pruned += prune(db_engine, queue)
+            written += 1
+        self.snapshots += written
+        return written
+
+
+compactor = Compactor()
+
+
+# --- Command line ---
+
+def restore(db_engine, rows: Dict[str, dict]):
+    """Replaces the shipment table with `rows` without logging, since they come from the log."""
+    from .rollups import rebuild
+    table = Shipment.__table__
+    with Session(db_engine) as session:
+        conn = session.connection()
+        conn.execute(delete(table))
+        if rows:
+            conn.execute(table.insert(), list(rows.values()))
+        rebuild(session)
+        session.commit()
+
+
+def _table_rows(db_engine) -> Iterator[dict]:
+    with db_engine.connect() as conn:
+        for row in conn.execute(select(Shipment.__table__)):
+            yield dict(row._mapping)
+
+
+def main(argv: List[str]) -> int:
+    """python -m app.events [verify|snapshot|restore]
+
+    verify   rebuilds state from snapshot + log and compares it with the table
+    snapshot writes a snapshot now
+    restore  replaces the shipment table with the rebuilt state (server stopped)
+    """
+    from . import shards
+    from .database import sqlite_file_name
+    command = argv[0] if argv else "verify"
+    if command not in ("verify", "snapshot", "restore"):
+        print(main.__doc__)
+        return 2
+    if shards.SHARDING == "region":
+        shards.shard_set = shards.ShardSet(sqlite_file_name) # Existing files only; no moves
+    status = 0
+    for db_engine, _ in targets():
+        name = db_engine.url.database
+        if command == "snapshot":
+            seq, path = write_snapshot(db_engine)
+            print(f"{name}: snapshot at event {seq} -> {path}")
+            continue
+        rows, stats = recover(db_engine)
+        if command == "restore":
+            restore(db_engine, rows)
+            print(f"{name}: restored {len(rows)} shipments {stats}")
+            continue
+        table = {row["id"]: row for row in _table_rows(db_engine)}
+        differ = sorted(sid for sid in set(rows) | set(table) if rows.get(sid) != table.get(sid))
+        print(f"{name}: {len(differ)} of {len(table)} shipments differ from the log {stats}"
+              + (f", e.g. {differ[:5]}" if differ else ""))
+        status = status or (1 if differ else 0)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
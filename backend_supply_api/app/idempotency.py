@@ -0,0 +1,66 @@
+import hashlib
+import json
+import time
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from sqlmodel import Session, select
+from .models import IdempotencyRecord
+
+REPLAY_HEADER = "Idempotent-Replayed"
+TTL_SECONDS = 24 * 3600  # Retries older than this are treated as new requests
+
+
+def fingerprint(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def suffix(key: str) -> str:
+    """Deterministic 6-char id suffix for shipments created under `key`."""
+    return hashlib.sha256(key.encode()).hexdigest()[:6]
+
+
+def _check(record: Optional[IdempotencyRecord], request_hash: str) -> Optional[dict]:
+    if record is None or record.created_at < time.time() - TTL_SECONDS:
+        return None
+    if record.request_hash != request_hash:
+        raise HTTPException(status_code=422, detail=f"Idempotency key {record.key} was already used for a different request")
+    return record.response
+
+
+def lookup(session: Session, key: Optional[str], request_hash: str) -> Optional[dict]:
+    """Stored response for `key`, or None if the request has not been executed yet."""
+    if not key:
+        return None
+    return _check(session.get(IdempotencyRecord, key), request_hash)
+
+
+def lookup_many(session: Session, keyed: List[Tuple[Optional[str], str]]) -> List[Optional[dict]]:
+    """`lookup` for many (key, request_hash) pairs with a single query."""
+    keys = [k for k, _ in keyed if k]
+    records = {}
+    if keys:
+        records = {r.key: r for r in session.exec(select(IdempotencyRecord).where(IdempotencyRecord.key.in_(keys))).all()}
+    return [_check(records.get(k), h) if k else None for k, h in keyed]
+
+
+def remember(session: Session, key: Optional[str], request_hash: str, response: dict):
+    """Stages the response in the caller's transaction, so it commits with the mutation."""
+    remember_many(session, [(key, request_hash, response)])
+
+
+def remember_many(session: Session, entries: List[Tuple[Optional[str], str, dict]]):
+    entries = [e for e in entries if e[0]]
+    if not entries:
+        return
+    now = time.time()
+    with session.no_autoflush:
+        existing = {r.key: r for r in session.exec(
+            select(IdempotencyRecord).where(IdempotencyRecord.key.in_([e[0] for e in entries]))).all()}
+    for key, request_hash, response in entries:
+        record = existing.get(key)
+        if record is not None:
+            # Only reachable once the old record expired.
+            record.request_hash, record.response, record.created_at = request_hash, response, now
+            session.add(record)
+        else:
+            session.add(IdempotencyRecord(key=key, request_hash=request_hash, response=response, created_at=now))
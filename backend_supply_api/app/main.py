@@ -1,11 +1,118 @@
 
+import importlib
+import threading
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .database import init_db
-from .routes import network, shipments, actions
+from fastapi.responses import JSONResponse
+from . import admission, columnar, shards
+from .database import engine, init_db
 
-app = FastAPI(title="Supply Guardian API")
+# Router modules (app/routes/*) by the path prefixes they serve. Each is imported
+# on the first request under one of its prefixes, or by the warm-up thread,
+# whichever comes first. The OpenAPI docs need all of them.
+ROUTERS = {
+    "network": ("/network",),
+    "shipments": ("/shipments", "/products"),
+    "actions": ("/actions",),
+    "rollups": ("/rollups",),
+    "bulk": ("/export", "/import"),
+}
+_DOCS = ("/docs", "/redoc", "/openapi.json")
 
+# Warm-up waits for the first response (or this long) so that, on one core, it
+# does not compete with the request that woke the instance up.
+WARM_UP_DELAY_S = 1.0
+WARM_UP_ATTEMPTS = 3
+WARM_UP_RETRY_S = 1.0 # Times the attempt number
+
+_included = set()
+_include_lock = threading.Lock()
+_warm_up = {"pending": ["routers", "quote_rules", "quotes"], "error": None}
+_first_response = threading.Event()
+
+
+def include_router(name: str):
+    if name in _included:
+        return
+    with _include_lock:
+        if name not in _included:
+            app.include_router(importlib.import_module(f".routes.{name}", __package__).router)
+            app.openapi_schema = None # Regenerated with the new routes
+            _included.add(name)
+
+
+class ColdStart:
+    """Includes the router serving a request's path before the request is routed,
+    and lets warm-up start once the first response is out."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and len(_included) < len(ROUTERS):
+            path = scope["path"]
+            for name, prefixes in ROUTERS.items():
+                if name not in _included and path.startswith(prefixes + _DOCS):
+                    include_router(name)
+        await self.app(scope, receive, send)
+        if not _first_response.is_set():
+            _first_response.set()
+
+
+def startup():
+    """What must finish before the first request: schema, seed data and storage mode."""
+    init_db()
+    if shards.enable() is not None:
+        if columnar.STORAGE_MODE == "memory":
+            print("STORAGE_MODE=memory is ignored when SHARDING=region.")
+    else:
+        columnar.enable(engine)
+
+
+def warm_up():
+    """Everything a first request would otherwise pay for; runs after startup,
+    while requests are already being served. /ready reports when it is done.
+
+    A failing step is retried; if it still fails, the instance reports ready
+    with the error, since the API serves without it (only more slowly) and the
+    precompute loop keeps retrying on its own.
+    """
+    _first_response.wait(WARM_UP_DELAY_S)
+    from . import events, rules
+    from .quote_cache import precomputer
+    steps = {"routers": lambda: [include_router(name) for name in ROUTERS],
+             "quote_rules": rules.current, "quotes": precomputer.run_once}
+    errors = []
+    for name, step in steps.items():
+        for attempt in range(1, WARM_UP_ATTEMPTS + 1):
+            try:
+                step()
+                break
+            except Exception as e:
+                print(f"Warm-up step {name} failed (attempt {attempt} of {WARM_UP_ATTEMPTS}): {e}")
+                if attempt == WARM_UP_ATTEMPTS:
+                    errors.append(f"{name}: {e}")
+                    _warm_up["error"] = "; ".join(errors)
+                else:
+                    time.sleep(WARM_UP_RETRY_S * attempt)
+        _warm_up["pending"].remove(name)
+    precomputer.start()
+    events.compactor.start()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    yield
+
+
+app = FastAPI(title="Supply Guardian API", lifespan=lifespan)
+
+# Inside CORS, so shed requests still carry the CORS headers.
+app.add_middleware(admission.AdmissionControl)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -13,16 +120,24 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-# Connect Routes
-app.include_router(network.router)
-app.include_router(shipments.router)
-app.include_router(actions.router)
+app.add_middleware(ColdStart)
 
 @app.get("/")
 def read_root():
     return {"message": "Supply Chain Guardian API"}
 
-@app.on_event("startup")
-def on_startup():
-    init_db()
+@app.get("/ready")
+def read_ready():
+    # 503 until routers are loaded and the quote cache is warm; the API already
+    # answers before that, only more slowly. A step that kept failing is
+    # reported in "error" rather than left pending.
+    body = {"ready": not _warm_up["pending"], "pending": list(_warm_up["pending"]), "error": _warm_up["error"]}
+    if body["pending"]:
+        return JSONResponse(body, status_code=503, headers={"Retry-After": "1"})
+    return body
+
+@app.get("/admission")
+async def read_admission():
+    # Queue depth, in-flight and shed counts per route class and priority. Runs on
+    # the event loop, like the controller itself.
+    return admission.stats()
@@ -32,6 +32,8 @@ class Shipment(SQLModel, table=True):
     contents: List[Dict] = Field(default=[], sa_column=Column(JSON))
     
     total_value_at_risk: float
+    
+    version: int = Field(default=1) # Bumped on every write; see app/concurrency.py
 
 class Disruption(SQLModel, table=True):
     id: str = Field(primary_key=True)
@@ -43,6 +45,32 @@ class Disruption(SQLModel, table=True):
     radius_km: float
     affected_modes: List[str] = Field(default=[], sa_column=Column(JSON))
 
+class IdempotencyRecord(SQLModel, table=True):
+    key: str = Field(primary_key=True)
+    request_hash: str # Same key with a different request is rejected
+    response: Dict = Field(default={}, sa_column=Column(JSON))
+    created_at: float
+
+class ValueRollup(SQLModel, table=True):
+    # Materialized value-at-risk totals, maintained in the same transaction as
+    # every shipment write (see app/rollups.py).
+    dimension: str = Field(primary_key=True) # destination, disruption, mode, seasonal_sku
+    key: str = Field(primary_key=True)
+    status: str = Field(primary_key=True)
+    shipments: int = 0
+    value_cents: int = 0 # Integer cents, so +/- deltas never drift from the rows
+
+class ShipmentEvent(SQLModel, table=True):
+    # Append-only log of shipment changes, written in the same transaction as
+    # the change itself (see app/events.py).
+    __table_args__ = {"sqlite_autoincrement": True} # Pruned sequence numbers are never reused
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    shipment_id: str = Field(index=True) # Per-shipment index; SQLite appends seq to it
+    version: int # Shipment version after the change
+    kind: str # created, updated, deleted, moved_in, moved_out (region shards)
+    changes: Dict = Field(default={}, sa_column=Column(JSON)) # Full row when created, changed fields when updated
+    at: float
+
 # --- Pydantic Schemas (API Request/Response) ---
 
 class Location(BaseModel):
@@ -56,11 +84,66 @@ class QuoteOption(BaseModel):
     transit_time_hours: int
     co2_kg: float
     description: Optional[str] = None
+    # Ranking (see app/ranking.py)
+    pareto_optimal: bool = True # No other option is cheaper, faster AND greener
+    dominated_by: Optional[str] = None
+    score: Optional[float] = None # Weighted cost in USD, lower is better
+    rank: Optional[int] = None
 
 class QuoteResponse(BaseModel):
     shipment_id: str
     options: List[QuoteOption]
+    recommended_option_id: Optional[str] = None
+
+class RankingWeights(BaseModel):
+    # Every objective is converted to USD so the score is comparable across shipments.
+    time_value_rate: float = 0.00005 # Share of value at risk lost per hour in transit
+    critical_multiplier: float = 3.0 # Applied to the time value of Critical shipments
+    seasonal_multiplier: float = 2.0 # Applied when any SKU is seasonal
+    co2_price_per_kg: float = 0.05
+    cost_weight: float = 1.0
+
+class QuoteBatchRequest(BaseModel):
+    shipment_ids: Optional[List[str]] = None
+    statuses: List[str] = ["Stuck", "Delayed"] # Used when shipment_ids is empty
+    weights: Optional[RankingWeights] = None
 
 class RerouteRequest(BaseModel):
     shipment_id: str
     new_route_id: str
+    idempotency_key: Optional[str] = None # Also accepted as the Idempotency-Key header
+    expected_version: Optional[int] = None # Reject with 409 if the shipment changed since it was read
+
+class RerouteBatchRequest(BaseModel):
+    items: List[RerouteRequest]
+    idempotency_key: Optional[str] = None # Replays the whole batch response
+
+class PlanRequest(BaseModel):
+    shipment_ids: Optional[List[str]] = None # Default: every Stuck Truck/Rail shipment
+    time_budget_ms: int = 500
+    anytime: bool = True # Stop at the budget with the best plan so far; False runs to optimality
+    capacity_overrides: Dict[str, int] = {} # Node id -> rescue dispatches available
+    weights: Optional[RankingWeights] = None
+
+class PlanAssignment(BaseModel):
+    shipment_id: str
+    source_id: str
+    route_id: str # Pass to /actions/reroute to execute
+    cost_usd: float
+    transit_time_hours: int
+    score: float
+
+class PlanResponse(BaseModel):
+    assignments: List[PlanAssignment]
+    unassigned: List[str] # Rescue costs more than the goods, or no capacity left
+    total_score: float
+    baseline_score: float # Every shipment taking its own best source, ignoring capacity
+    baseline_overbooked: List[str] # Sources the baseline would overbook
+    optimal: bool
+    iterations: int
+    elapsed_ms: float
+
+class RollupGroup(BaseModel):
+    key: str
+    shipments: int
+    value_at_risk: float
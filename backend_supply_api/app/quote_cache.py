@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+from .database import engine
+from .models import Shipment
+from .quotes import quote_many, world_state
+from .ranking import DEFAULT_WEIGHTS, seasonal_skus
+from . import changes, rules, shards, versions
+
+MAX_ENTRIES = 4096 # Room for on-demand quotes, on top of the precomputed set
+PRECOMPUTE_STATUSES = ("Stuck", "Delayed")
+PRECOMPUTE_MAX = 50_000 # Shipments kept warm at most, Critical and most valuable first
+PRECOMPUTE_INTERVAL_S = 5.0 # Also catches writes by other worker processes
+PRECOMPUTE_DEBOUNCE_S = 0.2 # A pass after a commit waits this long for the rest of a burst
+
+
+def quote_key(shipment: Shipment, data_version: Optional[int] = None, rules_version: Optional[int] = None) -> tuple:
+    """A quote is a pure function of the shipment row, the shared world state and the quote rules."""
+    return (shipment.id, shipment.version, versions.data_version() if data_version is None else data_version,
+            rules.version() if rules_version is None else rules_version)
+
+
+class QuoteCache:
+    """Bounded LRU of default-weight QuoteResponse bodies with single-flight fills.
+
+    Keys carry the versions of every input, so a write never has to find and
+    evict entries: the next read simply asks for a new key. Only the newest key
+    per shipment is kept, and concurrent misses on one key share a single
+    computation.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._latest: Dict[str, tuple] = {}
+        self._inflight: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: tuple) -> Optional[dict]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def put(self, key: tuple, value: dict):
+        with self._lock:
+            self._store(key, value)
+
+    def resize(self, max_entries: int):
+        with self._lock:
+            self.max_entries = max_entries
+            self._evict()
+
+    def _store(self, key: tuple, value: dict):
+        previous = self._latest.get(key[0])
+        if previous is not None and previous != key:
+            if previous[1:] > key[1:]:
+                return  # A slower fill finished after a newer one
+            self._entries.pop(previous, None)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._latest[key[0]] = key
+        self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            if self._latest.get(evicted[0]) == evicted:
+                del self._latest[evicted[0]]
+
+    def claim(self, key: tuple) -> Tuple[Future, bool]:
+        """(future, owner). The owner must `settle` the future; everyone else waits on it.
+
+        A cached key comes back as an already completed future.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self.hits += 1
+                future = Future()
+                future.set_result(value)
+                return future, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            self.misses += 1
+            return future, True
+
+    def settle(self, key: tuple, future: Future, value: Optional[dict] = None, error: Optional[BaseException] = None):
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is None:
+                self._store(key, value)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    async def get_many(self, keys: List[tuple], compute: Callable[[List[int]], List[dict]]) -> List[dict]:
+        """Cached values for `keys`; misses nobody else is computing go to one
+        `compute(indexes)` call, run off the event loop."""
+        values: List[Optional[dict]] = [self.get(k) for k in keys]
+        owned, waiting = [], []
+        for i, key in enumerate(keys):
+            if values[i] is None:
+                future, owner = self.claim(key)
+                (owned if owner else waiting).append((i, future))
+        if owned:
+            try:
+                computed = await run_in_threadpool(compute, [i for i, _ in owned])
+            except BaseException as e:
+                for i, future in owned:
+                    self.settle(keys[i], future, error=e)
+                raise
+            for (i, future), value in zip(owned, computed):
+                self.settle(keys[i], future, value)
+                values[i] = value
+        for i, future in waiting:
+            values[i] = await asyncio.wrap_future(future)
+        return values
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "inflight": len(self._inflight),
+                    "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+
+class QuotePrecomputer:
+    """Background thread keeping quotes for every Stuck/Delayed shipment warm.
+
+    Each pass claims the keys that are neither cached nor being computed, quotes
+    them in one batch and settles the claims, so a request arriving mid-pass
+    waits for the pass instead of computing the same quote again. A commit in
+    this process starts a pass right away; the interval covers the rest. The
+    cache is sized to hold the whole precomputed set, so a pass never evicts
+    what it just computed.
+    """
+
+    def __init__(self, cache: QuoteCache, engine, interval_s: float = PRECOMPUTE_INTERVAL_S):
+        self.cache = cache
+        self.engine = engine
+        self.interval_s = interval_s
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.passes = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="quote-precompute", daemon=True)
+                self._thread.start()
+                changes.subscribe(self.notify)
+
+    def notify(self, shipment_ids=None, shipments_version=None):
+        """Run a pass now instead of at the next interval. Subscribed to commits."""
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Quote precompute failed: {e}")
+            if self._wake.wait(self.interval_s):
+                time.sleep(PRECOMPUTE_DEBOUNCE_S)
+            self._wake.clear()
+
+    def run_once(self) -> int:
+        """Quotes every uncached Stuck/Delayed shipment. Returns how many were computed."""
+        data_version = versions.data_version()
+        ruleset = rules.current()
+        with Session(self.engine) as session:
+            shipments = shards.query_shipments(session, Shipment.status.in_(PRECOMPUTE_STATUSES), ordered=True)
+            if len(shipments) > PRECOMPUTE_MAX:
+                shipments = sorted(shipments, key=lambda s: (s.priority != "Critical", -s.total_value_at_risk))[:PRECOMPUTE_MAX]
+            self.cache.resize(MAX_ENTRIES + len(shipments))
+            claimed = []
+            for s in shipments:
+                key = quote_key(s, data_version, ruleset.version)
+                future, owner = self.cache.claim(key)
+                if owner:
+                    claimed.append((s, key, future))
+            if not claimed:
+                self.passes += 1
+                return 0
+            try:
+                world_version, nodes, disruptions = world_state(session)
+                bodies = quote_many([s for s, _, _ in claimed], nodes, disruptions,
+                                    seasonal_skus(session), DEFAULT_WEIGHTS, ruleset, world_version)
+            except BaseException as e:
+                for _, key, future in claimed:
+                    self.cache.settle(key, future, error=e)
+                raise
+        for (_, key, future), body in zip(claimed, bodies):
+            self.cache.settle(key, future, body)
+        self.passes += 1
+        return len(claimed)
+
+
+cache = QuoteCache()
+precomputer = QuotePrecomputer(cache, engine)
@@ -0,0 +1,168 @@
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from sqlmodel import select
+from .models import Disruption, Node, RankingWeights, Shipment
+from .ranking import rank_quotes
+from .routing import RoutePlanner, get_planner, describe_route, value_rate
+from . import rules, versions
+
+_world_lock = threading.Lock()
+_world: Optional[Tuple[int, list, list]] = None
+
+
+def calculate_distance_km(loc1_dict: dict, loc2_dict: dict) -> float:
+    lat1, lon1 = loc1_dict.get('lat', 0), loc1_dict.get('lon', 0)
+    lat2, lon2 = loc2_dict.get('lat', 0), loc2_dict.get('lon', 0)
+
+    R = 6371  # Earth radius in km
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat/2) * math.sin(dlat/2) + \
+        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * \
+        math.sin(dlon/2) * math.sin(dlon/2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    return R * c
+
+
+def shipment_facts(shipment: Shipment, disruptions) -> rules.Facts:
+    active = next((d for d in disruptions
+                   if calculate_distance_km(d.location, shipment.current_location) <= d.radius_km), None)
+    return rules.Facts(shipment.transport_mode, shipment.priority, shipment.total_value_at_risk,
+                       active.type if active else None)
+
+
+def world_state(session) -> Tuple[int, list, list]:
+    """(data version, nodes, disruptions), reloaded only when the data version moves.
+
+    The version is read before the rows, so rows cached under a version are
+    never older than it.
+    """
+    global _world
+    version = versions.data_version()
+    world = _world
+    if world is None or world[0] != version:
+        with _world_lock:
+            world = _world
+            if world is None or world[0] != version:
+                nodes = session.exec(select(Node)).all()
+                disruptions = session.exec(select(Disruption)).all()
+                for row in (*nodes, *disruptions):
+                    session.expunge(row) # Shared across requests and threads from here on
+                world = _world = (version, nodes, disruptions)
+    return world
+
+
+class _RouteSearch:
+    """The planner queries behind each option `source`, memoized for one batch.
+
+    Shipments in a batch share origins, destinations and candidate pools, so
+    most searches after the first few are dictionary hits.
+    """
+
+    def __init__(self, planner: RoutePlanner):
+        self.planner = planner
+        self.warehouses = planner.graph.by_type.get("Warehouse", [])
+        self.ports = planner.graph.by_type.get("Port", [])
+        self._memo: Dict[tuple, list] = {}
+
+    def routes(self, spec: rules.OptionSpec, s: Shipment) -> List[dict]:
+        loc = (s.current_location.get("lat", 0), s.current_location.get("lon", 0))
+        key = {
+            "origin": (s.origin_id,),
+            "current": (loc, s.transport_mode),
+            "divert": (loc,),
+            "warehouses": (spec.choices,),
+            "ports": (s.origin_id, spec.choices),
+        }[spec.source] + (spec.source, spec.modes, s.destination_id)
+        found = self._memo.get(key)
+        if found is None:
+            found = self._memo[key] = self._search(spec, s)
+        return found
+
+    def _search(self, spec: rules.OptionSpec, s: Shipment) -> List[dict]:
+        planner, dest = self.planner, s.destination_id
+        if spec.source == "origin":
+            route = planner.shortest_path(s.origin_id, dest, modes=spec.modes)
+        elif spec.source == "current":
+            # Unload at the nearest reachable node, then continue.
+            route = planner.shortest_path(s.current_location, dest, modes=spec.modes, access_mode=s.transport_mode)
+        elif spec.source == "divert":
+            divert = planner.k_shortest_paths(s.current_location, dest, 2, modes=spec.modes, access_mode=spec.modes[0])
+            if not divert:
+                return []
+            alternatives = "; alternative: " + describe_route(divert[1]) if len(divert) > 1 else ""
+            return [{**divert[0], "description": describe_route(divert[0]) + alternatives}]
+        else:
+            # Candidate pools exclude the shipment's own ends; disrupted
+            # nodes have every edge of the mode pruned, so they never win.
+            exclude = {dest} if spec.source == "warehouses" else {dest, s.origin_id}
+            pool = self.warehouses if spec.source == "warehouses" else self.ports
+            return planner.best_origins([n for n in pool if n not in exclude], dest, spec.choices, modes=spec.modes)
+        return [route] if route else []
+
+
+def build_options_many(shipments: Sequence[Shipment], nodes, disruptions,
+                       ruleset: Optional[rules.RuleSet] = None, data_version: Optional[int] = None) -> List[list]:
+    """Unranked rescue options per shipment, as the quote rules prescribe.
+
+    Routes are searched per option, then every option row is priced in one
+    pass per option spec through its compiled formulas. Pass the
+    `data_version` the rows were loaded at (see `world_state`) so the planner
+    lookup does not have to hash them.
+    """
+    ruleset = ruleset or rules.current()
+    planner = get_planner(nodes, disruptions, data_version)
+    search = _RouteSearch(planner)
+    graph_nodes = planner.graph.nodes
+    all_options: List[list] = [[] for _ in shipments]
+    rows: Dict[int, tuple] = {} # id(spec) -> (spec, [(shipment index, route)])
+    for i, s in enumerate(shipments):
+        rule = ruleset.match(shipment_facts(s, disruptions))
+        for spec in rule.options if rule else ():
+            for route in search.routes(spec, s):
+                rows.setdefault(id(spec), (spec, []))[1].append((i, route))
+
+    for spec, spec_rows in rows.values():
+        columns = [[] for _ in rules.VARIABLES]
+        for i, route in spec_rows:
+            s = shipments[i]
+            row = (route["cost_usd"], value_rate(route), route["hours"], route["co2_kg"], route["km"],
+                   s.total_value_at_risk, s.priority == "Critical")
+            for column, v in zip(columns, row):
+                column.append(v)
+        for (i, route), outputs in zip(spec_rows, spec.evaluate(columns)):
+            if outputs is None:
+                continue # The formulas cannot price this row; the shipment keeps its other options
+            cost, hours, co2 = outputs
+            origin_id = route.get("origin_id") or shipments[i].origin_id
+            origin = graph_nodes.get(origin_id)
+            fields = {"origin_id": origin_id, "origin_name": origin["name"] if origin else origin_id,
+                      "km": int(route["km"]), "shipment_id": shipments[i].id}
+            description = spec.description.format(**fields) if spec.description else None
+            all_options[i].append({
+                "id": spec.id.format(**fields),
+                "type": spec.label.format(**fields),
+                "cost_usd": int(cost),
+                "transit_time_hours": int(math.ceil(hours)),
+                "co2_kg": round(co2, 1),
+                "description": description or route.get("description") or describe_route(route),
+            })
+    return all_options
+
+
+def build_quote_options(shipment: Shipment, nodes, disruptions) -> list:
+    """Unranked rescue options for one shipment against the given world state."""
+    return build_options_many([shipment], nodes, disruptions)[0]
+
+
+def quote_many(shipments: Sequence[Shipment], nodes, disruptions, seasonal: Set[str],
+               weights: RankingWeights, ruleset: Optional[rules.RuleSet] = None,
+               data_version: Optional[int] = None) -> List[dict]:
+    """Ranked QuoteResponse bodies for `shipments`, in the same order."""
+    all_options = build_options_many(shipments, nodes, disruptions, ruleset, data_version)
+    recommended = rank_quotes(shipments, all_options, seasonal, weights)
+    return [
+        {"shipment_id": s.id, "options": options, "recommended_option_id": rec}
+        for s, options, rec in zip(shipments, all_options, recommended)
+    ]
@@ -0,0 +1,73 @@
+from typing import List, Optional, Sequence, Set
+from sqlmodel import Session, select
+from .models import Product, RankingWeights
+
+DEFAULT_WEIGHTS = RankingWeights()
+
+
+def seasonal_skus(session: Session) -> Set[str]:
+    return set(session.exec(select(Product.sku).where(Product.is_seasonal == True)).all())  # noqa: E712
+
+
+def time_value_per_hour(shipment, seasonal: Set[str], weights: RankingWeights) -> float:
+    """USD lost per hour of transit, driven by value at risk, priority and seasonality."""
+    rate = shipment.total_value_at_risk * weights.time_value_rate
+    if shipment.priority == "Critical":
+        rate *= weights.critical_multiplier
+    if any(item.get("sku") in seasonal for item in shipment.contents or []):
+        rate *= weights.seasonal_multiplier
+    return rate
+
+
+def rank_quotes(shipments: Sequence, option_lists: List[List[dict]], seasonal: Set[str],
+                weights: RankingWeights) -> List[Optional[str]]:
+    """Scores, Pareto-marks and sorts every shipment's options in place.
+
+    All options are flattened into columns and scored in one pass, so ranking
+    thousands of shipments costs one loop rather than one call per shipment.
+    Returns the recommended option id per shipment (None when there are no options).
+    """
+    tv = [time_value_per_hour(s, seasonal, weights) for s in shipments]
+    group, cost, hours, co2 = [], [], [], []
+    for g, options in enumerate(option_lists):
+        for o in options:
+            group.append(g)
+            cost.append(o["cost_usd"])
+            hours.append(o["transit_time_hours"])
+            co2.append(o["co2_kg"])
+
+    score = [
+        weights.cost_weight * c + h * tv[g] + e * weights.co2_price_per_kg
+        for g, c, h, e in zip(group, cost, hours, co2)
+    ]
+
+    recommended = []
+    i = 0
+    for options in option_lists:
+        n = len(options)
+        for j, o in enumerate(options):
+            o["score"] = round(score[i + j], 2)
+            o["pareto_optimal"] = True
+            o["dominated_by"] = None
+        _mark_dominated(options, cost[i:i + n], hours[i:i + n], co2[i:i + n])
+        # Deterministic order: frontier first, then score, then id.
+        options.sort(key=lambda o: (not o["pareto_optimal"], o["score"], o["id"]))
+        for r, o in enumerate(options, start=1):
+            o["rank"] = r
+        recommended.append(options[0]["id"] if options else None)
+        i += n
+    return recommended
+
+
+def _mark_dominated(options: List[dict], cost, hours, co2):
+    # Quote lists are short (a handful per shipment), so the pairwise check is cheapest.
+    n = len(options)
+    for a in range(n):
+        for b in range(n):
+            if a == b:
+                continue
+            if cost[b] <= cost[a] and hours[b] <= hours[a] and co2[b] <= co2[a] and \
+                    (cost[b] < cost[a] or hours[b] < hours[a] or co2[b] < co2[a]):
+                options[a]["pareto_optimal"] = False
+                options[a]["dominated_by"] = options[b]["id"]
+                break
@@ -0,0 +1,165 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session as OrmSession
+from .models import Disruption, Product, Shipment, ValueRollup
+from .routing import haversine_km
+from . import versions
+
+DIMENSIONS = ("destination", "disruption", "mode", "seasonal_sku")
+
+# Shipment fields the rollup groups depend on.
+_FIELDS = ("status", "transport_mode", "destination_id", "current_location", "contents", "total_value_at_risk")
+
+_table = ValueRollup.__table__
+_context: Optional[Tuple[int, list, set]] = None
+
+
+def _load_context(connection) -> Tuple[list, set]:
+    """Disruptions and seasonal SKUs, reloaded only when the data version moves."""
+    global _context
+    version = versions.data_version()
+    if _context is None or _context[0] != version:
+        disruptions = [dict(r._mapping) for r in connection.execute(select(Disruption.__table__))]
+        seasonal = set(connection.execute(select(Product.sku).where(Product.is_seasonal == True)).scalars())  # noqa: E712
+        _context = (version, disruptions, seasonal)
+    return _context[1], _context[2]
+
+
+def snapshot(shipment: Shipment) -> dict:
+    return {name: getattr(shipment, name) for name in _FIELDS}
+
+
+def groups(row: dict, disruptions: list, seasonal: set) -> List[Tuple[str, str]]:
+    """Every (dimension, key) a shipment counts towards."""
+    out = [("destination", row["destination_id"]), ("mode", row["transport_mode"])]
+    loc = row["current_location"] or {}
+    for d in disruptions:
+        if row["transport_mode"] in (d["affected_modes"] or []) and haversine_km(
+                loc.get("lat", 0), loc.get("lon", 0), d["location"].get("lat", 0), d["location"].get("lon", 0)) <= d["radius_km"]:
+            out.append(("disruption", d["id"]))
+    skus = {item.get("sku") for item in row["contents"] or []}
+    out.extend(("seasonal_sku", sku) for sku in sorted(skus & seasonal))
+    return out
+
+
+def _deltas(connection, changes) -> Dict[tuple, List[int]]:
+    disruptions, seasonal = _load_context(connection)
+    deltas: Dict[tuple, List[int]] = defaultdict(lambda: [0, 0])
+    for row, sign in changes:
+        cents = int(round(row["total_value_at_risk"] * 100))
+        for dimension, key in groups(row, disruptions, seasonal):
+            d = deltas[(dimension, key, row["status"])]
+            d[0] += sign
+            d[1] += sign * cents
+    return {k: v for k, v in deltas.items() if v != [0, 0]}
+
+
+def _apply(connection, deltas: Dict[tuple, List[int]]):
+    if not deltas:
+        return
+    stmt = insert(_table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["dimension", "key", "status"],
+        set_={"shipments": _table.c.shipments + stmt.excluded.shipments,
+              "value_cents": _table.c.value_cents + stmt.excluded.value_cents})
+    connection.execute(stmt, [
+        {"dimension": dim, "key": key, "status": status, "shipments": n, "value_cents": cents}
+        for (dim, key, status), (n, cents) in deltas.items()
+    ])
+
+
+def record(session, before: Optional[dict], after: Optional[dict]):
+    """Moves one shipment's contribution from `before` to `after` (either may be None)
+    inside the session's current transaction."""
+    changes = []
+    if before is not None:
+        changes.append((before, -1))
+    if after is not None:
+        changes.append((after, 1))
+    connection = session.connection()
+    _apply(connection, _deltas(connection, changes))
+
+
+@event.listens_for(OrmSession, "before_flush")
+def _track_orm_writes(session, flush_context, instances):
+    # Inserts, deletes and attribute edits made through the ORM. Core UPDATEs
+    # (compare_and_swap) call record() themselves.
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Shipment):
+            changes.append((snapshot(obj), 1))
+    for obj in session.deleted:
+        if isinstance(obj, Shipment):
+            changes.append((_committed(obj), -1))
+    for obj in session.dirty:
+        if isinstance(obj, Shipment) and session.is_modified(obj):
+            before = _committed(obj)
+            after = snapshot(obj)
+            if before != after:
+                changes.extend([(before, -1), (after, 1)])
+    if changes:
+        connection = session.connection()
+        _apply(connection, _deltas(connection, changes))
+
+
+def _committed(shipment: Shipment) -> dict:
+    state = inspect(shipment)
+    row = {}
+    for name in _FIELDS:
+        history = state.attrs[name].history
+        row[name] = history.deleted[0] if history.deleted else getattr(shipment, name)
+    return row
+
+
+def rebuild(session):
+    """Recomputes every aggregate from the shipment rows. Needed after disruptions
+    or products change, since those move shipments between groups."""
+    connection = session.connection()
+    connection.execute(delete(_table))
+    rows = [dict(r._mapping) for r in connection.execute(select(*[Shipment.__table__.c[f] for f in _FIELDS]))]
+    _apply(connection, _deltas(connection, [(row, 1) for row in rows]))
+
+
+def raw_summary(session) -> Dict[str, List[int]]:
+    """[count, cents] per status. Every shipment has exactly one mode group, so
+    summing that dimension counts each shipment once."""
+    query = (select(_table.c.status, func.sum(_table.c.shipments), func.sum(_table.c.value_cents))
+             .where(_table.c.dimension == "mode").group_by(_table.c.status))
+    return {status: [n, cents] for status, n, cents in session.connection().execute(query)}
+
+
+def raw_totals(session, dimension: str, status: Optional[str]) -> Dict[str, List[int]]:
+    """[count, cents] per group of one dimension. Reads O(groups) rows."""
+    query = select(_table.c.key, _table.c.shipments, _table.c.value_cents).where(_table.c.dimension == dimension)
+    if status:
+        query = query.where(_table.c.status == status)
+    return merge([{key: [n, cents]} for key, n, cents in session.connection().execute(query)])
+
+
+def merge(parts: Iterable[Dict[str, List[int]]]) -> Dict[str, List[int]]:
+    """Adds up raw totals, e.g. across statuses or region shards."""
+    merged: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+    for part in parts:
+        for key, (n, cents) in part.items():
+            merged[key][0] += n
+            merged[key][1] += cents
+    return merged
+
+
+def summary(session=None, raw: Optional[Dict[str, List[int]]] = None) -> Dict[str, dict]:
+    """Count and value at risk per status."""
+    raw = raw_summary(session) if raw is None else raw
+    return {status: {"shipments": n, "value_at_risk": cents / 100} for status, (n, cents) in sorted(raw.items()) if n}
+
+
+def totals(session=None, dimension: str = "mode", status: Optional[str] = None,
+           raw: Optional[Dict[str, List[int]]] = None) -> List[dict]:
+    """Groups of one dimension, largest value first."""
+    raw = raw_totals(session, dimension, status) if raw is None else raw
+    return [
+        {"key": key, "shipments": n, "value_at_risk": cents / 100}
+        for key, (n, cents) in sorted(raw.items(), key=lambda kv: (-kv[1][1], kv[0]))
+        if n
+    ]
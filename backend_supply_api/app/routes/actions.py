@@ -1,172 +1,262 @@
 
-import math
+import asyncio
 import uuid
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Response
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
-from ..database import get_session
-from ..models import Shipment, Disruption, Node, QuoteResponse, QuoteOption, RerouteRequest
+from starlette.concurrency import run_in_threadpool
+from .. import idempotency, quote_cache, rules, shards
+from ..concurrency import compare_and_swap, conflict, writer
+from ..database import engine, get_session
+from ..models import Shipment, Node, QuoteResponse, QuoteOption, QuoteBatchRequest, RerouteRequest, RerouteBatchRequest, PlanRequest, PlanResponse
+from ..allocation import plan_rescues
+from ..quote_cache import quote_key
+from ..quotes import quote_many, world_state
+from ..ranking import DEFAULT_WEIGHTS, seasonal_skus
+from ..routing import get_planner
 
 router = APIRouter()
 
-def calculate_distance_km(loc1_dict: dict, loc2_dict: dict) -> float:
-    lat1, lon1 = loc1_dict.get('lat', 0), loc1_dict.get('lon', 0)
-    lat2, lon2 = loc2_dict.get('lat', 0), loc2_dict.get('lon', 0)
-
-    R = 6371  # Earth radius in km
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2) * math.sin(dlat/2) + \
-        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * \
-        math.sin(dlon/2) * math.sin(dlon/2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
 @router.get("/actions/quotes/{shipment_id}", response_model=QuoteResponse)
 async def get_quotes(shipment_id: str, session: Session = Depends(get_session)):
-    shipment = session.exec(select(Shipment).where(Shipment.id == shipment_id)).first()
+    # Async for the shared quote cache; every database read runs in the threadpool.
+    shipment = await run_in_threadpool(shards.find_shipment, session, shipment_id)
     if not shipment:
         raise HTTPException(status_code=404, detail="Shipment not found")
     
-    val = shipment.total_value_at_risk
-    options = []
-    
-    disruptions = session.exec(select(Disruption)).all()
-
-    # --- LOGIC BRANCH: INLAND (Truck/Rail) vs OCEAN (Sea/Air) ---
-    is_inland = shipment.transport_mode in ["Truck", "Rail"]
-    
-    if is_inland:
-        # INLAND LOGIC:
-        # 1. Expedite Air (Fly from nearest airport - generic option)
-        air_cost = int(val * 0.02 + 1500) # Slightly cheaper than international air
-        options.append({
-            "id": "OPT-AIR-EXPEDITED",
-            "type": "Expedite (Air) - Fly from nearest Airport",
-            "cost_usd": air_cost,
-            "transit_time_hours": 12, # Domestic flight speed
-            "co2_kg": 800.0
-        })
+    # Usually precomputed by the background worker; otherwise computed once
+    # for all concurrent callers.
+    quotes = await quote_cache.cache.get_many([quote_key(shipment)], lambda _: _quote_fresh([shipment]))
+    return quotes[0]
+
+@router.post("/actions/quotes/batch", response_model=List[QuoteResponse])
+async def get_quotes_batch(payload: QuoteBatchRequest = Body(default_factory=QuoteBatchRequest),
+                           session: Session = Depends(get_session)):
+    """Quotes and ranks many shipments at once (defaults to every Stuck/Delayed shipment)."""
+    if payload.shipment_ids:
+        criteria = Shipment.id.in_(payload.shipment_ids)
+    else:
+        criteria = Shipment.status.in_(payload.statuses)
+    shipments = await run_in_threadpool(shards.query_shipments, session, criteria, ordered=True)
+    
+    if payload.weights is not None:
+        # Custom weights change the ranking, so these are never cached.
+        return await run_in_threadpool(_quote_fresh, shipments, payload.weights)
+    return await quote_cache.cache.get_many(
+        [quote_key(s) for s in shipments], lambda missing: _quote_fresh([shipments[i] for i in missing]))
+
+def _quote_fresh(shipments, weights=DEFAULT_WEIGHTS) -> list:
+    # May run on a worker thread, so it reads the world state in its own session.
+    with Session(engine) as session:
+        data_version, nodes, disruptions = world_state(session)
+        return quote_many(shipments, nodes, disruptions, seasonal_skus(session), weights, data_version=data_version)
+
+@router.get("/actions/rules")
+def get_rules():
+    """The quote and reroute rules in force, and why the last edit was rejected, if it was."""
+    return rules.status()
+
+# A plain def: the planning (up to time_budget_ms of CPU) and its queries run
+# in the threadpool rather than on the event loop.
+@router.post("/actions/plan", response_model=PlanResponse)
+def plan_fleet_rescue(payload: PlanRequest, session: Session = Depends(get_session)):
+    """Assigns rescue warehouses to many stuck inland shipments at once, respecting capacity."""
+    if payload.shipment_ids:
+        criteria = Shipment.id.in_(payload.shipment_ids)
+    else:
+        criteria = Shipment.status == "Stuck"
+    shipments = shards.query_shipments(session, Shipment.transport_mode.in_(["Truck", "Rail"]), criteria, ordered=True)
+    
+    data_version, nodes, disruptions = world_state(session)
+    warehouses = [n for n in nodes if n.type == "Warehouse"]
+    
+    return plan_rescues(
+        shipments, warehouses, get_planner(nodes, disruptions, data_version), seasonal_skus(session),
+        payload.weights or DEFAULT_WEIGHTS, payload.time_budget_ms, payload.anytime,
+        payload.capacity_overrides
+    )
+
+@router.post("/actions/reroute")
+async def reroute_shipment(payload: RerouteRequest, response: Response, session: Session = Depends(get_session),
+                           idempotency_key: Optional[str] = Header(default=None)):
+    key = payload.idempotency_key or idempotency_key
+    fingerprint = idempotency.fingerprint(payload.shipment_id, payload.new_route_id)
+    
+    def job(session: Session):
+        replay = idempotency.lookup(session, key, fingerprint)
+        if replay is not None:
+            return replay, True
+        shipment = session.get(Shipment, payload.shipment_id)
+        if not shipment:
+            raise HTTPException(status_code=404, detail="Shipment not found")
+        result = apply_reroute(session, shipment, payload.new_route_id, key, expected_version=payload.expected_version)
+        idempotency.remember(session, key, fingerprint, result)
+        return result, False
+    
+    # With region shards the shipment's own shard runs the job, so the reroute,
+    # its idempotency record and rollup deltas still commit together.
+    queue, owner_engine, shard = shards.writer_for(payload.shipment_id)
+    try:
+        result, replayed = await queue.run(job)
+    except IntegrityError:
+        # Another process executed the same key first; hand back its result.
+        result, replayed = await run_in_threadpool(_lookup_in, owner_engine, key, fingerprint), True
+        if result is None:
+            raise
+    if shard is not None and not replayed:
+        await run_in_threadpool(shards.shard_set.rebalance, shard, [result.get("new_shipment_id")])
+    if replayed:
+        response.headers[idempotency.REPLAY_HEADER] = "true"
+    return result
+
+def _lookup_in(db_engine, key: Optional[str], fingerprint: str) -> Optional[dict]:
+    with Session(db_engine) as session:
+        return idempotency.lookup(session, key, fingerprint)
+
+@router.post("/actions/reroute/batch")
+async def reroute_batch(payload: RerouteBatchRequest, response: Response, session: Session = Depends(get_session),
+                        idempotency_key: Optional[str] = Header(default=None)):
+    """Applies many reroutes atomically: one read per table, one commit for the whole batch."""
+    batch_key = payload.idempotency_key or idempotency_key
+    batch_fingerprint = idempotency.fingerprint(*[(i.shipment_id, i.new_route_id, i.idempotency_key) for i in payload.items])
+    
+    ids = [item.shipment_id for item in payload.items]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=422, detail="Each shipment may appear only once per batch")
+    
+    if shards.shard_set is not None:
+        return await _reroute_batch_sharded(payload, response, session, batch_key, batch_fingerprint)
+    
+    try:
+        body, replayed = await writer.run(_batch_job(payload.items, batch_key, batch_fingerprint))
+    except IntegrityError:
+        body, replayed = await run_in_threadpool(idempotency.lookup, session, batch_key, batch_fingerprint), True
+        if body is None:
+            raise HTTPException(status_code=409, detail="Batch conflicted with a concurrent request; retry with the same keys")
+    if replayed:
+        response.headers[idempotency.REPLAY_HEADER] = "true"
+    return body
+
+def _batch_job(items: List[RerouteRequest], batch_key: Optional[str] = None, batch_fingerprint: Optional[str] = None):
+    ids = [item.shipment_id for item in items]
+    
+    def job(session: Session):
+        replay = idempotency.lookup(session, batch_key, batch_fingerprint)
+        if replay is not None:
+            return replay, True
         
-        # 2. Rescue Truck from Nearest Warehouse
-        # Find all Warehouses
-        warehouses = session.exec(select(Node).where(Node.type == "Warehouse")).all()
+        # Items already executed under their own key are replayed, not re-applied.
+        item_prints = [idempotency.fingerprint(i.shipment_id, i.new_route_id) for i in items]
+        replays = idempotency.lookup_many(session, [(i.idempotency_key, fp) for i, fp in zip(items, item_prints)])
         
-        # Find closest one THAT IS NOT DISRUPTED
-        nearest_wh = None
-        min_dist = 999999
+        shipments = {s.id: s for s in session.exec(select(Shipment).where(Shipment.id.in_(ids))).all()}
+        missing = [i.shipment_id for i, r in zip(items, replays) if r is None and i.shipment_id not in shipments]
+        if missing:
+            raise HTTPException(status_code=404, detail={"message": "Shipments not found", "shipment_ids": missing})
+        nodes = {n.id: n for n in session.exec(select(Node)).all()}
         
-        for wh in warehouses:
-            # Prevent shipping from the destination itself!
-            if wh.id == shipment.destination_id:
+        results = []
+        records = []
+        for item, fp, replayed in zip(items, item_prints, replays):
+            if replayed is not None:
+                results.append({**replayed, "shipment_id": item.shipment_id, "replayed": True})
                 continue
-            
-            # CHECK DISRUPTIONS FOR THIS WAREHOUSE
-            wh_disrupted = False
-            for d in disruptions:
-                if "Truck" in d.affected_modes:
-                    dist_to_disruption = calculate_distance_km(wh.location, d.location)
-                    if dist_to_disruption <= d.radius_km:
-                        wh_disrupted = True
-                        break
-            
-            if wh_disrupted:
-                continue # Skip this warehouse
-                
-            dist = calculate_distance_km(wh.location, shipment.current_location)
-            if dist < min_dist:
-                min_dist = dist
-                nearest_wh = wh
+            result = apply_reroute(session, shipments[item.shipment_id], item.new_route_id, item.idempotency_key,
+                                   nodes, item.expected_version)
+            records.append((item.idempotency_key, fp, result))
+            results.append({**result, "shipment_id": item.shipment_id, "replayed": False})
         
-        if nearest_wh:
-            # Trucking Cost: $2 per km base + $500 fee
-            truck_cost = int(min_dist * 2 + 500)
-            truck_time = int(min_dist / 60) + 4 # 60km/h avg + 4h load time
-            
-            options.append({
-                "id": f"OPT-REPLACEMENT-TRUCK-{nearest_wh.id}",
-                "type": f"Rescue Truck from {nearest_wh.name} ({int(min_dist)}km away)",
-                "cost_usd": truck_cost,
-                "transit_time_hours": truck_time,
-                "co2_kg": min_dist * 0.5, # 0.5kg per km
-                "description": f"Dispatch emergency stock from {nearest_wh.id}"
-            })
+        body = {"status": "success", "applied": sum(not r["replayed"] for r in results), "results": results}
+        records.append((batch_key, batch_fingerprint, body))
+        idempotency.remember_many(session, records)
+        return body, False
+    
+    return job
 
-    else:
-        # OCEAN/INTERNATIONAL LOGIC (Existing logic):
-        # 1. Standard Air/Sea Options
-        air_cost = int(val * 0.01 + 2000) 
-        sea_cost = int(val * 0.001 + 500)
-        replacement_cost = int(air_cost * 1.2) 
-
-        active_disruption = next((d for d in disruptions if 
-                                  calculate_distance_km(d.location, shipment.current_location) <= d.radius_km), None)
-        
-        if active_disruption and "Strike" in active_disruption.type:
-             options.append({
-                "id": "OPT-ALT-ORIGIN-SEA",
-                "type": "New Sourcing: Alt Origin (Shanghai - Sea)",
-                "cost_usd": 1200.0, 
-                "transit_time_hours": 140,
-                "co2_kg": 250.0,
-                "description": "Source from backup supplier in Shanghai (PORT-SHA)"
-            })
-             options.append({
-                "id": "OPT-ALT-ORIGIN-AIR",
-                "type": "New Sourcing: Alt Origin (Shanghai - Air)",
-                "cost_usd": 8500.0, 
-                "transit_time_hours": 30,
-                "co2_kg": 1600.0,
-                 "description": "Fly stock from backup supplier in Shanghai"
-            })
-        else:
-            if not active_disruption:
-                options.append({
-                    "id": "OPT-AIR-EXPEDITED",
-                    "type": "Expedite (Air) - Unload & Fly",
-                    "cost_usd": air_cost,
-                    "transit_time_hours": 24,
-                    "co2_kg": 1500.0
-                })
-            options.append({
-                "id": "OPT-SEA-REROUTE",
-                "type": "Reroute (Sea) - Divert Ship",
-                "cost_usd": sea_cost,
-                "transit_time_hours": 120, 
-                "co2_kg": 200.0
-            })
-            options.append({
-                "id": "OPT-REPLACEMENT-AIR",
-                "type": "Emergency Replacement (New Shipment)",
-                "cost_usd": replacement_cost,
-                "transit_time_hours": 24,
-                "co2_kg": 3000.0
-            })
-    
-    return {
-        "shipment_id": shipment_id,
-        "options": options
-    }
+async def _reroute_batch_sharded(payload: RerouteBatchRequest, response: Response, session: Session,
+                                 batch_key: Optional[str], batch_fingerprint: str):
+    """One atomic job per region shard, run in parallel. Atomicity is per region:
+    every item is validated up front, but a 409 in one region does not undo
+    another region's commit. Each region records the batch key for its own
+    items as it commits, so a retry with the same key replays the regions that
+    committed and runs the rest again. A partly applied batch answers 207."""
+    replay = await run_in_threadpool(idempotency.lookup, session, batch_key, batch_fingerprint)
+    if replay is not None:
+        response.headers[idempotency.REPLAY_HEADER] = "true"
+        return replay
+    
+    owners = await run_in_threadpool(shards.shard_set.owners, [item.shipment_id for item in payload.items])
+    missing = [item.shipment_id for item in payload.items if item.shipment_id not in owners]
+    if missing:
+        raise HTTPException(status_code=404, detail={"message": "Shipments not found", "shipment_ids": missing})
+    groups: Dict[str, List[RerouteRequest]] = {}
+    for item in payload.items:
+        groups.setdefault(owners[item.shipment_id].name, []).append(item)
+    
+    shard_list = [shards.shard_set.shards[name] for name in groups]
+    outcomes = await asyncio.gather(*[
+        shard.writer.run(_batch_job(groups[shard.name], batch_key, _region_fingerprint(groups[shard.name])))
+        for shard in shard_list], return_exceptions=True)
+    
+    by_id = {}
+    failures = {}
+    for shard, outcome in zip(shard_list, outcomes):
+        if isinstance(outcome, BaseException):
+            failures[shard.name] = _region_error(outcome)
+            for item in groups[shard.name]:
+                by_id[item.shipment_id] = {"shipment_id": item.shipment_id, "replayed": False, "error": failures[shard.name]}
+            continue
+        body, region_replayed = outcome
+        # A region that committed on an earlier attempt of this batch is replayed as a whole.
+        by_id.update((r["shipment_id"], {**r, "replayed": True} if region_replayed else r) for r in body["results"])
+        if not region_replayed:
+            await run_in_threadpool(shards.shard_set.rebalance, shard,
+                                    [r.get("new_shipment_id") for r in body["results"] if not r["replayed"]])
+    if len(failures) == len(shard_list):
+        raise next(o for o in outcomes if isinstance(o, BaseException)) # Nothing committed: a plain error
+    results = [by_id[item.shipment_id] for item in payload.items]
+    applied = sum(not r["replayed"] and "error" not in r for r in results)
+    if failures:
+        # Not recorded under the batch key as a whole: the failed regions must run again on retry.
+        response.status_code = 207
+        return {"status": "partial", "applied": applied, "failed_regions": failures, "results": results}
+    
+    body = {"status": "success", "applied": applied, "results": results}
+    if batch_key:
+        try:
+            await writer.run(lambda s: idempotency.remember(s, batch_key, batch_fingerprint, body))
+        except IntegrityError:
+            pass # A concurrent retry of this batch recorded it first
+    return body
 
-@router.post("/actions/reroute")
-async def reroute_shipment(payload: RerouteRequest, session: Session = Depends(get_session)):
-    shipment = session.exec(select(Shipment).where(Shipment.id == payload.shipment_id)).first()
-    if not shipment:
-        raise HTTPException(status_code=404, detail="Shipment not found")
+def _region_fingerprint(items: List[RerouteRequest]) -> str:
+    return idempotency.fingerprint(*[(i.shipment_id, i.new_route_id, i.idempotency_key) for i in items])
+
+def _region_error(e: BaseException) -> dict:
+    if isinstance(e, HTTPException):
+        return {"status_code": e.status_code, "detail": e.detail}
+    if isinstance(e, IntegrityError):
+        return {"status_code": 409, "detail": "Batch conflicted with a concurrent request; retry with the same keys"}
+    print(f"Batch reroute failed in one region: {e!r}")
+    return {"status_code": 500, "detail": "Internal error; retry with the same keys"}
+
+def apply_reroute(session: Session, shipment: Shipment, route_id: str, idempotency_key: Optional[str] = None,
+                  nodes: Optional[Dict[str, Node]] = None, expected_version: Optional[int] = None) -> dict:
+    """Stages a reroute in `session` without committing. Returns the API response body.
     
-    # Analyze the Intent
-    new_route_id = payload.new_route_id.upper()
-    is_replacement = "REPLACEMENT" in new_route_id or "ALT-ORIGIN" in new_route_id
-    
-    # Determine New Mode based on ID keywords or default
-    new_mode = shipment.transport_mode # Default to current
-    if "AIR" in new_route_id:
-        new_mode = "Air"
-    elif "SEA" in new_route_id:
-        new_mode = "Sea"
-    elif "TRUCK" in new_route_id:
-        new_mode = "Truck"
-    elif "RAIL" in new_route_id:
-        new_mode = "Rail"
+    Raises a 409 if the shipment is no longer the version the caller saw.
+    """
+    if expected_version is not None and expected_version != shipment.version:
+        raise conflict(session, shipment, f"Shipment {shipment.id} is at version {shipment.version}, not {expected_version}")
+    if shipment.status == "Mitigated":
+        raise conflict(session, shipment, f"Shipment {shipment.id} was already mitigated")
+    
+    # Analyze the Intent: mode, replacement and origin come from the reroute rules
+    new_route_id = route_id.upper()
+    action = rules.current().reroute_action(new_route_id, shipment)
+    is_replacement = action.replacement
+    new_mode = action.mode
         
     # LOGIC RULE: 
     # If Mode Changes OR it is an explicit Replacement -> CLONE (New Shipment, Mitigate Old)
@@ -178,29 +268,23 @@ async def reroute_shipment(payload: RerouteRequest, session: Session = Depends(g
         # 1. Determine Origin for New Shipment
         # Logic: Always start from the Origin Node (Port/Warehouse)
         # This implies we are shipping NEW inventory to replace the stuck goods.
-        
-        # Default to same origin
-        new_origin_id = shipment.origin_id 
-        
-        # Handle Alt Origin Logic
-        if "ALT-ORIGIN" in new_route_id:
-             new_origin_id = "PORT-SHA" # Default Backup
-             if shipment.origin_id == "PORT-SHA":
-                 new_origin_id = "PORT-RTM"
-        elif "REPLACEMENT-TRUCK" in new_route_id:
-             # Extract Warehouse ID from "OPT-REPLACEMENT-TRUCK-{ID}"
-             # e.g. OPT-REPLACEMENT-TRUCK-DC-CHI-01 -> DC-CHI-01
-             try:
-                 new_origin_id = new_route_id.split("TRUCK-")[1]
-             except IndexError:
-                 pass # Fallback to original origin if parsing fails
+        # e.g. OPT-ALT-ORIGIN-SEA-PORT-QING -> PORT-QING (planner-chosen port)
+        new_origin_id = action.origin_id
 
         # Look up Node Location (Crucial: New shipment starts at the Node, not at sea)
-        origin_node = session.exec(select(Node).where(Node.id == new_origin_id)).first()
-        start_loc = origin_node.location if origin_node else {"lat": 0, "lon": 0}
+        if nodes is not None:
+            origin_node = nodes.get(new_origin_id)
+        else:
+            origin_node = session.get(Node, new_origin_id)
+        if origin_node is None:
+            # The origin may come straight from the route id (OPT-ALT-ORIGIN-AIR-<node>).
+            raise HTTPException(status_code=422, detail=f"Route {new_route_id} starts at {new_origin_id}, which is not a known node")
+        start_loc = origin_node.location
 
         # 2. Generate New ID
-        unique_suffix = uuid.uuid4().hex[:6]
+        # Keyed requests get a deterministic suffix, so even a lost idempotency
+        # record cannot produce a second rescue shipment.
+        unique_suffix = idempotency.suffix(idempotency_key) if idempotency_key else uuid.uuid4().hex[:6]
         # E.g. SH-1001-AIR-RESCUE-a1b2
         reason_tag = "REP" if is_replacement else "RESCUE"
         new_id = f"{shipment.id}-{new_mode.upper()}-{reason_tag}-{unique_suffix}"
@@ -223,14 +307,10 @@ async def reroute_shipment(payload: RerouteRequest, session: Session = Depends(g
             contents=shipment.contents,
             total_value_at_risk=shipment.total_value_at_risk
         )
+        # 4. Mitigate Old Shipment (first, so a lost race never leaves a clone behind)
+        compare_and_swap(session, shipment, status="Mitigated")
         session.add(new_shipment)
         
-        # 4. Mitigate Old Shipment
-        shipment.status = "Mitigated"
-        session.add(shipment)
-        
-        session.commit()
-        
         return {
             "status": "success", 
             "message": f"Action {new_route_id} executed. Original {shipment.id} is Mitigated. New Shipment {new_id} created via {new_mode}.",
@@ -239,13 +319,9 @@ async def reroute_shipment(payload: RerouteRequest, session: Session = Depends(g
 
     else:
         # --- PATH B: MUTATE (Reroute same vehicle) ---
-        shipment.status = "In-Transit"
         # Mode is same, but semantics might imply a detour.
         # Ideally we would update the 'path' but we don't store it yet.
-        
-        session.add(shipment)
-        session.commit()
-        session.refresh(shipment)
+        compare_and_swap(session, shipment, status="In-Transit")
 
         return {
             "status": "success", 
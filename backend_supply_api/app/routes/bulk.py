@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from .. import bulk
+
+router = APIRouter()
+
+def _model(table: str):
+    if table not in bulk.TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table; use one of {', '.join(bulk.TABLES)}")
+    return bulk.TABLES[table]
+
+@router.get("/export/{table}.ndjson")
+def export_table(table: str):
+    """Streams every row as newline-delimited JSON, in primary-key order."""
+    _model(table)
+    return StreamingResponse(bulk.export_ndjson(table), media_type="application/x-ndjson")
+
+@router.post("/import/{table}")
+async def import_table(table: str, request: Request):
+    """Upserts newline-delimited JSON rows in chunked transactions; bad lines are reported, not fatal."""
+    _model(table)
+    return await bulk.import_ndjson(table, request.stream())
@@ -4,13 +4,21 @@ from typing import List
 from sqlmodel import Session, select
 from ..database import get_session
 from ..models import Node, Disruption
+from .. import columnar
 
 router = APIRouter()
 
+# Plain defs: FastAPI runs them in its threadpool, so their SQLite reads never
+# block the event loop.
+
 @router.get("/network/nodes", response_model=List[Node])
-async def get_nodes(session: Session = Depends(get_session)):
+def get_nodes(session: Session = Depends(get_session)):
+    if columnar.store is not None:
+        return columnar.store.network_nodes()
     return session.exec(select(Node)).all()
 
 @router.get("/network/disruptions", response_model=List[Disruption])
-async def get_disruptions(session: Session = Depends(get_session)):
+def get_disruptions(session: Session = Depends(get_session)):
+    if columnar.store is not None:
+        return columnar.store.network_disruptions()
     return session.exec(select(Disruption)).all()
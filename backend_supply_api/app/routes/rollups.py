@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, List, Optional
+from sqlmodel import Session
+from ..database import get_session
+from ..models import RollupGroup
+from .. import rollups, shards
+
+router = APIRouter()
+
+# Plain defs: FastAPI runs them in its threadpool, so their SQLite reads never
+# block the event loop.
+
+@router.get("/rollups")
+def get_rollup_summary(session: Session = Depends(get_session)) -> Dict[str, dict]:
+    """Shipment count and value at risk per status."""
+    if shards.shard_set is not None:
+        return rollups.summary(raw=rollups.merge(shards.shard_set.scatter(rollups.raw_summary).values()))
+    return rollups.summary(session)
+
+@router.get("/rollups/{dimension}", response_model=List[RollupGroup])
+def get_rollup(dimension: str, status: Optional[str] = "Stuck", session: Session = Depends(get_session)):
+    """Value at risk per destination, disruption, mode or seasonal_sku. Pass an empty status for all statuses."""
+    if dimension not in rollups.DIMENSIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown rollup dimension; use one of {', '.join(rollups.DIMENSIONS)}")
+    if shards.shard_set is not None:
+        parts = shards.shard_set.scatter(lambda session: rollups.raw_totals(session, dimension, status))
+        return rollups.totals(raw=rollups.merge(parts.values()))
+    return rollups.totals(session, dimension, status)
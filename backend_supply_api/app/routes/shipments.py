@@ -1,26 +1,73 @@
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
 from sqlmodel import Session, select
 from ..database import get_session
-from ..models import Shipment, Product
+from ..models import Shipment, Product, Disruption
+from ..routing import haversine_km
+from .. import columnar, events, shards
 
 router = APIRouter()
 
+# Plain defs: FastAPI runs them in its threadpool, so their SQLite reads never
+# block the event loop.
+
 @router.get("/shipments", response_model=List[Shipment])
-async def get_shipments(status: Optional[str] = None, session: Session = Depends(get_session)):
-    query = select(Shipment)
+def get_shipments(status: Optional[str] = None, disruption_id: Optional[str] = None,
+                  session: Session = Depends(get_session)):
+    # disruption_id: only shipments inside that zone, travelling by a mode it affects.
+    if columnar.store is not None:
+        disruption = None
+        if disruption_id:
+            disruption = columnar.store.disruption(disruption_id)
+            if disruption is None:
+                raise HTTPException(status_code=404, detail="Disruption not found")
+        return columnar.store.shipments(status, disruption)
+    
+    criteria = []
     if status:
-        query = query.where(Shipment.status == status)
-    return session.exec(query).all()
+        criteria.append(Shipment.status == status)
+    if not disruption_id:
+        return shards.query_shipments(session, *criteria)
+    
+    disruption = session.get(Disruption, disruption_id)
+    if not disruption:
+        raise HTTPException(status_code=404, detail="Disruption not found")
+    criteria.append(Shipment.transport_mode.in_(disruption.affected_modes or []))
+    center = disruption.location
+    return [
+        s for s in shards.query_shipments(session, *criteria)
+        if haversine_km(s.current_location.get("lat", 0), s.current_location.get("lon", 0),
+                        center.get("lat", 0), center.get("lon", 0)) <= disruption.radius_km
+    ]
 
 @router.get("/shipments/{shipment_id}", response_model=Shipment)
-async def get_shipment(shipment_id: str, session: Session = Depends(get_session)):
-    shipment = session.exec(select(Shipment).where(Shipment.id == shipment_id)).first()
+def get_shipment(shipment_id: str, session: Session = Depends(get_session)):
+    if columnar.store is not None:
+        shipment = columnar.store.shipment(shipment_id)
+        if not shipment:
+            raise HTTPException(status_code=404, detail="Shipment not found")
+        return shipment
+    shipment = shards.find_shipment(session, shipment_id)
     if not shipment:
         raise HTTPException(status_code=404, detail="Shipment not found")
     return shipment
 
+@router.get("/shipments/{shipment_id}/history")
+def get_shipment_history(shipment_id: str, after_version: int = 0, after_seq: int = 0,
+                         shard: Optional[str] = None,
+                         limit: int = Query(events.HISTORY_LIMIT, ge=1, le=1000),
+                         session: Session = Depends(get_session)):
+    # Every change since `after_version`, oldest first; page on the seq (and
+    # shard) of the last event returned, since several events share a version.
+    try:
+        history = events.history(session, shipment_id, after_version, limit, after_seq, shard)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"No event {after_seq} in {shard or 'the main database'} to page from")
+    if not history and not after_version and not after_seq and not shards.find_shipment(session, shipment_id):
+        raise HTTPException(status_code=404, detail="Shipment not found")
+    return {"shipment_id": shipment_id, "events": history}
+
 @router.get("/products", response_model=List[Product])
-async def get_products(session: Session = Depends(get_session)):
+def get_products(session: Session = Depends(get_session)):
     return session.exec(select(Product)).all()
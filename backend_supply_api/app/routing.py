@@ -0,0 +1,596 @@
+import heapq
+import math
+import threading
+from itertools import count
+from typing import Dict, Iterable, List, Optional
+
+EARTH_RADIUS_KM = 6371
+
+# --- Mode Profiles ---
+# Per-mode economics used to weight graph edges. Truck numbers match the
+# original rescue formula ($2/km + $500, 60km/h + 4h load time).
+MODE_PROFILES = {
+    "Sea":   {"speed_kmh": 35,  "handling_hours": 12, "fixed_cost": 500,  "cost_per_km": 0.30, "co2_per_km": 0.02, "route_factor": 1.3,  "value_rate": 0.001},
+    "Air":   {"speed_kmh": 800, "handling_hours": 6,  "fixed_cost": 2000, "cost_per_km": 1.20, "co2_per_km": 0.25, "route_factor": 1.05, "value_rate": 0.01},
+    "Truck": {"speed_kmh": 60,  "handling_hours": 4,  "fixed_cost": 500,  "cost_per_km": 2.00, "co2_per_km": 0.5,  "route_factor": 1.0,  "value_rate": 0.0},
+    "Rail":  {"speed_kmh": 50,  "handling_hours": 6,  "fixed_cost": 300,  "cost_per_km": 0.80, "co2_per_km": 0.1,  "route_factor": 1.15, "value_rate": 0.0},
+}
+
+# --- Edge Rules ---
+# Which nodes a mode connects and how densely. `k` nearest neighbours within
+# `max_km` keeps the edge count linear in the number of nodes.
+EDGE_RULES = {
+    "Sea":   {"node_types": ("Port",), "k": 10, "max_km": None},
+    "Air":   {"node_types": None, "k": 4, "max_km": 1500},  # regional hops; hubs are added below
+    "Truck": {"node_types": None, "k": 6, "max_km": 2500},
+    "Rail":  {"node_types": ("Port", "Warehouse"), "k": 4, "max_km": 3000},
+}
+AIR_HUB_TIER = 1        # capacity_tier of nodes that act as air hubs
+AIR_HUB_NEIGHBORS = 10  # hub <-> hub links
+AIR_SPOKES = 3          # every non-hub node links to its nearest hubs
+ACCESS_NEIGHBORS = 6    # links from a free location (e.g. a ship at sea) into the network
+
+# A vehicle already inside a disruption zone can still leave it, but waits first.
+STRANDED_WAIT_HOURS = 48
+
+LANDMARK_COUNT = 8
+OBJECTIVES = ("hours", "cost_usd", "co2_kg")
+_OBJECTIVE_INDEX = {"hours": 3, "cost_usd": 4, "co2_kg": 5}
+_PROFILE_KEY = {"hours": None, "cost_usd": "cost_per_km", "co2_kg": "co2_per_km"}
+
+SOURCE = "__source__"
+
+
+# --- Geometry ---
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + \
+        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def _bearing(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dlon = math.radians(lon2 - lon1)
+    y = math.sin(dlon) * math.cos(p2)
+    x = math.cos(p1) * math.sin(p2) - math.sin(p1) * math.cos(p2) * math.cos(dlon)
+    return math.atan2(y, x)
+
+
+def segment_distance_km(a: tuple, b: tuple, p: tuple) -> float:
+    """Shortest great-circle distance from point `p` to the arc `a`-`b` (all (lat, lon))."""
+    d_ap = haversine_km(a[0], a[1], p[0], p[1])
+    d_ab = haversine_km(a[0], a[1], b[0], b[1])
+    if d_ab == 0:
+        return d_ap
+    delta13 = d_ap / EARTH_RADIUS_KM
+    theta = _bearing(a[0], a[1], p[0], p[1]) - _bearing(a[0], a[1], b[0], b[1])
+    if math.cos(theta) < 0:
+        return d_ap  # p lies "behind" a
+    xt = math.asin(max(-1.0, min(1.0, math.sin(delta13) * math.sin(theta))))
+    cos_xt = math.cos(xt)
+    along = math.acos(max(-1.0, min(1.0, math.cos(delta13) / cos_xt))) * EARTH_RADIUS_KM if cos_xt else 0.0
+    if along > d_ab:
+        return haversine_km(b[0], b[1], p[0], p[1])
+    return abs(xt) * EARTH_RADIUS_KM
+
+
+def _latlon(location: dict) -> tuple:
+    return (location.get("lat", 0), location.get("lon", 0))
+
+
+class SpatialIndex:
+    """Lat/lon bucket grid for k-nearest lookups without an O(n^2) scan."""
+
+    def __init__(self, points: Dict[str, tuple], cell_deg: float = 5.0):
+        self.cell_deg = cell_deg
+        self.cols = int(math.ceil(360 / cell_deg))
+        self.points = points
+        self.cells: Dict[tuple, List[str]] = {}
+        for key, (lat, lon) in points.items():
+            self.cells.setdefault(self._cell(lat, lon), []).append(key)
+
+    def _cell(self, lat: float, lon: float) -> tuple:
+        return (int((lat + 90) // self.cell_deg), int((lon + 180) // self.cell_deg) % self.cols)
+
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> Iterable[str]:
+        dlat = radius_km / 111.2
+        lat_lo, lat_hi = lat - dlat, lat + dlat
+        rows = range(int((max(lat_lo, -90) + 90) // self.cell_deg), int((min(lat_hi, 90) + 90) // self.cell_deg) + 1)
+        widest = max(abs(lat_lo), abs(lat_hi))
+        if widest >= 89.9:
+            cols = range(self.cols)
+        else:
+            dlon = radius_km / (111.2 * math.cos(math.radians(widest)))
+            if dlon >= 180:
+                cols = range(self.cols)
+            else:
+                first = int((lon - dlon + 180) // self.cell_deg)
+                last = int((lon + dlon + 180) // self.cell_deg)
+                cols = sorted({c % self.cols for c in range(first, last + 1)})
+        for r in rows:
+            for c in cols:
+                yield from self.cells.get((r, c), ())
+
+    def nearest(self, lat: float, lon: float, k: int, max_km: Optional[float] = None) -> List[tuple]:
+        """Returns up to `k` (distance_km, key) pairs, closest first."""
+        limit = max_km if max_km is not None else math.pi * EARTH_RADIUS_KM
+        radius = min(500.0, limit)
+        while True:
+            found = []
+            for key in self._candidates(lat, lon, radius):
+                plat, plon = self.points[key]
+                d = haversine_km(lat, lon, plat, plon)
+                if d <= radius:
+                    found.append((d, key))
+            if len(found) >= k or radius >= limit:
+                found.sort()
+                return found[:k]
+            radius = min(radius * 2, limit)
+
+
+# --- Planner ---
+
+class RouteGraph:
+    """Undirected multimodal graph over network nodes plus ALT landmark tables.
+
+    Edges are tuples `(neighbour, mode, km, hours, cost_usd, co2_kg)`. The graph
+    is built once per node set; disruptions are applied per query by pruning.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = {}
+        self.by_type: Dict[str, List[str]] = {}
+        for n in nodes:
+            self.nodes[n.id] = {"type": n.type, "tier": n.capacity_tier, "loc": _latlon(n.location), "name": n.name}
+            self.by_type.setdefault(n.type, []).append(n.id)
+        self._indexes: Dict[tuple, SpatialIndex] = {}
+        self.adj: Dict[str, List[tuple]] = {nid: [] for nid in self.nodes}
+        self._seen = set()
+        self._build_edges()
+        self._components: Dict[tuple, dict] = {}
+        self._landmarks: Dict[str, List[tuple]] = {}
+        self._landmark_ids = self._pick_landmarks(LANDMARK_COUNT)
+        self._lock = threading.Lock()
+
+    def index(self, types: Optional[tuple] = None, hubs: bool = False) -> SpatialIndex:
+        """Spatial index over the nodes of the given types (or over air hubs only)."""
+        key = (types, hubs)
+        idx = self._indexes.get(key)
+        if idx is None:
+            idx = self._indexes[key] = SpatialIndex({
+                nid: n["loc"] for nid, n in self.nodes.items()
+                if (types is None or n["type"] in types) and (not hubs or n["tier"] == AIR_HUB_TIER)
+            })
+        return idx
+
+    def _add_edge(self, u: str, v: str, mode: str):
+        key = (min(u, v), max(u, v), mode)
+        if u == v or key in self._seen:
+            return
+        self._seen.add(key)
+        lu, lv = self.nodes[u]["loc"], self.nodes[v]["loc"]
+        metrics = edge_metrics(mode, haversine_km(lu[0], lu[1], lv[0], lv[1]))
+        self.adj[u].append((v, mode) + metrics)
+        self.adj[v].append((u, mode) + metrics)
+
+    def _build_edges(self):
+        for mode, rule in EDGE_RULES.items():
+            types = rule["node_types"]
+            index = self.index(types)
+            for nid in index.points:
+                lat, lon = self.nodes[nid]["loc"]
+                for _, other in index.nearest(lat, lon, rule["k"] + 1, rule["max_km"]):
+                    self._add_edge(nid, other, mode)
+
+        hubs = self.index(hubs=True)
+        for nid, node in self.nodes.items():
+            lat, lon = node["loc"]
+            k = AIR_HUB_NEIGHBORS + 1 if nid in hubs.points else AIR_SPOKES
+            for _, other in hubs.nearest(lat, lon, k):
+                self._add_edge(nid, other, "Air")
+
+    def edges(self):
+        for u, out in self.adj.items():
+            for e in out:
+                if u < e[0]:
+                    yield u, e
+
+    def component(self, modes) -> dict:
+        """Connected-component label per node for the subgraph of `modes`.
+
+        Lets queries between disconnected nodes fail without exploring the graph.
+        """
+        key = tuple(sorted(modes))
+        labels = self._components.get(key)
+        if labels is None:
+            labels = {}
+            for start in self.nodes:
+                if start in labels:
+                    continue
+                labels[start] = start
+                stack = [start]
+                while stack:
+                    u = stack.pop()
+                    for e in self.adj[u]:
+                        if e[1] in key and e[0] not in labels:
+                            labels[e[0]] = start
+                            stack.append(e[0])
+            self._components[key] = labels
+        return labels
+
+    # --- Landmarks (ALT) ---
+
+    def _pick_landmarks(self, count_: int) -> List[str]:
+        ids = sorted(self.nodes)
+        if not ids:
+            return []
+        chosen = [ids[0]]
+        best = {nid: self._gc(nid, ids[0]) for nid in ids}
+        while len(chosen) < min(count_, len(ids)):
+            far = max(best, key=best.get)
+            if best[far] == 0:
+                break
+            chosen.append(far)
+            for nid in ids:
+                best[nid] = min(best[nid], self._gc(nid, far))
+        return chosen
+
+    def _gc(self, u: str, v: str) -> float:
+        a, b = self.nodes[u]["loc"], self.nodes[v]["loc"]
+        return haversine_km(a[0], a[1], b[0], b[1])
+
+    def landmark_tables(self, objective: str) -> List[dict]:
+        """Exact single-source distances from each landmark, computed lazily per objective."""
+        tables = self._landmarks.get(objective)
+        if tables is None:
+            with self._lock:
+                tables = self._landmarks.get(objective)
+                if tables is None:
+                    idx = _OBJECTIVE_INDEX[objective]
+                    tables = [self._dijkstra(lm, idx) for lm in self._landmark_ids]
+                    self._landmarks[objective] = tables
+        return tables
+
+    def _dijkstra(self, source: str, idx: int) -> dict:
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for e in self.adj[u]:
+                nd = d + e[idx]
+                if nd < dist.get(e[0], math.inf):
+                    dist[e[0]] = nd
+                    heapq.heappush(heap, (nd, e[0]))
+        return dist
+
+
+def edge_metrics(mode: str, gc_km: float) -> tuple:
+    p = MODE_PROFILES[mode]
+    km = gc_km * p["route_factor"]
+    hours = km / p["speed_kmh"] + p["handling_hours"]
+    cost = p["fixed_cost"] + km * p["cost_per_km"]
+    return (km, hours, cost, km * p["co2_per_km"])
+
+
+class RoutePlanner:
+    """Answers shortest and k-shortest route queries against one world state.
+
+    Edges crossing a disruption zone for one of its `affected_modes` are pruned.
+    A free source location inside a zone (a stranded vehicle) is penalized with
+    `STRANDED_WAIT_HOURS` instead, so it can still leave once the zone clears.
+    """
+
+    def __init__(self, graph: RouteGraph, disruptions):
+        self.graph = graph
+        self.disruptions = [(_latlon(d.location), d.radius_km, set(d.affected_modes)) for d in disruptions]
+        self._trees: Dict[tuple, Dict[str, dict]] = {}
+        self.blocked = set()
+        for u, e in graph.edges():
+            if self._crosses_disruption(graph.nodes[u]["loc"], graph.nodes[e[0]]["loc"], e[1]):
+                self.blocked.add((u, e[0], e[1]))
+                self.blocked.add((e[0], u, e[1]))
+
+    def _crosses_disruption(self, a: tuple, b: tuple, mode: str, skip=()) -> bool:
+        for i, (center, radius, modes) in enumerate(self.disruptions):
+            if mode in modes and i not in skip and segment_distance_km(a, b, center) <= radius:
+                return True
+        return False
+
+    def is_disrupted(self, location: dict, mode: str) -> bool:
+        p = _latlon(location)
+        return any(mode in modes and haversine_km(p[0], p[1], c[0], c[1]) <= r
+                   for c, r, modes in self.disruptions)
+
+    def node_disrupted(self, node_id: str, mode: str) -> bool:
+        lat, lon = self.graph.nodes[node_id]["loc"]
+        return self.is_disrupted({"lat": lat, "lon": lon}, mode)
+
+    # --- Source handling ---
+
+    def _source_edges(self, sources, access_mode: Optional[str], modes, target: str) -> List[tuple]:
+        if isinstance(sources, dict):
+            edges = self._access_edges(_latlon(sources), access_mode, modes, target)
+        else:
+            if isinstance(sources, str):
+                sources = [sources]
+            edges = [(nid, "Origin", 0.0, 0.0, 0.0, 0.0) for nid in sources if nid in self.graph.nodes]
+        labels = self.graph.component(modes)
+        return [e for e in edges if labels[e[0]] == labels[target]]
+
+    def _access_edges(self, p: tuple, mode: str, modes, target: str) -> List[tuple]:
+        rule = EDGE_RULES[mode]
+        stranded = {i for i, (c, r, m) in enumerate(self.disruptions)
+                    if mode in m and haversine_km(p[0], p[1], c[0], c[1]) <= r}
+        out = []
+        for d, nid in self.graph.index(rule["node_types"]).nearest(p[0], p[1], ACCESS_NEIGHBORS, rule["max_km"]):
+            if nid == target and mode not in modes:
+                continue  # the access leg alone must not satisfy a mode-restricted query
+            if self._crosses_disruption(p, self.graph.nodes[nid]["loc"], mode, skip=stranded):
+                continue
+            km, hours, cost, co2 = edge_metrics(mode, d)
+            if stranded:
+                hours += STRANDED_WAIT_HOURS
+            out.append((nid, mode, km, hours, cost, co2))
+        return out
+
+    # --- Search ---
+
+    def _heuristic(self, objective: str, modes, target: str):
+        g = self.graph
+        key = _PROFILE_KEY[objective]
+        if key is None:
+            per_km = 1.0 / max(MODE_PROFILES[m]["speed_kmh"] for m in modes)
+        else:
+            per_km = min(MODE_PROFILES[m][key] for m in modes)
+        tables = [t for t in g.landmark_tables(objective) if target in t]
+        tlat, tlon = g.nodes[target]["loc"]
+
+        def h(v: str) -> float:
+            vlat, vlon = g.nodes[v]["loc"]
+            best = haversine_km(vlat, vlon, tlat, tlon) * per_km
+            for t in tables:
+                dv = t.get(v)
+                if dv is not None:
+                    best = max(best, abs(t[target] - dv))
+            return best
+        return h
+
+    def _astar(self, source_edges, target, modes, objective, h, banned_edges=(), banned_nodes=()):
+        idx = _OBJECTIVE_INDEX[objective]
+        adj = self.graph.adj
+        g_score = {SOURCE: 0.0}
+        parent = {SOURCE: None}
+        tie = count()
+        heap = [(0.0, next(tie), SOURCE)]
+        closed = set()
+        while heap:
+            _, _, u = heapq.heappop(heap)
+            if u == target:
+                return self._unwind(parent, target)
+            if u in closed:
+                continue
+            closed.add(u)
+            out = source_edges if u == SOURCE else adj[u]
+            for e in out:
+                v, mode = e[0], e[1]
+                if v in closed or v in banned_nodes:
+                    continue
+                if u != SOURCE and (mode not in modes or (u, v, mode) in self.blocked):
+                    continue
+                if (u, v, mode) in banned_edges:
+                    continue
+                ng = g_score[u] + e[idx]
+                if ng < g_score.get(v, math.inf):
+                    g_score[v] = ng
+                    parent[v] = (u, e)
+                    heapq.heappush(heap, (ng + h(v), next(tie), v))
+        return None
+
+    def _unwind(self, parent, target) -> List[tuple]:
+        steps = []
+        v = target
+        while parent[v] is not None:
+            u, e = parent[v]
+            steps.append((u, e))
+            v = u
+        steps.reverse()
+        return steps
+
+    def _to_route(self, steps) -> dict:
+        legs = []
+        totals = {"km": 0.0, "hours": 0.0, "cost_usd": 0.0, "co2_kg": 0.0}
+        for u, e in steps:
+            if e[1] == "Origin":
+                continue
+            legs.append({"from": "CURRENT-LOCATION" if u == SOURCE else u, "to": e[0], "mode": e[1], "km": round(e[2], 1)})
+            totals["km"] += e[2]
+            totals["hours"] += e[3]
+            totals["cost_usd"] += e[4]
+            totals["co2_kg"] += e[5]
+        nodes = [e[0] for _, e in steps]
+        return {
+            "origin_id": nodes[0] if steps and steps[0][1][1] == "Origin" else None,
+            "nodes": nodes,
+            "legs": legs,
+            "modes": sorted({leg["mode"] for leg in legs}),
+            **totals,
+        }
+
+    def shortest_path(self, sources, target: str, modes=("Sea", "Air", "Truck", "Rail"),
+                      objective: str = "hours", access_mode: Optional[str] = None) -> Optional[dict]:
+        """A* from `sources` (a node id, a list of candidate node ids, or a location dict) to `target`."""
+        if target not in self.graph.nodes:
+            return None
+        source_edges = self._source_edges(sources, access_mode or modes[0], modes, target)
+        h = self._heuristic(objective, modes, target)
+        steps = self._astar(source_edges, target, modes, objective, h)
+        return self._to_route(steps) if steps else None
+
+    def k_shortest_paths(self, sources, target: str, k: int, modes=("Sea", "Air", "Truck", "Rail"),
+                         objective: str = "hours", access_mode: Optional[str] = None) -> List[dict]:
+        """Yen's algorithm over the A* search above. Routes are loopless and ordered by `objective`."""
+        if target not in self.graph.nodes:
+            return []
+        idx = _OBJECTIVE_INDEX[objective]
+        source_edges = self._source_edges(sources, access_mode or modes[0], modes, target)
+        h = self._heuristic(objective, modes, target)
+        first = self._astar(source_edges, target, modes, objective, h)
+        if not first:
+            return []
+        found = [first]
+        candidates = []
+        seen = {self._signature(first)}
+        tie = count()
+        while len(found) < k:
+            prev = found[-1]
+            for i in range(len(prev)):
+                spur = prev[i][0]
+                root = prev[:i]
+                banned_edges = set()
+                for path in found:
+                    if len(path) > i and self._signature(path[:i]) == self._signature(root):
+                        u, e = path[i]
+                        banned_edges.add((u, e[0], e[1]))
+                banned_nodes = {u for u, _ in root}
+                spur_edges = [e for e in source_edges if (SOURCE, e[0], e[1]) not in banned_edges] \
+                    if spur == SOURCE else None
+                spur_steps = self._astar_from(spur, spur_edges, target, modes, objective, h,
+                                              banned_edges, banned_nodes)
+                if not spur_steps:
+                    continue
+                total = root + spur_steps
+                sig = self._signature(total)
+                if sig in seen:
+                    continue
+                seen.add(sig)
+                heapq.heappush(candidates, (sum(e[idx] for _, e in total), next(tie), total))
+            if not candidates:
+                break
+            found.append(heapq.heappop(candidates)[2])
+        return [self._to_route(p) for p in found]
+
+    def _astar_from(self, spur, spur_edges, target, modes, objective, h, banned_edges, banned_nodes):
+        if spur == SOURCE:
+            return self._astar(spur_edges, target, modes, objective, h, banned_edges, banned_nodes)
+        # Re-root the search at an intermediate node via a zero-cost pseudo edge.
+        steps = self._astar([(spur, "Origin", 0.0, 0.0, 0.0, 0.0)], target, modes, objective, h,
+                            banned_edges, banned_nodes)
+        return steps[1:] if steps else None
+
+    @staticmethod
+    def _signature(steps) -> tuple:
+        return tuple((u, e[0], e[1]) for u, e in steps)
+
+    def tree_to(self, target: str, modes, objective: str = "hours") -> Dict[str, dict]:
+        """Best route totals from every reachable node to `target` (one Dijkstra, cached).
+
+        Used when many sources are priced against the same destination, e.g. fleet planning.
+        """
+        key = (target, tuple(sorted(modes)), objective)
+        cached = self._trees.get(key)
+        if cached is not None:
+            return cached
+        idx = _OBJECTIVE_INDEX[objective]
+        adj = self.graph.adj
+        best = {target: 0.0}
+        totals = {target: (0.0, 0.0, 0.0, 0.0, frozenset())}
+        heap = [(0.0, target)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > best[u]:
+                continue
+            km, hours, cost, co2, used = totals[u]
+            for e in adj[u]:
+                v, mode = e[0], e[1]
+                if mode not in modes or (u, v, mode) in self.blocked:
+                    continue
+                nd = d + e[idx]
+                if nd < best.get(v, math.inf):
+                    best[v] = nd
+                    totals[v] = (km + e[2], hours + e[3], cost + e[4], co2 + e[5], used | {mode})
+                    heapq.heappush(heap, (nd, v))
+        tree = {
+            v: {"km": t[0], "hours": t[1], "cost_usd": t[2], "co2_kg": t[3], "modes": sorted(t[4])}
+            for v, t in totals.items() if v != target
+        }
+        if len(self._trees) > 256:
+            self._trees.clear()
+        self._trees[key] = tree
+        return tree
+
+    def best_origins(self, candidates: List[str], target: str, limit: int, modes, objective: str = "hours",
+                     search_depth: int = 4) -> List[dict]:
+        """Best route from each of the `limit` best distinct origins among `candidates`."""
+        routes = self.k_shortest_paths(candidates, target, limit * search_depth, modes, objective)
+        best = {}
+        for r in routes:
+            best.setdefault(r["origin_id"], r)
+            if len(best) == limit:
+                break
+        return list(best.values())
+
+
+def value_rate(route: dict) -> float:
+    """Insurance/handling surcharge per USD of cargo value: that of the route's priciest mode."""
+    return max((MODE_PROFILES[m]["value_rate"] for m in route["modes"]), default=0.0)
+
+
+def route_cost(route: dict, value_usd: float) -> float:
+    """Path cost plus the value-based surcharge (insurance/handling) of its priciest mode."""
+    return route["cost_usd"] + value_usd * value_rate(route)
+
+
+def describe_route(route: dict) -> str:
+    hops = [route["legs"][0]["from"]] if route["legs"] else []
+    hops += [f"{leg['to']} ({leg['mode']})" for leg in route["legs"]]
+    return " -> ".join(hops) or "direct"
+
+
+# --- Cache ---
+# The base graph only depends on the node set; the pruned planner on the
+# disruption set too. Both are rebuilt only when their inputs change.
+
+_cache_lock = threading.Lock()
+_graph_cache: Dict[tuple, RouteGraph] = {}
+_planner_cache: Dict[tuple, RoutePlanner] = {}
+
+
+def _node_key(nodes) -> tuple:
+    return tuple(sorted((n.id, n.type, n.capacity_tier, *_latlon(n.location)) for n in nodes))
+
+
+def _disruption_key(disruptions) -> tuple:
+    return tuple(sorted((d.id, *_latlon(d.location), d.radius_km, tuple(sorted(d.affected_modes))) for d in disruptions))
+
+
+def get_planner(nodes, disruptions, data_version: Optional[int] = None) -> RoutePlanner:
+    """The cached planner for this world state.
+
+    Callers that loaded `nodes` and `disruptions` at a known data version
+    (see `versions.data_version`) pass it, and the lookup is O(1). Without
+    one, the rows themselves are the key, which costs a sort per call.
+    """
+    if data_version is not None:
+        node_key = key = ("data", data_version)
+    else:
+        node_key = _node_key(nodes)
+        key = (node_key, _disruption_key(disruptions))
+    planner = _planner_cache.get(key)
+    if planner is not None:
+        return planner
+    with _cache_lock:
+        graph = _graph_cache.get(node_key)
+        if graph is None:
+            _graph_cache.clear()
+            graph = _graph_cache[node_key] = RouteGraph(nodes)
+        planner = _planner_cache.get(key)
+        if planner is None:
+            if len(_planner_cache) > 16:
+                _planner_cache.clear()
+            planner = _planner_cache[key] = RoutePlanner(graph, disruptions)
+    return planner
@@ -0,0 +1,379 @@
+import ast
+import json
+import math
+import os
+import re
+import threading
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# --- Quote & Reroute Rules ---
+# Which rescue options a shipment is quoted, how they are priced, and what a
+# chosen route id does on reroute are data, not code: data/quote_rules.json.
+#
+#   quote_rules    first rule whose `when` matches a shipment (mode, priority,
+#                  value band, active disruption) lists its options; each
+#                  option names a route `source` the planner searches and may
+#                  override the cost/time/CO2 `formulas`
+#   reroute_rules  first regex matching a route id decides mode, whether the
+#                  shipment is replaced by a new one, and the new origin
+#
+# The file is compiled once per change: conditions into a memoized matcher,
+# formulas into plain Python functions over columns. Edits are picked up
+# within RELOAD_CHECK_S without a restart; a file that fails to compile is
+# reported and the previous rules stay in force.
+
+RULES_FILE = Path(os.getenv("QUOTE_RULES_FILE", Path(__file__).parent.parent / "data" / "quote_rules.json"))
+RELOAD_CHECK_S = 1.0
+
+SOURCES = ("origin", "current", "divert", "warehouses", "ports")
+MODES = ("Sea", "Air", "Truck", "Rail")
+# Per option row: what the planner found and what the shipment is worth.
+VARIABLES = ("path_cost", "value_rate", "hours", "co2_kg", "km", "value", "critical")
+FUNCTIONS = {"min": min, "max": max, "abs": abs, "round": round, "ceil": math.ceil, "floor": math.floor}
+ARITY = {"min": (2, None), "max": (2, None), "abs": (1, 1), "round": (1, 2), "ceil": (1, 1), "floor": (1, 1)}
+# What option id, label and description templates may use, with a sample of each type.
+TEMPLATE_FIELDS = {"origin_id": "PORT-X", "origin_name": "Port X", "km": 1, "shipment_id": "SH-X"}
+OUTPUTS = ("cost_usd", "transit_time_hours", "co2_kg")
+# `**` only with a small constant exponent: 9 ** 9 ** 9 would never finish.
+MAX_EXPONENT = 4
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Call, ast.Name, ast.Load,
+    ast.Constant, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+    ast.And, ast.Or, ast.Not, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+)
+
+
+class RulesError(ValueError):
+    """The rules file is malformed; the message says where."""
+
+
+def _compile_formula(source: str, where: str) -> str:
+    """Validates an arithmetic expression over VARIABLES and FUNCTIONS; returns it unchanged."""
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise RulesError(f"{where}: {e.msg} in {source!r}")
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise RulesError(f"{where}: {type(node).__name__} is not allowed in {source!r}")
+        if isinstance(node, ast.Name) and node.id not in VARIABLES and node.id not in FUNCTIONS:
+            raise RulesError(f"{where}: unknown name {node.id!r} in {source!r}")
+        if isinstance(node, ast.Call):
+            if not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+                raise RulesError(f"{where}: only {sorted(FUNCTIONS)} may be called in {source!r}")
+            low, high = ARITY[node.func.id]
+            if len(node.args) < low or (high is not None and len(node.args) > high):
+                raise RulesError(f"{where}: wrong number of arguments to {node.func.id}() in {source!r}")
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            exponent = node.right.operand if isinstance(node.right, ast.UnaryOp) else node.right
+            if not (isinstance(exponent, ast.Constant) and isinstance(exponent.value, (int, float))
+                    and abs(exponent.value) <= MAX_EXPONENT) or any(isinstance(n, ast.Pow) for n in ast.walk(node.left)):
+                raise RulesError(f"{where}: ** needs a constant exponent of at most {MAX_EXPONENT} "
+                                 f"and no ** in its base, in {source!r}")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise RulesError(f"{where}: only numbers are allowed in {source!r}")
+    return source
+
+
+def _row_function(formulas: Dict[str, str]) -> Callable:
+    """One function computing every output for one option row, compiled from the formulas."""
+    body = ", ".join(f"({formulas[name]})" for name in OUTPUTS)
+    code = compile(f"lambda {', '.join(VARIABLES)}: ({body})", "<quote_rules>", "eval")
+    return eval(code, {"__builtins__": {}, **FUNCTIONS})
+
+
+def _priced(outputs) -> bool:
+    try:
+        return all(isinstance(v, (int, float)) and math.isfinite(v) for v in outputs)
+    except OverflowError: # An int too large for a float
+        return False
+
+
+def _compile_template(template, where: str) -> str:
+    """Formats `template` once with sample TEMPLATE_FIELDS, so unknown fields
+    and bad format specs are caught on load rather than on every quote."""
+    if not isinstance(template, str):
+        raise RulesError(f"{where}: must be a string")
+    try:
+        template.format(**TEMPLATE_FIELDS)
+    except (KeyError, IndexError, AttributeError, ValueError) as e:
+        raise RulesError(f"{where}: {template!r} may only use {sorted(TEMPLATE_FIELDS)} ({type(e).__name__}: {e})")
+    return template
+
+
+# --- Quote rules ---
+
+@dataclass(frozen=True)
+class Facts:
+    """What quote conditions can test about a shipment."""
+    mode: str
+    priority: str
+    value: float
+    disruption_type: Optional[str] # Type of the disruption the shipment sits in, if any
+
+
+@dataclass
+class OptionSpec:
+    source: str
+    modes: Tuple[str, ...]
+    choices: int
+    id: str # Templates over TEMPLATE_FIELDS
+    label: str
+    description: Optional[str]
+    formulas: Dict[str, str]
+    row: Callable # (*VARIABLES) -> (cost_usd, transit_time_hours, co2_kg)
+    failed_rows: int = 0
+
+    def evaluate(self, columns: Sequence[Sequence[float]]) -> List[Optional[tuple]]:
+        """Outputs for many rows at once; `columns` follows VARIABLES. A row the
+        formulas cannot price (division by zero, overflow, a complex or infinite
+        result) comes back as None, so only that option is dropped."""
+        try:
+            outputs = list(map(self.row, *columns))
+        except Exception: # Find the failing rows one at a time
+            outputs = [self._evaluate_one(values) for values in zip(*columns)]
+        priced = [o if o is not None and _priced(o) else None for o in outputs]
+        self.failed_rows += priced.count(None)
+        return priced
+
+    def _evaluate_one(self, values) -> Optional[tuple]:
+        try:
+            return self.row(*values)
+        except Exception:
+            return None
+
+
+class _Condition:
+    def __init__(self, when: dict, where: str):
+        unknown = set(when) - {"mode", "priority", "disruption_type", "disrupted", "value"}
+        if unknown:
+            raise RulesError(f"{where}: unknown condition(s) {sorted(unknown)}")
+        for name in ("mode", "priority", "disruption_type"):
+            if name in when and not (isinstance(when[name], list) and all(isinstance(v, str) for v in when[name])):
+                raise RulesError(f"{where}: {name} must be a list of strings")
+        self.modes = frozenset(when["mode"]) if "mode" in when else None
+        if self.modes is not None and not self.modes <= set(MODES):
+            raise RulesError(f"{where}: mode must be among {MODES}")
+        self.priorities = frozenset(when["priority"]) if "priority" in when else None
+        self.type_keywords = tuple(when.get("disruption_type") or ())
+        self.disrupted = when.get("disrupted", True if self.type_keywords else None)
+        if self.disrupted not in (True, False, None):
+            raise RulesError(f"{where}: disrupted must be true or false")
+        if self.type_keywords and not self.disrupted:
+            raise RulesError(f"{where}: disruption_type needs a disruption, but disrupted is false")
+        band = when.get("value") or {}
+        self.value_min = float(band.get("min", -math.inf))
+        self.value_max = float(band.get("max", math.inf)) # Exclusive
+
+    def matches(self, facts: Facts) -> bool:
+        if self.modes is not None and facts.mode not in self.modes:
+            return False
+        if self.priorities is not None and facts.priority not in self.priorities:
+            return False
+        if self.disrupted is not None and self.disrupted != (facts.disruption_type is not None):
+            return False
+        if self.type_keywords and not any(k in facts.disruption_type for k in self.type_keywords):
+            return False
+        return self.value_min <= facts.value < self.value_max
+
+
+@dataclass
+class QuoteRule:
+    name: str
+    condition: _Condition
+    options: List[OptionSpec]
+
+
+# --- Reroute rules ---
+
+@dataclass(frozen=True)
+class RerouteAction:
+    mode: str
+    replacement: bool # Clone a new shipment instead of redirecting this one
+    origin_id: str # Where a replacement starts
+
+
+class _RerouteRule:
+    def __init__(self, spec: dict, keywords: Dict[str, str], where: str):
+        try:
+            self.pattern = re.compile(spec["match"])
+        except (KeyError, re.error) as e:
+            raise RulesError(f"{where}: bad or missing 'match': {e}")
+        self.mode = spec.get("mode")
+        if self.mode is not None and self.mode not in MODES:
+            raise RulesError(f"{where}: mode must be among {MODES}")
+        self.replacement = bool(spec.get("replacement", False))
+        self.origin = spec.get("origin")
+        self.origin_if_same = spec.get("origin_if_same")
+        self.keywords = keywords
+
+
+class RuleSet:
+    """A compiled rules file. Immutable once built; reloading swaps in a new one."""
+
+    def __init__(self, document: dict, version: int = 0, path: str = ""):
+        self.version = version # File mtime in ns: grows with every edit and is the same in every worker
+        self.path = path
+        if not isinstance(document, dict):
+            raise RulesError("Expected a JSON object")
+        defaults = {name: _compile_formula(str(f), f"formulas.{name}")
+                    for name, f in (document.get("formulas") or {}).items()}
+        missing = set(OUTPUTS) - set(defaults)
+        if missing:
+            raise RulesError(f"formulas: missing {sorted(missing)}")
+        self.default_row = _row_function(defaults)
+
+        self.quote_rules: List[QuoteRule] = []
+        thresholds = set()
+        for i, rule in enumerate(document.get("quote_rules") or []):
+            where = f"quote_rules[{i}] ({rule.get('name', '?')})"
+            condition = _Condition(rule.get("when") or {}, where)
+            thresholds.update(t for t in (condition.value_min, condition.value_max) if math.isfinite(t))
+            options = [self._option(o, {**defaults, **(rule.get("formulas") or {})}, f"{where}.options[{j}]")
+                       for j, o in enumerate(rule.get("options") or [])]
+            self.quote_rules.append(QuoteRule(rule.get("name") or f"rule-{i}", condition, options))
+        # Matching depends on the value only through the band it falls in, so
+        # results are memoized per (mode, priority, disruption, band).
+        self._thresholds = sorted(thresholds)
+        self._matches: Dict[tuple, Optional[QuoteRule]] = {}
+        self._lock = threading.Lock()
+
+        reroute = document.get("reroute_rules") or {}
+        self.mode_keywords: List[Tuple[str, str]] = [(k, m) for k, m in reroute.get("mode_keywords") or []]
+        if any(m not in MODES for _, m in self.mode_keywords):
+            raise RulesError(f"reroute_rules.mode_keywords: modes must be among {MODES}")
+        keywords = dict(self.mode_keywords)
+        self.reroute_rules = [_RerouteRule(r, keywords, f"reroute_rules.rules[{i}]")
+                              for i, r in enumerate(reroute.get("rules") or [])]
+
+    @staticmethod
+    def _option(spec: dict, formulas: Dict[str, str], where: str) -> OptionSpec:
+        if spec.get("source") not in SOURCES:
+            raise RulesError(f"{where}: source must be one of {SOURCES}")
+        modes = tuple(spec.get("modes") or ())
+        if not modes or not set(modes) <= set(MODES):
+            raise RulesError(f"{where}: modes must be a non-empty subset of {MODES}")
+        if "id" not in spec or "label" not in spec:
+            raise RulesError(f"{where}: id and label are required")
+        formulas = {**formulas, **(spec.get("formulas") or {})}
+        unknown = set(formulas) - set(OUTPUTS)
+        if unknown:
+            raise RulesError(f"{where}: unknown formula(s) {sorted(unknown)}; expected {OUTPUTS}")
+        formulas = {name: _compile_formula(str(f), f"{where}.formulas.{name}") for name, f in formulas.items()}
+        # Formulas are only checked statically: whether one divides by zero or
+        # overflows depends on the data, and evaluate() drops such rows.
+        description = spec.get("description")
+        return OptionSpec(spec["source"], modes, int(spec.get("choices", 1)), _compile_template(spec["id"], f"{where}.id"),
+                          _compile_template(spec["label"], f"{where}.label"),
+                          None if description is None else _compile_template(description, f"{where}.description"),
+                          formulas, _row_function(formulas))
+
+    def match(self, facts: Facts) -> Optional[QuoteRule]:
+        """The first quote rule for `facts`, or None if no rule applies (no options)."""
+        key = (facts.mode, facts.priority, facts.disruption_type, bisect_right(self._thresholds, facts.value))
+        try:
+            return self._matches[key]
+        except KeyError:
+            pass
+        rule = next((r for r in self.quote_rules if r.condition.matches(facts)), None)
+        with self._lock:
+            self._matches[key] = rule
+        return rule
+
+    def option(self, facts: Facts, source: str) -> Optional[OptionSpec]:
+        """The first option drawing on `source` that the rule for `facts` offers."""
+        rule = self.match(facts)
+        return next((o for o in rule.options if o.source == source), None) if rule else None
+
+    def reroute_action(self, route_id: str, shipment) -> RerouteAction:
+        """What executing `route_id` (upper-cased) does to `shipment`."""
+        for rule in self.reroute_rules:
+            m = rule.pattern.search(route_id)
+            if m is None:
+                continue
+            groups = m.groupdict()
+            mode = rule.mode or rule.keywords.get(groups.get("mode") or "") or self._mode_from_keywords(route_id, shipment)
+            origin = groups.get("origin") or rule.origin or shipment.origin_id
+            if rule.origin_if_same and origin == shipment.origin_id:
+                origin = rule.origin_if_same
+            return RerouteAction(mode, rule.replacement, origin)
+        return RerouteAction(self._mode_from_keywords(route_id, shipment), False, shipment.origin_id)
+
+    def _mode_from_keywords(self, route_id: str, shipment) -> str:
+        return next((mode for keyword, mode in self.mode_keywords if keyword in route_id), shipment.transport_mode)
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "quote_rules": [{"name": r.name, "options": [o.id for o in r.options],
+                             "failed_rows": sum(o.failed_rows for o in r.options)} for r in self.quote_rules],
+            "reroute_rules": [r.pattern.pattern for r in self.reroute_rules],
+        }
+
+
+def load(path: Path = RULES_FILE) -> RuleSet:
+    stat = os.stat(path)
+    with open(path) as f:
+        try:
+            document = json.load(f)
+        except ValueError as e:
+            raise RulesError(f"{path}: {e}")
+    try:
+        return RuleSet(document, stat.st_mtime_ns, str(path))
+    except RulesError:
+        raise
+    except (AttributeError, KeyError, TypeError, ValueError) as e: # A value of the wrong shape somewhere
+        raise RulesError(f"{path}: malformed rules: {type(e).__name__}: {e}")
+
+
+# --- Hot reload ---
+
+_current: Optional[RuleSet] = None
+_seen_mtime: Optional[int] = None # Last file version tried, loaded or not
+_checked_at = 0.0
+_last_error: Optional[str] = None
+_reload_lock = threading.Lock()
+
+
+def current() -> RuleSet:
+    """The rules in force, reloaded if the file changed since the last check."""
+    global _current, _seen_mtime, _checked_at, _last_error
+    if _current is not None and time.monotonic() - _checked_at < RELOAD_CHECK_S:
+        return _current
+    with _reload_lock:
+        if _current is not None and time.monotonic() - _checked_at < RELOAD_CHECK_S:
+            return _current
+        _checked_at = time.monotonic()
+        try:
+            mtime = os.stat(RULES_FILE).st_mtime_ns
+        except OSError as e:
+            if _current is None:
+                raise
+            _last_error = f"{RULES_FILE}: {e}"
+            return _current
+        if _current is None or mtime != _seen_mtime:
+            _seen_mtime = mtime
+            try:
+                _current = load(RULES_FILE)
+                _last_error = None
+                print(f"Loaded quote rules from {RULES_FILE} ({len(_current.quote_rules)} quote rules)")
+            except (OSError, RulesError) as e:
+                if _current is None:
+                    raise
+                _last_error = str(e)
+                print(f"Quote rules not reloaded, keeping version {_current.version}: {e}")
+        return _current
+
+
+def version() -> int:
+    return current().version
+
+
+def status() -> dict:
+    return {**current().describe(), "error": _last_error}
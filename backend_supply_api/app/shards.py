@@ -0,0 +1,220 @@
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete
+from sqlmodel import Session, select
+from . import events
+from .concurrency import WriteQueue, writer
+from .database import create_engines, engine, init_lock, migrate, sqlite_file_name
+from .models import Disruption, Node, Product, Shipment
+
+# "region" partitions shipments into one SQLite file per region; "off" keeps
+# everything in the main database.
+SHARDING = os.getenv("SHARDING", "off").lower()
+
+# Longitude bands (west inclusive, east exclusive) by current location.
+# Anything outside them, including across the date line, is PACIFIC.
+REGIONS = (("AMERICAS", -140.0, -30.0), ("EUROPE", -30.0, 60.0))
+DEFAULT_REGION = "PACIFIC"
+
+# Reference data every shard needs locally (quotes, reroutes and rollups read it).
+_REFERENCE = (Node, Product, Disruption)
+
+
+def region_of(location: Optional[dict]) -> str:
+    lon = (location or {}).get("lon", 0)
+    for name, west, east in REGIONS:
+        if west <= lon < east:
+            return name
+    return DEFAULT_REGION
+
+
+class Shard:
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.engine, self.writer_engine = create_engines(path)
+        self.writer = WriteQueue(self.writer_engine)
+
+
+class ShardSet:
+    """Shipments split by region across files, each with its own writer thread.
+
+    Every shard carries the full schema plus a copy of the reference tables, so
+    a reroute, its idempotency record and its rollup deltas commit in one local
+    transaction. Reads scatter to all shards in parallel and merge by id.
+    """
+
+    def __init__(self, base_path: str):
+        root, ext = os.path.splitext(base_path)
+        names = [name for name, _, _ in REGIONS] + [DEFAULT_REGION]
+        self.shards: Dict[str, Shard] = {n: Shard(n, f"{root}.{n.lower()}{ext or '.db'}") for n in names}
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+        self.moved = 0
+
+    # --- Scatter / Gather ---
+
+    def scatter(self, fn: Callable[[Session], object]) -> Dict[str, object]:
+        """Runs `fn(session)` on every shard in parallel."""
+        def run(shard: Shard):
+            with Session(shard.engine) as session:
+                return fn(session)
+        futures = {name: self._pool.submit(run, shard) for name, shard in self.shards.items()}
+        return {name: f.result() for name, f in futures.items()}
+
+    def shipments(self, *criteria) -> List[Shipment]:
+        """Matching shipments from every shard, merged in id order."""
+        query = select(Shipment).where(*criteria).order_by(Shipment.id)
+        parts = self.scatter(lambda session: session.exec(query).all())
+        return self._dedupe(heapq.merge(*[[(s.id, name, s) for s in rows] for name, rows in parts.items()]))
+
+    def find(self, shipment_id: str) -> Tuple[Optional[Shard], Optional[Shipment]]:
+        parts = self.scatter(lambda session: session.get(Shipment, shipment_id))
+        found = [(name, s) for name, s in parts.items() if s is not None]
+        if not found:
+            return None, None
+        # Mid-move a row briefly exists twice; the copy in its own region wins.
+        name, shipment = next(((n, s) for n, s in found if n == region_of(s.current_location)), found[0])
+        return self.shards[name], shipment
+
+    def owners(self, shipment_ids: List[str]) -> Dict[str, Shard]:
+        """Shard holding each of `shipment_ids` (unknown ids are left out), in one round trip."""
+        query = select(Shipment).where(Shipment.id.in_(shipment_ids)).order_by(Shipment.id)
+        parts = self.scatter(lambda session: session.exec(query).all())
+        merged = heapq.merge(*[[(s.id, name, s) for s in rows] for name, rows in parts.items()])
+        owners: Dict[str, Shard] = {}
+        for sid, name, s in merged:
+            if sid not in owners or name == region_of(s.current_location):
+                owners[sid] = self.shards[name]
+        return owners
+
+    def _dedupe(self, merged: Iterable[tuple]) -> List[Shipment]:
+        out: List[Shipment] = []
+        for sid, name, s in merged:
+            if out and out[-1].id == sid:
+                if name == region_of(s.current_location):
+                    out[-1] = s
+                continue
+            out.append(s)
+        return out
+
+    # --- Rebalancing ---
+
+    def rebalance(self, shard: Shard, shipment_ids: Iterable[str]):
+        """Moves rows of `shard` whose current location now lies in another region.
+
+        Copy first, then delete the source row only if it has not changed since,
+        so readers may briefly see a shipment twice but never not at all.
+        """
+        ids = [sid for sid in shipment_ids if sid]
+        if not ids:
+            return
+        with Session(shard.engine) as session:
+            rows = [s for s in session.exec(select(Shipment).where(Shipment.id.in_(ids))).all()
+                    if region_of(s.current_location) != shard.name]
+        for s in rows:
+            row = s.model_dump()
+            self.shards[region_of(s.current_location)].writer.submit(lambda session, row=row: _upsert(session, row)).result()
+            shard.writer.submit(lambda session, row=row: _delete_if_unchanged(session, row)).result()
+            self.moved += 1
+
+    def rebalance_all(self):
+        """Finishes any move interrupted by a restart."""
+        for shard in self.shards.values():
+            with Session(shard.engine) as session:
+                ids = [s.id for s in session.exec(select(Shipment)).all() if region_of(s.current_location) != shard.name]
+            self.rebalance(shard, ids)
+
+    # --- Setup ---
+
+    def init(self, main_engine):
+        """Creates the shard files, copies reference data into each and moves any
+        shipments still in the main database (e.g. the seed) to their region."""
+        with Session(main_engine) as main:
+            reference = {model: [r.model_dump() for r in main.exec(select(model)).all()] for model in _REFERENCE}
+            legacy = [s.model_dump() for s in main.exec(select(Shipment)).all()]
+        by_region: Dict[str, List[dict]] = {name: [] for name in self.shards}
+        for row in legacy:
+            by_region[region_of(row["current_location"])].append(row)
+
+        from .rollups import rebuild
+        for name, shard in self.shards.items():
+            migrate(shard.engine)
+            with Session(shard.engine) as session:
+                for model, rows in reference.items():
+                    session.execute(delete(model))
+                    session.add_all(model(**r) for r in rows)
+                session.flush()
+                for row in by_region[name]:
+                    _upsert(session, row)
+                session.commit()
+                rebuild(session)
+                session.commit()
+        if legacy:
+            with Session(main_engine) as main:
+                main.execute(delete(Shipment))
+                for row in legacy:
+                    events.record(main, row["id"], "moved_out", row["version"])
+                rebuild(main)
+                main.commit()
+            print(f"Moved {len(legacy)} shipments into {len(self.shards)} region shards.")
+        self.rebalance_all()
+
+
+def _upsert(session: Session, row: dict):
+    existing = session.get(Shipment, row["id"])
+    with events.moving(session):
+        if existing is None:
+            session.add(Shipment(**row))
+        elif existing.version < row["version"]:
+            for key, value in row.items():
+                setattr(existing, key, value)
+            session.add(existing)
+
+
+def _delete_if_unchanged(session: Session, row: dict):
+    existing = session.get(Shipment, row["id"])
+    if existing is not None and existing.version == row["version"]:
+        with events.moving(session):
+            session.delete(existing)
+
+
+shard_set: Optional[ShardSet] = None
+
+
+def enable(main_engine=engine) -> Optional[ShardSet]:
+    global shard_set
+    if SHARDING == "region" and shard_set is None:
+        shard_set = ShardSet(sqlite_file_name)
+        with init_lock():
+            shard_set.init(main_engine)
+    return shard_set
+
+
+# --- Mode-agnostic helpers used by the routers ---
+
+def find_shipment(session: Session, shipment_id: str) -> Optional[Shipment]:
+    if shard_set is not None:
+        return shard_set.find(shipment_id)[1]
+    return session.get(Shipment, shipment_id)
+
+
+def query_shipments(session: Session, *criteria, ordered: bool = False) -> List[Shipment]:
+    """Shipments matching `criteria`. Sharded results always come back in id order."""
+    if shard_set is not None:
+        return shard_set.shipments(*criteria)
+    query = select(Shipment).where(*criteria)
+    if ordered:
+        query = query.order_by(Shipment.id)
+    return session.exec(query).all()
+
+
+def writer_for(shipment_id: str) -> Tuple[WriteQueue, object, Optional[Shard]]:
+    """(write queue, engine, shard) owning `shipment_id`; the shard is None when unsharded."""
+    if shard_set is None:
+        return writer, engine, None
+    shard, _ = shard_set.find(shipment_id)
+    if shard is None:
+        return writer, engine, None
+    return shard.writer, shard.engine, shard
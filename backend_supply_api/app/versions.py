@@ -0,0 +1,80 @@
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: single process only
+    fcntl = None
+
+# Versions of shared state that per-process caches depend on, kept in a small
+# memory-mapped file next to the database so every worker process sees every
+# bump:
+#   DATA       nodes, disruptions and products (quotes, planner, rollup groups)
+#   SHIPMENTS  bumped after every commit that touched a shipment
+# Per-shipment changes are additionally tracked by `Shipment.version`.
+DATA, SHIPMENTS = 0, 1
+_SLOTS = 8
+_SIZE = 8 * _SLOTS
+
+VERSION_FILE = os.getenv("VERSION_FILE", os.getenv("SQLITE_FILE", "database.db") + ".versions")
+
+
+class SharedCounters:
+    """Monotonic 64-bit counters in a file-backed mmap.
+
+    Reads are a single aligned load; increments take an exclusive flock so
+    concurrent processes never lose a bump.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < _SIZE:
+            os.ftruncate(self._fd, _SIZE)
+        self._map = mmap.mmap(self._fd, _SIZE)
+
+    def get(self, slot: int) -> int:
+        return struct.unpack_from("<q", self._map, slot * 8)[0]
+
+    def bump(self, slot: int) -> int:
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                value = self.get(slot) + 1
+                struct.pack_into("<q", self._map, slot * 8, value)
+                return value
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+_counters = None
+_open_lock = threading.Lock()
+
+
+def _shared() -> SharedCounters:
+    global _counters
+    if _counters is None:
+        with _open_lock:
+            if _counters is None:
+                _counters = SharedCounters(VERSION_FILE)
+    return _counters
+
+
+def data_version() -> int:
+    return _shared().get(DATA)
+
+
+def bump_data_version() -> int:
+    return _shared().bump(DATA)
+
+
+def shipments_version() -> int:
+    return _shared().get(SHIPMENTS)
+
+
+def bump_shipments_version() -> int:
+    return _shared().bump(SHIPMENTS)
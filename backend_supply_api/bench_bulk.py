@@ -0,0 +1,77 @@
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+# Run against a throwaway database, never the dev one.
+os.environ["SQLITE_FILE"] = os.path.join(tempfile.mkdtemp(), "bulk.db")
+
+import httpx
+from app.database import init_db
+from app.main import app
+
+SHIPMENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+BODY_CHUNK_BYTES = 64 * 1024
+ROW = {"status": "In-Transit", "transport_mode": "Sea", "priority": "Normal", "origin_id": "PORT-SHA",
+       "destination_id": "PORT-LAX", "contents": [{"sku": "ELEC-GAME-001", "quantity": 10}], "total_value_at_risk": 1000.0}
+
+
+async def body():
+    """Generated on the fly, like an upstream TMS feed; bad lines every 10k rows."""
+    buffer = []
+    size = 0
+    for i in range(SHIPMENTS):
+        if i % 10_000 == 9_999:
+            line = json.dumps({"id": f"BULK-{i:08d}", "status": "Stuck"})
+        else:
+            line = json.dumps({**ROW, "id": f"BULK-{i:08d}", "current_location": {"lat": 10.0, "lon": (i % 360) - 180.0}})
+        buffer.append(line)
+        size += len(line) + 1
+        if size >= BODY_CHUNK_BYTES:
+            yield ("\n".join(buffer) + "\n").encode()
+            buffer, size = [], 0
+    if buffer:
+        yield ("\n".join(buffer) + "\n").encode()
+
+
+async def main():
+    init_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"--- POST /import/shipments ({SHIPMENTS} rows) ---")
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        report = (await client.post("/import/shipments", content=body())).json()
+        elapsed = time.perf_counter() - started
+        growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+        print(f"   created {report['created']}, failed {report['failed']} (first: line {report['errors'][0]['line']})"
+              if report["errors"] else f"   created {report['created']}")
+        print(f"   {SHIPMENTS / elapsed:,.0f} rows/s, peak RSS grew {growth / 1024:.1f} MB")
+
+        print("\n--- GET /export/shipments.ndjson ---")
+        started = time.perf_counter()
+        rows = 0
+        async with client.stream("GET", "/export/shipments.ndjson") as response:
+            async for line in response.aiter_lines():
+                rows += bool(line)
+        elapsed = time.perf_counter() - started
+        print(f"   {rows} rows, {rows / elapsed:,.0f} rows/s")
+
+        print("\n--- Partial update ---")
+        before = (await client.get("/shipments/BULK-00000000")).json()
+        line = {key: before[key] for key in ("id", "status", "transport_mode", "priority", "origin_id",
+                                                "destination_id", "total_value_at_risk")}
+        report = (await client.post("/import/shipments", content=json.dumps({**line, "status": "Delayed"}))).json()
+        after = (await client.get("/shipments/BULK-00000000")).json()
+        kept = all(after[key] == before[key] for key in ("current_location", "contents"))
+        print(f"   updated {report['updated']}, status {after['status']}, location and contents "
+              f"{'kept' if kept else 'RESET'}")
+        if not kept or after["status"] != "Delayed":
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+import random
+import sys
+import time
+
+# Route planner cost on a large synthetic network: the one-off graph build,
+# then the per-quote planner lookup keyed on the node and disruption rows
+# (a sort of every node per call) against the lookup keyed on the data
+# version, and the latency of one quote with each. No database needed.
+#
+#   python bench_routing.py [NODES]
+
+from app import routing
+from app.models import Disruption, Node, Shipment
+from app.quotes import build_options_many
+
+NODES = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+REPEAT = 20
+
+
+def network(count: int):
+    rng = random.Random(7)
+    nodes = []
+    for i in range(count):
+        node_type = rng.choices(["Port", "Warehouse", "Store"], [20, 30, 50])[0]
+        nodes.append(Node(
+            id=f"{node_type.upper()}-{i:06d}", name=f"{node_type} {i}", type=node_type,
+            location={"lat": rng.uniform(-50, 65), "lon": rng.uniform(-180, 180)},
+            capacity_tier=1 if rng.random() < 0.01 else rng.choice([2, 3])))
+    disruptions = [Disruption(
+        id=f"DIS-{i}", type=rng.choice(["Weather", "Strike", "Blockade"]),
+        location={"lat": rng.uniform(-40, 60), "lon": rng.uniform(-180, 180)}, radius_km=rng.uniform(200, 800),
+        affected_modes=rng.sample(["Sea", "Air", "Truck", "Rail"], 2), description="synthetic") for i in range(20)]
+    return nodes, disruptions
+
+
+def timed(label, fn, repeat=REPEAT):
+    best = min(_once(fn) for _ in range(repeat))
+    print(f"   {label:<34} {best * 1000:9.2f} ms")
+    return best
+
+
+def _once(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    nodes, disruptions = network(NODES)
+    ports = [n.id for n in nodes if n.type == "Port"]
+    rng = random.Random(11)
+    shipment = Shipment(
+        id="BENCH-1", status="Stuck", transport_mode="Truck", priority="Critical",
+        origin_id=rng.choice(ports), destination_id=rng.choice(ports),
+        current_location={"lat": 40.0, "lon": -100.0}, contents=[], total_value_at_risk=250_000.0)
+    print(f"--- {NODES} nodes, {len(disruptions)} disruptions ---")
+
+    print("\nOnce per data version")
+    timed("graph + planner build", lambda: routing.get_planner(nodes, disruptions, data_version=1), repeat=1)
+    routing.get_planner(nodes, disruptions)  # Warm the row-keyed entry too
+
+    print("\nPlanner lookup, per quote")
+    lookup = timed("keyed on the rows", lambda: routing.get_planner(nodes, disruptions))
+    timed("keyed on the data version", lambda: routing.get_planner(nodes, disruptions, data_version=1))
+
+    print("\nOne quote, planner warm")
+    build_options_many([shipment], nodes, disruptions, data_version=1)  # Warm the search trees
+    quote = timed("keyed on the rows", lambda: build_options_many([shipment], nodes, disruptions), repeat=5)
+    timed("keyed on the data version", lambda: build_options_many([shipment], nodes, disruptions, data_version=1), repeat=5)
+    print(f"   the row-keyed lookup was {lookup / quote:.0%} of a quote; the rest is route search")
+
+    assert build_options_many([shipment], nodes, disruptions) == \
+        build_options_many([shipment], nodes, disruptions, data_version=1)
+    print("\n✅ Both lookups quote the same options")
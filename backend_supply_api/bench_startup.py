@@ -0,0 +1,143 @@
+import argparse
+import http.client
+import json
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# Measures what a new instance pays before it can answer: an import-time
+# profile of app.main, then time to first response and time to /ready for a
+# real uvicorn process on a new and on an existing database. --no-bytecode also
+# boots without any cached .pyc files, as a container that cannot write them does.
+#
+#   python bench_startup.py [--runs 5] [--no-bytecode] [--max-first-response-ms 1500]
+
+FIRST_REQUESTS = ("/shipments/SH-1001", "/actions/quotes/SH-1001")
+POLL_S = 0.005
+TIMEOUT_S = 60.0
+
+
+def import_profile(top: int):
+    """Cumulative import time per top-level package, and the slowest app modules."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], capture_output=True, text=True,
+                            env=dict(os.environ, SQLITE_FILE=os.path.join(tempfile.mkdtemp(), "import.db")))
+    packages = defaultdict(int)
+    app_modules = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| *(\S+)", line)
+        if not match:
+            continue
+        self_us, cumulative_us, module = int(match[1]), int(match[2]), match[3]
+        packages[module.split(".")[0]] += self_us
+        total += self_us
+        if module.startswith("app."):
+            app_modules[module] = (self_us, cumulative_us)
+    print(f"--- import app.main: {total / 1000:.0f}ms ---")
+    for name, us in sorted(packages.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"   {name:<24} {us / 1000:7.1f}ms")
+    print("   slowest app modules (self / cumulative):")
+    for name, (self_us, cumulative_us) in sorted(app_modules.items(), key=lambda kv: -kv[1][0])[:top]:
+        print(f"   {name:<24} {self_us / 1000:7.1f}ms {cumulative_us / 1000:7.1f}ms")
+    return total / 1000
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(port: int, path: str):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=TIMEOUT_S)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def wait_for(port: int, path: str, started: float, ok=lambda status: status == 200) -> float:
+    while time.perf_counter() - started < TIMEOUT_S:
+        try:
+            status, _ = get(port, path)
+            if ok(status):
+                return (time.perf_counter() - started) * 1000
+        except OSError:
+            pass
+        time.sleep(POLL_S)
+    raise TimeoutError(f"{path} did not answer within {TIMEOUT_S}s")
+
+
+def boot(db_path: str, first_path: str, bytecode: bool = True) -> dict:
+    """Starts uvicorn; ms until `first_path` answers 200 and until /ready does."""
+    port = free_port()
+    env = dict(os.environ, SQLITE_FILE=db_path, PYTHONDONTWRITEBYTECODE="1")
+    if not bytecode:
+        env["PYTHONPYCACHEPREFIX"] = tempfile.mkdtemp() # Empty, so every module compiles from source
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        first = wait_for(port, first_path, started)
+        # Servers without a readiness endpoint count as ready once they answer.
+        ready = wait_for(port, "/ready", started, ok=lambda status: status in (200, 404))
+        return {"first_ms": first, "ready_ms": ready}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--no-bytecode", action="store_true", help="Also boot without cached bytecode")
+    parser.add_argument("--max-first-response-ms", type=float, default=None,
+                        help="Exit 1 if the median time to first response on an existing database exceeds this")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = {"import_ms": import_profile(args.top)}
+    workdir = tempfile.mkdtemp()
+    existing = os.path.join(workdir, "existing.db")
+    boot(existing, "/")  # Creates and seeds it once
+    cases = [(path, label, fresh, True) for path in FIRST_REQUESTS
+             for label, fresh in (("new database", True), ("existing database", False))]
+    if args.no_bytecode:
+        cases.append((FIRST_REQUESTS[0], "existing database, no bytecode", False, False))
+    for first_path, label, fresh, bytecode in cases:
+        runs = []
+        for i in range(args.runs):
+            db_path = os.path.join(workdir, f"new-{len(results)}-{i}.db") if fresh else existing
+            runs.append(boot(db_path, first_path, bytecode))
+        first = statistics.median(r["first_ms"] for r in runs)
+        ready = statistics.median(r["ready_ms"] for r in runs)
+        results[f"{first_path} ({label})"] = {"first_ms": round(first), "ready_ms": round(ready)}
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n--- time to first response, median of {args.runs} ---")
+    for key, value in results.items():
+        if key != "import_ms":
+            print(f"   {key:<48} first {value['first_ms']:5d}ms   ready {value['ready_ms']:5d}ms")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    guarded = results[f"{FIRST_REQUESTS[0]} (existing database)"]["first_ms"]
+    if args.max_first_response_ms is not None and guarded > args.max_first_response_ms:
+        print(f"❌ First response took {guarded}ms, over the {args.max_first_response_ms:.0f}ms budget")
+        sys.exit(1)
+    print("\n🎉 STARTUP BENCHMARK DONE")
+
+
+if __name__ == "__main__":
+    main()
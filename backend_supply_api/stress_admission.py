@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+# Overloads a real uvicorn process with reads and ordinary actions while a
+# probe keeps asking for quotes and replaying a reroute on a Critical shipment,
+# once with admission control off and once with it on. With it on, the probe's
+# tail latency under overload should stay close to its idle latency, and reads
+# should be shed with 503 + Retry-After rather than queue.
+#
+#   python stress_admission.py [--seconds 10] [--readers 32]
+
+CRITICAL_ID = "SH-1001" # Priority Critical in the seed data
+SYNTHETIC_SHIPMENTS = 3000 # Make /shipments an expensive read
+PROBE_INTERVAL_S = 0.05
+# Critical p95 under overload may reach this (or 4x the idle p95). Admission
+# cannot preempt a handler already computing on the event loop, so a critical
+# request can still land behind one read; on one core the server also shares the
+# CPU with the load generator.
+FLAT_P95_MS = 250
+BURST_READS = 40
+READ_PATHS = ("/shipments", "/rollups", "/shipments?status=In-Transit", "/network/nodes")
+
+
+def check(condition, message):
+    if condition:
+        print(f"✅ {message}")
+    else:
+        print(f"❌ {message}")
+        sys.exit(1)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def synthetic_rows(n):
+    rng = random.Random(1)
+    for i in range(n):
+        yield json.dumps({
+            "id": f"AD-{i:05d}", "status": rng.choice(["In-Transit", "Delayed", "Stuck"]),
+            "transport_mode": rng.choice(["Sea", "Air", "Truck"]), "priority": "Normal",
+            "origin_id": "PORT-SHA", "destination_id": "PORT-LAX",
+            "current_location": {"lat": rng.uniform(-40, 60), "lon": rng.uniform(-180, 180)},
+            "contents": [{"sku": "ELEC-GAME-001", "qty": 10}], "total_value_at_risk": rng.uniform(1e3, 5e5),
+        })
+
+
+def seed_database(path: str):
+    """Seed data plus the synthetic shipments, built once and copied per run."""
+    port = free_port()
+    server = start(path, port, "off")
+    try:
+        body = "\n".join(synthetic_rows(SYNTHETIC_SHIPMENTS))
+        response = httpx.post(f"http://127.0.0.1:{port}/import/shipments", content=body,
+                              headers={"Content-Type": "application/x-ndjson"}, timeout=120)
+        response.raise_for_status()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def start(db_path: str, port: int, admission: str) -> subprocess.Popen:
+    env = dict(os.environ, SQLITE_FILE=db_path, ADMISSION=admission)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/ready").status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("Backend did not become ready")
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def probe(client, stop: asyncio.Event, latencies: list, statuses: list):
+    """Critical actions: a quote, then a replayed reroute, in turn."""
+    reroute = {"shipment_id": CRITICAL_ID, "new_route_id": "OPT-SEA-REROUTE", "idempotency_key": "stress-admission"}
+    i = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        if i % 2:
+            response = await client.post("/actions/reroute", json=reroute)
+        else:
+            response = await client.get(f"/actions/quotes/{CRITICAL_ID}")
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses.append(response.status_code)
+        i += 1
+        await asyncio.sleep(PROBE_INTERVAL_S)
+
+
+async def flood(client, stop: asyncio.Event, paths, counts: dict):
+    rng = random.Random(len(counts))
+    while not stop.is_set():
+        try:
+            response = await client.get(rng.choice(paths))
+        except httpx.TimeoutException:
+            counts["timeout"] = counts.get("timeout", 0) + 1
+            continue
+        key = str(response.status_code)
+        counts[key] = counts.get(key, 0) + 1
+        if response.status_code == 503:
+            counts["retry_after"] = counts.get("retry_after", 0) + ("Retry-After" in response.headers)
+            await asyncio.sleep(min(1.0, float(response.headers.get("Retry-After", 1))) * rng.random())
+
+
+async def flood_all(url: str, seconds: float, readers: int, actors: int) -> dict:
+    limits = httpx.Limits(max_connections=readers + actors)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        reads, actions = {}, {}
+        stop = asyncio.Event()
+        normal_quotes = [f"/actions/quotes/AD-{i:05d}" for i in range(0, SYNTHETIC_SHIPMENTS, 97)]
+        tasks = [asyncio.create_task(flood(client, stop, READ_PATHS, reads)) for _ in range(readers)]
+        tasks += [asyncio.create_task(flood(client, stop, normal_quotes, actions)) for _ in range(actors)]
+        await asyncio.sleep(seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+    return {"reads": reads, "actions": actions}
+
+
+async def measure(url: str, args) -> dict:
+    """The probe, idle and then next to a flood from another process, so that
+    it never waits on the load generator's own event loop."""
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        idle, idle_statuses = [], []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, stop, idle, idle_statuses))
+        await asyncio.sleep(3.0)
+        stop.set()
+        await task
+        # Reads alone, however many at once, are not overload: they queue.
+        burst = await asyncio.gather(*(client.get("/network/nodes") for _ in range(BURST_READS)))
+
+        flooder = await asyncio.create_subprocess_exec(
+            sys.executable, __file__, "--flood", url, "--seconds", str(args.seconds + 1.0),
+            "--readers", str(args.readers), "--actors", str(args.actors), stdout=asyncio.subprocess.PIPE)
+        await asyncio.sleep(1.0) # Let the backlog build
+        loaded, loaded_statuses = [], []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, stop, loaded, loaded_statuses))
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        await task
+        output, _ = await flooder.communicate()
+        admission = (await client.get("/admission")).json()
+    return {"idle": idle, "loaded": loaded, "probe_statuses": idle_statuses + loaded_statuses,
+            "burst": [r.status_code for r in burst], "admission": admission, **json.loads(output)}
+
+
+def run(template: str, admission: str, args) -> dict:
+    workdir = os.path.join(tempfile.mkdtemp(), "run")
+    shutil.copytree(os.path.dirname(template), workdir) # With any -wal file and snapshots
+    db_path = os.path.join(workdir, os.path.basename(template))
+    port = free_port()
+    server = start(db_path, port, admission)
+    try:
+        return asyncio.run(measure(f"http://127.0.0.1:{port}", args))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def report(name: str, result: dict) -> dict:
+    idle, loaded = result["idle"], result["loaded"]
+    summary = {}
+    print(f"--- admission {name} ---")
+    for phase, samples in (("idle", idle), ("overload", loaded)):
+        for p in (50, 95, 99):
+            summary[f"{phase}_p{p}"] = percentile(samples, p / 100)
+        print(f"   critical probe {phase:<9} p50 {summary[phase + '_p50']:7.1f}ms  p95 {summary[phase + '_p95']:7.1f}ms"
+              f"  p99 {summary[phase + '_p99']:7.1f}ms  ({len(samples)} requests)")
+    print(f"   reads:   {result['reads']}")
+    print(f"   actions: {result['actions']}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=10.0, help="Overload duration per run")
+    parser.add_argument("--readers", type=int, default=32, help="Concurrent clients looping over reads")
+    parser.add_argument("--actors", type=int, default=4, help="Concurrent clients asking for ordinary quotes")
+    parser.add_argument("--flood", metavar="URL", help=argparse.SUPPRESS) # Child process generating the load
+    args = parser.parse_args()
+    if args.flood:
+        print(json.dumps(asyncio.run(flood_all(args.flood, args.seconds, args.readers, args.actors))))
+        return
+
+    template = os.path.join(tempfile.mkdtemp(), "template.db")
+    seed_database(template)
+    off = run(template, "off", args)
+    off_summary = report("off", off)
+    on = run(template, "on", args)
+    on_summary = report("on", on)
+    stats = on["admission"]
+    print(f"   /admission: {json.dumps(stats['classes'])}")
+
+    print()
+    check(all(status == 200 for status in on["probe_statuses"]), "No critical request was shed")
+    check(on["burst"] == [200] * BURST_READS, f"{BURST_READS} concurrent reads with no other traffic: none shed "
+                                              f"({on['burst'].count(503)} x 503)")
+    check(on_summary["overload_p99"] < off_summary["overload_p99"] / 4,
+          f"Critical p99 under overload: {on_summary['overload_p99']:.0f}ms with admission, "
+          f"{off_summary['overload_p99']:.0f}ms without")
+    flat = max(4 * on_summary["idle_p95"], FLAT_P95_MS)
+    check(on_summary["overload_p95"] <= flat,
+          f"Critical p95 stays near idle: {on_summary['overload_p95']:.0f}ms vs {on_summary['idle_p95']:.0f}ms (budget {flat:.0f}ms)")
+    shed = on["reads"].get("503", 0)
+    check(shed > 0 and on["reads"].get("retry_after") == shed, f"{shed} reads shed, each with Retry-After")
+    check(stats["classes"]["reads"]["shed"] == shed and stats["admitted_by_priority"]["critical"] >= len(on["probe_statuses"]),
+          "/admission reports the shed reads and the admitted critical actions")
+    check("503" not in off["reads"], "Without admission nothing is shed (it all queues instead)")
+    print("\n🎉 ADMISSION CHECKS PASSED")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# Checks the shipment event log against a throwaway database: history reads,
+# snapshot + replay recovery, pruning, restore, and the bytes written per
+# mutation under a burst of writes.
+#
+#   python stress_events.py [MUTATIONS]
+
+if "--sharded" not in sys.argv:
+    os.environ["SQLITE_FILE"] = os.path.join(tempfile.mkdtemp(), "events.db")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, func, select
+from app import events, shards
+from app.concurrency import compare_and_swap, writer
+from app.database import engine
+from app.main import app
+from app.models import Shipment, ShipmentEvent
+
+MUTATIONS = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 20000
+SYNTHETIC_SHIPMENTS = 5000
+
+
+def check(condition, message):
+    if condition:
+        print(f"✅ {message}")
+    else:
+        print(f"❌ {message}")
+        sys.exit(1)
+
+
+def table_rows(db_engine):
+    with db_engine.connect() as conn:
+        return {r.id: dict(r._mapping) for r in conn.execute(select(Shipment.__table__))}
+
+
+def kinds(client, shipment_id):
+    return [e["kind"] for e in client.get(f"/shipments/{shipment_id}/history").json()["events"]]
+
+
+def paged(client, shipment_id):
+    """The whole history, one event per page."""
+    found, params = [], {"limit": 1}
+    while True:
+        page = client.get(f"/shipments/{shipment_id}/history", params=params).json()["events"]
+        if not page:
+            return found
+        found += page
+        params = {"limit": 1, "after_seq": page[-1]["seq"], **({"shard": page[-1]["shard"]} if page[-1].get("shard") else {})}
+
+
+def add_synthetic(n):
+    rng = random.Random(1)
+
+    def job(session):
+        session.add_all(Shipment(
+            id=f"EV-{i:05d}", status="In-Transit", transport_mode=rng.choice(["Sea", "Air", "Truck"]),
+            priority="Normal", origin_id="PORT-SHA", destination_id="PORT-LAX",
+            current_location={"lat": rng.uniform(-40, 60), "lon": rng.uniform(-180, 180)},
+            contents=[{"sku": "ELEC-GAME-001", "qty": 10}], total_value_at_risk=rng.uniform(1e3, 1e6),
+        ) for i in range(n))
+    writer.submit(job).result()
+
+
+def mutate(n, ids):
+    """Half plain ORM edits, half compare_and_swap, as the API does them."""
+    rng = random.Random(2)
+
+    def job(session, sid, i):
+        shipment = session.get(Shipment, sid)
+        if i % 2:
+            compare_and_swap(session, shipment, status=rng.choice(["Stuck", "Delayed", "In-Transit"]))
+        else:
+            shipment.current_location = {"lat": rng.uniform(-40, 60), "lon": rng.uniform(-180, 180)}
+            session.add(shipment)
+
+    started = time.perf_counter()
+    for start in range(0, n, 1000):
+        futures = [writer.submit(lambda s, sid=rng.choice(ids), i=i: job(s, sid, i)) for i in range(start, min(n, start + 1000))]
+        for f in futures:
+            f.result()
+        events.compactor.run_once()
+    return time.perf_counter() - started
+
+
+def replay_everything(db_engine):
+    state = {}
+    with db_engine.connect() as conn:
+        for e in conn.execute(select(ShipmentEvent.__table__).order_by(ShipmentEvent.seq)):
+            events.apply(state, e.kind, e.shipment_id, e.version, e.changes)
+    return state
+
+
+def sharded():
+    """Child process with SHARDING=region: a shipment moving regions keeps one history."""
+    with TestClient(app) as client:
+        # SH-1001 is in the Pacific; moving it to Rotterdam moves it to the Europe shard.
+        row = client.get("/shipments/SH-1001").json()
+        row["current_location"] = {"lat": 51.9, "lon": 4.1}
+        client.post("/import/shipments", content=json.dumps(row), headers={"Content-Type": "application/x-ndjson"})
+        found, _ = shards.shard_set.find("SH-1001")
+        check(found.name == "EUROPE", "SH-1001 moved to the Europe shard")
+        history = client.get("/shipments/SH-1001/history").json()["events"]
+        check([e["kind"] for e in history] == ["created", "moved_in", "moved_out", "updated", "moved_in", "moved_out"]
+              and history[3]["changes"] == {"current_location": {"lat": 51.9, "lon": 4.1}},
+              f"History merged across shards: {[e['kind'] for e in history]}")
+        check(paged(client, "SH-1001") == history, "Paging one event at a time on seq and shard returns every event")
+        for shard in shards.shard_set.shards.values():
+            rows, _ = events.recover(shard.engine)
+            check(rows == table_rows(shard.engine), f"{shard.name}: log replays to the table ({len(rows)} shipments)")
+
+
+def main():
+    with TestClient(app) as client:
+        print("--- history ---")
+        client.post("/actions/reroute", json={"shipment_id": "SH-1001", "new_route_id": "OPT-SEA-REROUTE"})
+        clone = client.post("/actions/reroute", json={"shipment_id": "SH-1002", "new_route_id": "OPT-REPLACEMENT-AIR"}).json()
+        check(kinds(client, "SH-1001") == ["created", "updated"], "Detour: created, then updated")
+        events_1002 = client.get("/shipments/SH-1002/history").json()["events"]
+        check([(e["kind"], e["version"], e["changes"]) for e in events_1002][1:] == [("updated", 2, {"status": "Mitigated"})],
+              "Replacement: the original's update carries only the changed field")
+        check(kinds(client, clone["new_shipment_id"]) == ["created"], "...and the clone was created")
+        check(client.get("/shipments/SH-1001/history", params={"after_version": 1}).json()["events"][0]["version"] == 2,
+              "after_version filters the history")
+        check(paged(client, "SH-1002") == events_1002, "Paging one event at a time on seq returns every event")
+        check(client.get("/shipments/NOPE/history").status_code == 404, "Unknown shipment: 404")
+        with engine.connect() as conn:
+            plan = " ".join(r[-1] for r in conn.exec_driver_sql(
+                "EXPLAIN QUERY PLAN SELECT * FROM shipmentevent WHERE shipment_id = 'SH-1001' ORDER BY seq"))
+        check("USING INDEX" in plan and "TEMP B-TREE" not in plan, f"History reads the per-shipment index: {plan}")
+
+        print(f"\n--- {MUTATIONS} mutations over {SYNTHETIC_SHIPMENTS} shipments ---")
+        add_synthetic(SYNTHETIC_SHIPMENTS)
+        ids = [f"EV-{i:05d}" for i in range(SYNTHETIC_SHIPMENTS)]
+        before = events.compactor.snapshots
+        elapsed = mutate(MUTATIONS, ids)
+        with engine.connect() as conn:
+            log_bytes, n_events = conn.execute(select(func.sum(func.length(ShipmentEvent.changes) + 40), func.count())
+                                               .where(ShipmentEvent.shipment_id.like("EV-%"), ShipmentEvent.kind == "updated")).one()
+        row_bytes = sum(len(json.dumps(r)) for r in table_rows(engine).values()) / len(ids)
+        snapshots = events.compactor.snapshots - before
+        check(n_events == MUTATIONS, f"One event per mutation ({MUTATIONS / elapsed:,.0f} mutations/s)")
+        print(f"   {log_bytes / n_events:.0f} bytes per event vs {row_bytes:.0f} per full row")
+        budget = MUTATIONS / max(events.SNAPSHOT_MIN_EVENTS, events.SNAPSHOT_TAIL_RATIO * len(ids)) + 1
+        check(0 < snapshots <= budget, f"{snapshots} snapshots (at most {budget:.1f}): "
+              f"{snapshots * len(ids) / MUTATIONS:.2f} snapshot rows per mutation")
+
+        print("\n--- recovery ---")
+        rows, stats = events.recover(engine)
+        check(rows == table_rows(engine), f"Snapshot + tail replays to the table: {stats}")
+        started = time.perf_counter()
+        full = replay_everything(engine)
+        check(full == rows, f"Replaying the whole log agrees ({time.perf_counter() - started:.2f}s "
+                            f"vs {stats['snapshot_s'] + stats['replay_s']:.2f}s with the snapshot)")
+
+        newest = events.snapshots(engine)[-1][1]
+        with open(newest, "r+b") as f:
+            f.write(b"garbage")
+        rows, stats = events.recover(engine)
+        check(rows == table_rows(engine), f"Unreadable newest snapshot: falls back to the previous one ({stats['replayed']} events)")
+        events.write_snapshot(engine)
+
+        print("\n--- pruning ---")
+        retention, events.RETENTION_S = events.RETENTION_S, 0
+        pruned = events.prune(engine, writer)
+        events.RETENTION_S = retention
+        floor = events.snapshots(engine)[0][0]
+        with engine.connect() as conn:
+            oldest = conn.execute(select(func.min(ShipmentEvent.seq))).scalar()
+        check(pruned and oldest == floor + 1, f"Pruned {pruned} events covered by the oldest snapshot (from seq {oldest})")
+        rows, stats = events.recover(engine)
+        check(rows == table_rows(engine), "...and recovery still replays to the table")
+        check(kinds(client, "SH-1001") == [], "History before the oldest snapshot is gone")
+
+        print("\n--- restore ---")
+        expected = table_rows(engine)
+        writer.submit(lambda session: session.connection().execute(delete(Shipment.__table__))).result()
+        check(not table_rows(engine), "Shipment table wiped (outside the log)")
+        events.restore(engine, events.recover(engine)[0])
+        check(table_rows(engine) == expected, f"Restored {len(expected)} shipments from snapshot + log")
+        summary = client.get("/rollups").json()
+        check(sum(s["shipments"] for s in summary.values()) == len(expected), "...and rollups rebuilt")
+
+    print("\n--- region shards ---")
+    env = dict(os.environ, SHARDING="region", SQLITE_FILE=os.path.join(tempfile.mkdtemp(), "events.db"))
+    result = subprocess.run([sys.executable, __file__, "--sharded"], env=env, capture_output=True, text=True)
+    print("\n".join(line for line in result.stdout.splitlines() if line.startswith(("✅", "❌"))))
+    check(result.returncode == 0, "Sharded run passed" + ("" if result.returncode == 0 else f"\n{result.stderr[-2000:]}"))
+    print("\n🎉 EVENT LOG CHECKS PASSED")
+
+
+if __name__ == "__main__":
+    if "--sharded" in sys.argv:
+        sharded()
+    else:
+        main()
@@ -0,0 +1,167 @@
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# Run against a throwaway database and a copy of the rules file, never the real ones.
+_tmp = tempfile.mkdtemp()
+os.environ["SQLITE_FILE"] = os.path.join(_tmp, "rules.db")
+os.environ["QUOTE_RULES_FILE"] = os.path.join(_tmp, "quote_rules.json")
+shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "quote_rules.json"),
+            os.environ["QUOTE_RULES_FILE"])
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+from app import rules
+from app.database import engine
+from app.main import app
+from app.models import Disruption, Node, Shipment
+from app.quotes import build_options_many, build_quote_options
+
+BATCH_SHIPMENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+
+def check(condition, message):
+    if condition:
+        print(f"✅ {message}")
+    else:
+        print(f"❌ {message}")
+        sys.exit(1)
+
+
+def edit_rules(change):
+    with open(rules.RULES_FILE) as f:
+        document = json.load(f)
+    change(document)
+    with open(rules.RULES_FILE, "w") as f:
+        json.dump(document, f)
+    # Make sure the mtime moves even on coarse-grained filesystems.
+    stat = os.stat(rules.RULES_FILE)
+    os.utime(rules.RULES_FILE, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def costs(client, shipment_id):
+    return {o["id"]: o["cost_usd"] for o in client.get(f"/actions/quotes/{shipment_id}").json()["options"]}
+
+
+def batch_quotes():
+    """Thousands of synthetic stuck shipments over the seeded network, quoted in one call."""
+    with Session(engine) as session:
+        nodes = session.exec(select(Node)).all()
+        disruptions = session.exec(select(Disruption)).all()
+    rng = random.Random(7)
+    ends = [n.id for n in nodes if n.type in ("Port", "Warehouse")]
+    shipments = [Shipment(
+        id=f"BATCH-{i}", status="Stuck", transport_mode=rng.choice(["Sea", "Air", "Truck", "Rail"]),
+        priority=rng.choice(["Normal", "Critical"]), origin_id=rng.choice(ends), destination_id=rng.choice(ends),
+        current_location={"lat": rng.uniform(-40, 60), "lon": rng.uniform(-180, 180)},
+        contents=[], total_value_at_risk=rng.uniform(1e3, 3e6),
+    ) for i in range(BATCH_SHIPMENTS)]
+
+    started = time.perf_counter()
+    batch = build_options_many(shipments, nodes, disruptions)
+    batch_s = time.perf_counter() - started
+    sample = shipments[:200]
+    started = time.perf_counter()
+    single = [build_quote_options(s, nodes, disruptions) for s in sample]
+    single_s = (time.perf_counter() - started) * len(shipments) / len(sample)
+    return batch, single, batch_s, single_s
+
+
+if __name__ == "__main__":
+    rules.RELOAD_CHECK_S = 0 # Check the file on every call
+    with TestClient(app) as client:
+        print("--- defaults ---")
+        status = client.get("/actions/rules").json()
+        check([r["name"] for r in status["quote_rules"]] == ["inland", "strike", "ocean_clear", "ocean_disrupted"]
+              and status["error"] is None, f"Rules loaded: {[r['name'] for r in status['quote_rules']]}")
+        before = costs(client, "SH-1001")
+        check(set(before) == {"OPT-SEA-REROUTE", "OPT-REPLACEMENT-AIR"}, f"SH-1001 (Sea, in a typhoon): {sorted(before)}")
+
+        print("\n--- hot reload ---")
+        edit_rules(lambda d: d["formulas"].update(cost_usd="path_cost + value * value_rate + 1000"))
+        after = costs(client, "SH-1001")
+        check(all(after[k] == before[k] + 1000 for k in before), "Handling fee applied without a restart")
+        check(client.get("/actions/rules").json()["version"] > status["version"], "...and the version moved on")
+
+        def critical_air_only(d):
+            d["quote_rules"].insert(0, {"name": "critical_high_value", "when": {
+                "mode": ["Sea"], "priority": ["Critical"], "value": {"min": 1_000_000}},
+                "options": [{"source": "origin", "modes": ["Air"], "id": "OPT-REPLACEMENT-AIR",
+                             "label": "Emergency Replacement (Critical)",
+                             "formulas": {"cost_usd": "path_cost * 1.5", "transit_time_hours": "hours + 2"}}]})
+        edit_rules(critical_air_only)
+        quote = client.get("/actions/quotes/SH-1001").json()["options"]
+        check([o["id"] for o in quote] == ["OPT-REPLACEMENT-AIR"] and quote[0]["type"] == "Emergency Replacement (Critical)",
+              "New rule for Critical cargo over $1M takes precedence")
+        check(all(k.startswith("OPT-ALT-ORIGIN-") for k in costs(client, "SH-1002")),
+              "SH-1002 (Normal, in a strike) still gets the strike rule")
+
+        print("\n--- bad edits keep the rules in force ---")
+        good = client.get("/actions/rules").json()["version"]
+        for label, change in [
+            ("Disallowed name", lambda d: d["formulas"].update(cost_usd="__import__('os').getpid()")),
+            ("Unknown source", lambda d: d["quote_rules"][1]["options"][0].update(source="teleport")),
+            ("Bad regex", lambda d: d["reroute_rules"]["rules"].append({"match": "("})),
+            ("Unknown template field", lambda d: d["quote_rules"][1]["options"][0].update(id="OPT-{nope}")),
+            ("Bad description template", lambda d: d["quote_rules"][1]["options"][1].update(description="From {0}")),
+            ("Wrong argument count", lambda d: d["formulas"].update(cost_usd="max(path_cost)")),
+            ("Tower of powers", lambda d: d["formulas"].update(cost_usd="9 ** 9 ** 9")),
+            ("Variable exponent", lambda d: d["formulas"].update(cost_usd="value ** value")),
+            ("Contradictory when", lambda d: d["quote_rules"][2]["when"].update(disrupted=False)),
+            ("Malformed value band", lambda d: d["quote_rules"][0]["when"].update(value={"min": "lots"})),
+        ]:
+            with open(rules.RULES_FILE) as f:
+                saved = f.read()
+            edit_rules(change)
+            status = client.get("/actions/rules").json()
+            check(status["version"] == good and status["error"], f"{label}: rejected ({status['error']})")
+            check([o["id"] for o in client.get("/actions/quotes/SH-1001").json()["options"]] == ["OPT-REPLACEMENT-AIR"],
+                  "...and quotes are unchanged")
+            with open(rules.RULES_FILE, "w") as f:
+                f.write(saved)
+        with open(rules.RULES_FILE, "w") as f:
+            f.write("{not json")
+        check(client.get("/actions/rules").json()["version"] == good, "Invalid JSON: rejected")
+        with open(rules.RULES_FILE, "w") as f:
+            f.write(saved)
+
+        print("\n--- formulas are checked on the data, per row ---")
+        edit_rules(lambda d: d["quote_rules"][0]["options"][0].update(
+            formulas={"cost_usd": "path_cost / (km - 1)", "transit_time_hours": "hours"}))
+        status = client.get("/actions/rules").json()
+        check(status["error"] is None, "A formula that divides by (km - 1) loads: km is never 1 in real data")
+        check(costs(client, "SH-1001")["OPT-REPLACEMENT-AIR"] > 0, "...and prices real routes")
+        edit_rules(lambda d: d["quote_rules"][0]["options"][0]["formulas"].update(cost_usd="value ** 4 * 1e300"))
+        check(client.get("/actions/rules").json()["error"] is None, "value ** 4 * 1e300 loads too")
+        response = client.get("/actions/quotes/SH-1001")
+        check(response.status_code == 200 and response.json()["options"] == [],
+              "...but overflows on real values: the option is dropped, not a 500")
+        check(client.get("/actions/rules").json()["quote_rules"][0]["failed_rows"] > 0, "...and counted in failed_rows")
+        with open(rules.RULES_FILE, "w") as f:
+            f.write(saved)
+
+        print("\n--- reroute rules ---")
+        edit_rules(lambda d: d["reroute_rules"]["rules"].insert(0, {"match": "^OPT-DRONE-(?P<origin>.+)$", "mode": "Air",
+                                                                    "replacement": True}))
+        result = client.post("/actions/reroute", json={"shipment_id": "SH-CHI-ATL", "new_route_id": "OPT-DRONE-DC-MIA-01"}).json()
+        clone = client.get(f"/shipments/{result['new_shipment_id']}").json()
+        check(clone["transport_mode"] == "Air" and clone["origin_id"] == "DC-MIA-01",
+              f"New route id OPT-DRONE-* clones an Air shipment from its origin ({clone['id']})")
+        before = client.get("/shipments/SH-1002").json()
+        response = client.post("/actions/reroute", json={"shipment_id": "SH-1002", "new_route_id": "OPT-ALT-ORIGIN-AIR-NOWHERE"})
+        check(response.status_code == 422 and client.get("/shipments/SH-1002").json() == before,
+              f"Origin parsed from the route id must be a known node: {response.status_code}, shipment untouched")
+
+    print(f"\n--- batch of {BATCH_SHIPMENTS} shipments ---")
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "quote_rules.json"), rules.RULES_FILE)
+    edit_rules(lambda d: None)
+    batch, single, batch_s, single_s = batch_quotes()
+    check(batch[:len(single)] == single, "Batch options match one-at-a-time quoting")
+    options = sum(len(o) for o in batch)
+    print(f"   {options} options in {batch_s:.2f}s ({BATCH_SHIPMENTS / batch_s:,.0f} shipments/s); "
+          f"one at a time ~{single_s:.2f}s")
+    print("\n🎉 QUOTE RULES BEHAVE")
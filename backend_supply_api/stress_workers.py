@@ -0,0 +1,112 @@
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+# Starts real uvicorn worker processes on a throwaway database and checks that
+# they stay coherent: a write through one worker is visible through all of them,
+# and concurrent writers across processes still produce exactly one clone.
+WORKERS = int(sys.argv[1]) if len(sys.argv) > 1 else max(2, os.cpu_count() or 2)
+CLIENTS = 4
+DURATION_S = 5.0
+
+
+def check(condition, message):
+    if condition:
+        print(f"✅ {message}")
+    else:
+        print(f"❌ {message}")
+        sys.exit(1)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, storage_mode: str):
+    port = free_port()
+    env = dict(os.environ, SQLITE_FILE=os.path.join(tempfile.mkdtemp(), "workers.db"), STORAGE_MODE=storage_mode)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if httpx.get(url + "/shipments/SH-1001").status_code == 200:
+                return proc, url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("Server did not start")
+
+
+def _client(url, deadline, counts):
+    # Custom weights are never cached, so every request really plans routes.
+    async def run():
+        done = 0
+        async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+            while time.time() < deadline:
+                await client.post("/actions/quotes/batch", json={"weights": {"co2_price_per_kg": 0.1}})
+                done += 1
+        counts.put(done)
+    asyncio.run(run())
+
+
+def throughput(url) -> float:
+    counts = multiprocessing.Queue()
+    deadline = time.time() + DURATION_S
+    procs = [multiprocessing.Process(target=_client, args=(url, deadline, counts)) for _ in range(CLIENTS)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    return sum(counts.get() for _ in procs) / DURATION_S
+
+
+async def coherence(url):
+    async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+        # Warm every worker's caches (columnar store, quotes) before the write.
+        await asyncio.gather(*[client.get("/shipments/SH-1001") for _ in range(WORKERS * 10)])
+        await asyncio.gather(*[client.get("/actions/quotes/SH-1002") for _ in range(WORKERS * 10)])
+
+        payload = {"shipment_id": "SH-1001", "new_route_id": "OPT-REPLACEMENT-AIR"}
+        codes = [r.status_code for r in await asyncio.gather(*[client.post("/actions/reroute", json=payload) for _ in range(20)])]
+        check(codes.count(200) == 1 and codes.count(409) == 19, f"Cross-worker race: one winner, 19 conflicts ({codes.count(200)}/{codes.count(409)})")
+
+        reads = await asyncio.gather(*[client.get("/shipments/SH-1001") for _ in range(WORKERS * 10)])
+        check(all(r.json()["status"] == "Mitigated" for r in reads), "Every worker serves the new status")
+        clones = (await client.get("/shipments", params={"status": "In-Transit"})).json()
+        check(sum(s["id"].startswith("SH-1001-") for s in clones) == 1, "Every worker sees exactly one clone")
+
+        await client.post("/actions/reroute", json={"shipment_id": "SH-1002", "new_route_id": "OPT-SEA-REROUTE"})
+        quotes = await asyncio.gather(*[client.get("/actions/quotes/SH-1002") for _ in range(WORKERS * 10)])
+        fresh = (await client.post("/actions/quotes/batch", json={"shipment_ids": ["SH-1002"], "weights": {}})).json()[0]
+        check(all(q.json()["options"] == fresh["options"] for q in quotes), "No worker serves a quote cached before the write")
+
+
+if __name__ == "__main__":
+    results = {}
+    for workers in sorted({1, WORKERS}):
+        proc, url = start_server(workers, "memory")
+        try:
+            print(f"--- {workers} worker(s) ---")
+            if workers > 1:
+                asyncio.run(coherence(url))
+            results[workers] = throughput(url)
+            print(f"   {results[workers]:.0f} batch quotes/s")
+        finally:
+            proc.terminate()
+            proc.wait()
+    if WORKERS > 1:
+        print(f"\nScaling {WORKERS} workers vs 1: {results[WORKERS] / results[1]:.1f}x on {os.cpu_count()} core(s)")
+    print("\n🎉 WORKERS STAY COHERENT")
@@ -1,7 +1,35 @@
-from pydantic import BaseModel
-from typing import List
-import json
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from typing import List, Optional, get_args, get_origin
+from typing_extensions import TypedDict
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from array import array
 from pathlib import Path
+import argparse
+import hashlib
+import heapq
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Validates the seed data, or an export from GET /export/{table}.ndjson:
+#   - field shapes (pydantic models below)
+#   - allowed values (statuses, modes, node types, coordinate ranges)
+#   - references: shipment origin/destination -> nodes, content SKUs -> products
+#   - duplicate ids
+#   - total_value_at_risk against quantity x unit_value (a warning: the seed
+#     values include more than the goods themselves)
+# Each table is read from <table>.ndjson if present, else <table>.json. Files
+# are streamed in blocks that a process pool validates in parallel; nodes and
+# products are indexed first so shipment blocks can check references locally.
+# Duplicate ids are found from key hashes spilled to temp files, so memory does
+# not grow with the file either.
+#
+#   python verify_backend_data.py [DATA_DIR] [--workers N] [--report report.json] [--strict]
+#   python verify_backend_data.py --generate 10000000 /tmp/big   # synthetic data to time it
 
 class Location(BaseModel):
     lat: float
@@ -43,32 +71,481 @@ class Disruption(BaseModel):
     radius_km: float
     affected_modes: List[str]
 
-DATA_DIR = Path("backend_supply_api/data")
+DATA_DIR = Path(__file__).parent / "backend_supply_api" / "data"
 
-def verify():
-    print("Verifying Nodes...")
-    with open(DATA_DIR / "nodes.json") as f:
-        [Node(**item) for item in json.load(f)]
-    print("Nodes OK.")
+# (table, model, key field), in dependency order: references are indexed before
+# the tables that point at them.
+TABLES = [("nodes", Node, "id"), ("products", Product, "sku"), ("disruptions", Disruption, "id"), ("shipments", Shipment, "id")]
+MODELS = {table: model for table, model, _ in TABLES}
+KEYS = {table: key for table, _, key in TABLES}
 
-    print("Verifying Shipments...")
-    with open(DATA_DIR / "shipments.json") as f:
-        [Shipment(**item) for item in json.load(f)]
-    print("Shipments OK.")
+STATUSES = {"In-Transit", "Stuck", "Delayed", "Mitigated"}
+MODES = {"Sea", "Air", "Truck", "Rail"}
+PRIORITIES = {"Normal", "Critical"}
+NODE_TYPES = {"Port", "Warehouse", "Store"}
+VALUE_TOLERANCE = 0.01 # Relative; below $1 differences are ignored
 
-    print("Verifying Disruptions...")
-    with open(DATA_DIR / "disruptions.json") as f:
-        [Disruption(**item) for item in json.load(f)]
-    print("Disruptions OK.")
+BLOCK_BYTES = 4 * 1024 * 1024 # NDJSON is cut into blocks of about this size
+BLOCK_ROWS = 20_000 # JSON arrays are cut into blocks of this many rows
+MAX_ERRORS_PER_CODE = 100 # Listed in the report; all are counted
+KEY_BUCKETS = 64 # Key hashes are split by value into this many temp files, checked one at a time
+KEY_BUFFER = 8192 # (hash, position) pairs held per bucket before they are written
 
-    print("Verifying Products...")
-    with open(DATA_DIR / "products.json") as f:
-        [Product(**item) for item in json.load(f)]
-    print("Products OK.")
+# --- Block validation (runs in the worker processes) ---
 
-if __name__ == "__main__":
+_nodes: frozenset = frozenset()
+_products: dict = {}
+_adapters: dict = {}
+
+
+def _init_worker(nodes, products):
+    global _nodes, _products
+    _nodes, _products = nodes, products
+
+
+def _as_typeddict(tp):
+    # Same fields, but validated into plain dicts: about 3x faster than building
+    # model instances, which is most of the cost per row.
+    if isinstance(tp, type) and issubclass(tp, BaseModel):
+        fields = {name: _as_typeddict(f.annotation) for name, f in tp.model_fields.items()}
+        return TypedDict(f"{tp.__name__}Row", fields)
+    if get_origin(tp) in (list, List):
+        return List[_as_typeddict(get_args(tp)[0])]
+    return tp
+
+
+def _adapter(table: str, many: bool = True) -> TypeAdapter:
+    if (table, many) not in _adapters:
+        row = _as_typeddict(MODELS[table])
+        _adapters[table, many] = TypeAdapter(List[row] if many else row)
+    return _adapters[table, many]
+
+
+def _issue(issues, position, key, code, message, severity="error", field=None):
+    issues.append({"position": position, "id": key, "field": field, "code": code, "message": message, "severity": severity})
+
+
+def _parse(table: str, positions: List[int], lines: List[bytes]):
+    """(position, model) for every line that parses, plus issues for those that don't.
+
+    The whole block is validated as one JSON array in pydantic's core first;
+    only a block containing a bad line is re-parsed line by line.
+    """
     try:
-        verify()
-        print("ALL DATA VALID.")
-    except Exception as e:
-        print(f"VALIDATION ERROR: {e}")
+        return list(zip(positions, _adapter(table).validate_json(b"[" + b",".join(lines) + b"]"))), []
+    except ValidationError:
+        pass
+    adapter = _adapter(table, many=False)
+    rows, issues = [], []
+    for position, line in zip(positions, lines):
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            _issue(issues, position, None, "invalid_json", str(e))
+            continue
+        key = data.get(KEYS[table]) if isinstance(data, dict) else None
+        try:
+            rows.append((position, adapter.validate_python(data)))
+        except ValidationError as e:
+            for err in e.errors():
+                _issue(issues, position, key, "schema", err["msg"], field=".".join(map(str, err["loc"])) or None)
+    return rows, issues
+
+
+def _check_location(issues, position, key, field, loc: dict):
+    if not (-90 <= loc["lat"] <= 90 and -180 <= loc["lon"] <= 180):
+        _issue(issues, position, key, "out_of_range", f"({loc['lat']}, {loc['lon']}) is not a coordinate", field=field)
+
+
+def _check_rows(table: str, rows) -> list:
+    issues = []
+    for position, r in rows:
+        if table == "nodes":
+            if r["type"] not in NODE_TYPES:
+                _issue(issues, position, r["id"], "unknown_value", f"Node type {r['type']!r}", field="type")
+            _check_location(issues, position, r["id"], "location", r["location"])
+        elif table == "products":
+            if r["unit_value"] < 0:
+                _issue(issues, position, r["sku"], "out_of_range", "Negative unit_value", field="unit_value")
+        elif table == "disruptions":
+            unknown = [m for m in r["affected_modes"] if m not in MODES]
+            if unknown:
+                _issue(issues, position, r["id"], "unknown_value", f"Modes {unknown}", field="affected_modes")
+            if r["radius_km"] <= 0:
+                _issue(issues, position, r["id"], "out_of_range", "radius_km must be positive", field="radius_km")
+            _check_location(issues, position, r["id"], "location", r["location"])
+        else:
+            _check_shipment(issues, position, r)
+    return issues
+
+
+def _check_shipment(issues, position, s: dict):
+    sid = s["id"]
+    if s["status"] not in STATUSES:
+        _issue(issues, position, sid, "unknown_value", f"Status {s['status']!r}", field="status")
+    if s["transport_mode"] not in MODES:
+        _issue(issues, position, sid, "unknown_value", f"Mode {s['transport_mode']!r}", field="transport_mode")
+    if s["priority"] not in PRIORITIES:
+        _issue(issues, position, sid, "unknown_value", f"Priority {s['priority']!r}", field="priority")
+    _check_location(issues, position, sid, "current_location", s["current_location"])
+    for field in ("origin_id", "destination_id"):
+        if s[field] not in _nodes:
+            _issue(issues, position, sid, "missing_node", f"Node {s[field]!r} does not exist", field=field)
+    expected = 0.0
+    for i, item in enumerate(s["contents"]):
+        unit_value = _products.get(item["sku"])
+        if unit_value is None:
+            _issue(issues, position, sid, "missing_product", f"SKU {item['sku']!r} does not exist", field=f"contents.{i}.sku")
+            expected = None
+        elif item["quantity"] <= 0:
+            _issue(issues, position, sid, "out_of_range", "Quantity must be positive", field=f"contents.{i}.quantity")
+        elif expected is not None:
+            expected += item["quantity"] * unit_value
+    total = s["total_value_at_risk"]
+    if expected is not None and abs(total - expected) > max(1.0, VALUE_TOLERANCE * expected):
+        _issue(issues, position, sid, "value_mismatch",
+               f"total_value_at_risk {total:,.2f} != quantity x unit_value {expected:,.2f}",
+               severity="warning", field="total_value_at_risk")
+
+
+def _key_hash(key: str) -> int:
+    # Stable across processes (unlike hash()); 64 bits keep collisions negligible at 10M rows.
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+def check_block(table: str, positions: List[int], lines: List[bytes]) -> dict:
+    """Validates one block. Returns counts, issues and the key hashes for duplicate detection."""
+    rows, issues = _parse(table, positions, lines)
+    issues += _check_rows(table, rows)
+    key = KEYS[table]
+    result = {"rows": len(lines), "issues": issues,
+              "hashes": array("Q", (_key_hash(r[key]) for _, r in rows)).tobytes(),
+              "positions": array("q", (p for p, _ in rows)).tobytes()}
+    if table == "nodes":
+        result["keys"] = [r["id"] for _, r in rows]
+    elif table == "products":
+        result["keys"] = [(r["sku"], r["unit_value"]) for _, r in rows]
+    return result
+
+
+# --- Streaming readers (main process) ---
+
+def _ndjson_blocks(path: Path):
+    """(line numbers, lines) blocks cut at newlines; reads BLOCK_BYTES at a time."""
+    line_no = 0
+    rest = b""
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(BLOCK_BYTES)
+            if not data:
+                break
+            data = rest + data
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                rest = data
+                continue
+            block, rest = data[:cut], data[cut:]
+            yield _numbered(block.split(b"\n")[:-1], line_no)
+            line_no += block.count(b"\n")
+    if rest:
+        yield _numbered([rest], line_no)
+
+
+def _numbered(lines: List[bytes], line_no: int):
+    positions, kept = [], []
+    for i, line in enumerate(lines, line_no + 1):
+        if line.strip():
+            positions.append(i)
+            kept.append(line)
+    return positions, kept
+
+
+def _json_array_blocks(path: Path):
+    """(indexes, rows) blocks from a top-level JSON array, decoded one object at a time."""
+    decoder = json.JSONDecoder()
+    buffer, index, pos = "", 0, 0
+    positions, lines = [], []
+    started = done = False
+    with open(path) as f:
+        while not done:
+            data = f.read(BLOCK_BYTES)
+            buffer = buffer[pos:] + data
+            pos = 0
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos == len(buffer):
+                    break
+                if not started:
+                    if buffer[pos] != "[":
+                        raise ValueError(f"{path.name} is not a JSON array")
+                    started, pos = True, pos + 1
+                    continue
+                if buffer[pos] == "]":
+                    done = True
+                    break
+                try:
+                    obj, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if not data:
+                        raise
+                    break # Object continues in the next read
+                positions.append(index)
+                lines.append(json.dumps(obj).encode())
+                index += 1
+                pos = end
+                if len(lines) >= BLOCK_ROWS:
+                    yield positions, lines
+                    positions, lines = [], []
+            if not data:
+                break
+    if lines:
+        yield positions, lines
+
+
+def _keys_at(table: str, path: Path, positions: set) -> dict:
+    """Position -> key for a few rows, read back from the file."""
+    blocks = _ndjson_blocks(path) if path.suffix == ".ndjson" else _json_array_blocks(path)
+    keys = {}
+    for block_positions, lines in blocks:
+        for position, line in zip(block_positions, lines):
+            if position in positions:
+                try:
+                    keys[position] = json.loads(line).get(KEYS[table])
+                except (ValueError, AttributeError):
+                    pass
+    return keys
+
+
+def _source(data_dir: Path, table: str) -> Optional[Path]:
+    for name in (f"{table}.ndjson", f"{table}.json"):
+        if (data_dir / name).exists():
+            return data_dir / name
+    return None
+
+
+# --- Driver ---
+
+class Report:
+    def __init__(self):
+        self.files = {}
+        self.counts: Counter = Counter()
+        self.issues = []
+        self._listed: Counter = Counter()
+
+    def add(self, table: str, path: Path, issues: list):
+        stats = self.files[table]
+        location = "line" if path.suffix == ".ndjson" else "index"
+        for issue in issues:
+            stats[issue["severity"] + "s"] += 1
+            self.counts[issue["code"]] += 1
+            if self._listed[issue["code"]] < MAX_ERRORS_PER_CODE:
+                self._listed[issue["code"]] += 1
+                position = issue.pop("position")
+                self.issues.append({"file": path.name, location: position, **issue})
+
+    def add_count(self, table: str, code: str, n: int, severity: str = "error"):
+        """Issues beyond the listed ones: counted, not listed."""
+        self.files[table][severity + "s"] += n
+        self.counts[code] += n
+
+    @property
+    def valid(self) -> bool:
+        return not any(stats["errors"] for stats in self.files.values())
+
+    def as_dict(self, elapsed: float) -> dict:
+        return {"valid": self.valid, "elapsed_s": round(elapsed, 2), "files": self.files,
+                "counts": dict(self.counts.most_common()), "issues": self.issues}
+
+
+class KeyIndex:
+    """Finds repeated keys in bounded memory. Key hashes and their positions are
+    split by hash value into temp files, so equal keys share a file, and each
+    file is then checked on its own."""
+
+    def __init__(self):
+        self._dir = tempfile.TemporaryDirectory(prefix="verify-keys-")
+        self._paths = [os.path.join(self._dir.name, f"{i}.bin") for i in range(KEY_BUCKETS)]
+        self._buffers = [array("Q") for _ in range(KEY_BUCKETS)]
+
+    def _flush(self, bucket: int):
+        with open(self._paths[bucket], "ab") as f:
+            self._buffers[bucket].tofile(f)
+        del self._buffers[bucket][:]
+
+    def add(self, hashes, positions):
+        for h, position in zip(hashes, positions):
+            bucket = h % KEY_BUCKETS
+            buffer = self._buffers[bucket]
+            buffer.append(h)
+            buffer.append(position)
+            if len(buffer) >= 2 * KEY_BUFFER:
+                self._flush(bucket)
+
+    def duplicates(self):
+        """(position, position of the first use) for every repeat, a bucket at a time."""
+        for bucket, path in enumerate(self._paths):
+            self._flush(bucket)
+            pairs = array("Q")
+            with open(path, "rb") as f:
+                pairs.frombytes(f.read())
+            first = {}
+            for i in range(0, len(pairs), 2):
+                h, position = pairs[i], pairs[i + 1]
+                if h in first:
+                    yield position, first[h]
+                else:
+                    first[h] = position # Blocks arrive in file order
+
+    def close(self):
+        self._dir.cleanup()
+
+
+def _report_duplicates(report: Report, table: str, path: Path, index: KeyIndex):
+    # Only the earliest repeats are listed, with their keys read back from the
+    # file; a 64-bit hash collision between different keys is dropped then.
+    listed, total = [], 0
+    for position, first in index.duplicates():
+        total += 1
+        if len(listed) < MAX_ERRORS_PER_CODE:
+            heapq.heappush(listed, (-position, first))
+        elif position < -listed[0][0]:
+            heapq.heapreplace(listed, (-position, first))
+    if not total:
+        return
+    listed = sorted((-p, first) for p, first in listed)
+    keys = _keys_at(table, path, {p for pair in listed for p in pair})
+    location = "line" if path.suffix == ".ndjson" else "index"
+    issues = []
+    for position, first in listed:
+        if keys.get(position) != keys.get(first):
+            total -= 1
+            continue
+        issues.append({"position": position, "id": keys.get(position), "field": KEYS[table], "code": "duplicate_key",
+                       "message": f"{KEYS[table]} {keys.get(position)!r} already used at {location} {first}",
+                       "severity": "error"})
+    report.add(table, path, issues)
+    report.add_count(table, "duplicate_key", total - len(issues))
+
+
+def _run_table(pool, workers: int, report: Report, table: str, path: Path, refs: dict):
+    blocks = _ndjson_blocks(path) if path.suffix == ".ndjson" else _json_array_blocks(path)
+    report.files[table] = {"path": str(path), "rows": 0, "errors": 0, "warnings": 0}
+    index = KeyIndex()
+
+    def collect(result):
+        report.files[table]["rows"] += result["rows"]
+        index.add(array("Q", result["hashes"]), array("q", result["positions"]))
+        report.add(table, path, result["issues"])
+        if table in ("nodes", "products"):
+            refs[table].extend(result["keys"])
+
+    try:
+        if pool is None:
+            for positions, lines in blocks:
+                collect(check_block(table, positions, lines))
+        else:
+            # At most two blocks per worker in flight, so memory does not grow with the file.
+            pending = deque()
+            for positions, lines in blocks:
+                pending.append(pool.submit(check_block, table, positions, lines))
+                if len(pending) >= 2 * workers:
+                    collect(pending.popleft().result())
+            while pending:
+                collect(pending.popleft().result())
+        _report_duplicates(report, table, path, index)
+    finally:
+        index.close()
+
+
+def verify(data_dir: Path = DATA_DIR, workers: Optional[int] = None) -> Report:
+    workers = workers or os.cpu_count() or 1
+    report = Report()
+    refs = {"nodes": [], "products": []}
+    sources = {table: _source(data_dir, table) for table, _, _ in TABLES}
+    for table, path in sources.items():
+        if path is None:
+            report.files[table] = {"path": None, "rows": 0, "errors": 1, "warnings": 0}
+            report.counts["missing_file"] += 1
+            report.issues.append({"file": f"{table}.json", "code": "missing_file", "severity": "error",
+                                  "message": f"Neither {table}.ndjson nor {table}.json in {data_dir}"})
+
+    # Referenced tables first; the rest run in workers that hold their indexes.
+    for phase in (("nodes", "products"), ("disruptions", "shipments")):
+        nodes, products = frozenset(refs["nodes"]), dict(refs["products"])
+        _init_worker(nodes, products)
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(nodes, products)) if workers > 1 else None
+        try:
+            for table in phase:
+                if sources[table] is not None:
+                    print(f"Verifying {sources[table].name}...")
+                    _run_table(pool, workers, report, table, sources[table], refs)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    return report
+
+
+def generate(n: int, out_dir: Path):
+    """Writes seed reference tables plus `n` synthetic, valid shipments as NDJSON."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for table in ("nodes", "products", "disruptions"):
+        (out_dir / f"{table}.json").write_text((DATA_DIR / f"{table}.json").read_text())
+    nodes = [n["id"] for n in json.loads((DATA_DIR / "nodes.json").read_text())]
+    products = json.loads((DATA_DIR / "products.json").read_text())
+    rng = random.Random(7)
+    with open(out_dir / "shipments.ndjson", "w") as f:
+        for i in range(n):
+            p = rng.choice(products)
+            qty = rng.randint(1, 1000)
+            f.write(json.dumps({
+                "id": f"GEN-{i:09d}", "status": rng.choice(["In-Transit", "Stuck", "Delayed"]),
+                "transport_mode": rng.choice(sorted(MODES)), "priority": rng.choice(sorted(PRIORITIES)),
+                "current_location": {"lat": round(rng.uniform(-60, 70), 4), "lon": round(rng.uniform(-180, 180), 4)},
+                "origin_id": rng.choice(nodes), "destination_id": rng.choice(nodes),
+                "contents": [{"sku": p["sku"], "quantity": qty}], "total_value_at_risk": qty * p["unit_value"],
+            }) + "\n")
+    print(f"Wrote {n} shipments to {out_dir / 'shipments.ndjson'}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Validate supply data files.")
+    parser.add_argument("data_dir", nargs="?", type=Path, default=DATA_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: one per CPU)")
+    parser.add_argument("--report", type=Path, help="Write the full JSON report here")
+    parser.add_argument("--strict", action="store_true", help="Fail on warnings too")
+    parser.add_argument("--generate", type=int, metavar="N", help="Write N synthetic shipments to DATA_DIR and exit")
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        generate(args.generate, args.data_dir)
+        return 0
+
+    started = time.perf_counter()
+    report = verify(args.data_dir, args.workers)
+    elapsed = time.perf_counter() - started
+    result = report.as_dict(elapsed)
+    if args.report:
+        args.report.write_text(json.dumps(result, indent=2))
+
+    for table, stats in result["files"].items():
+        print(f"  {table:<12} {stats['rows']:>12,} rows  {stats['errors']:>8,} errors  {stats['warnings']:>8,} warnings")
+    for issue in result["issues"][:20]:
+        where = f":{issue['line']}" if "line" in issue else f"[{issue['index']}]" if "index" in issue else ""
+        field = f"{issue['field']}: " if issue.get("field") else ""
+        print(f"  {issue['severity'].upper()} {issue['file']}{where} {issue.get('id') or ''} [{issue['code']}] {field}{issue['message']}")
+    if len(result["issues"]) > 20:
+        print(f"  ... {sum(result['counts'].values()) - 20} more" + (f" (see {args.report})" if args.report else " (use --report)"))
+    rows = sum(stats["rows"] for stats in result["files"].values())
+    print(f"Checked {rows:,} rows in {elapsed:.1f}s.")
+
+    warnings = any(stats["warnings"] for stats in result["files"].values())
+    if not report.valid or (args.strict and warnings):
+        print("VALIDATION ERROR: see issues above.")
+        return 1
+    print("ALL DATA VALID." + (" (with warnings)" if warnings else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())